@@ -1,4 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+import json
 import time
 import sys
 import os
@@ -7,57 +9,79 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
 from parser.parser import execute_sql
-from backend.schemas import QueryRequest, QueryResult
+from backend.schemas import QueryRequest, QueryResult, StreamQueryRequest
 from backend.utils.auth import get_current_active_user
+from backend.utils.cursors import Cursor, cursor_store
 from backend.database import User, Table, File, get_db
 from sqlalchemy.orm import Session
 
 router = APIRouter(prefix="/sql", tags=["queries"])
 
+STREAM_BATCH_SIZE = 500  # rows serialized per chunk of a streamed response
+
+def register_created_table(query: str, message: str, user: User, db: Session):
+    query_lower = query.lower().strip()
+    if query_lower.startswith("create table") and "successfully" in message.lower():
+        table_name = query_lower.split("create table")[1].split("(")[0].strip()
+        
+        existing_table = db.query(Table).filter(
+            Table.user_id == user.id,
+            Table.name == table_name
+        ).first()
+        
+        if not existing_table:
+            db_table = Table(
+                name=table_name,
+                user_id=user.id
+            )
+            db.add(db_table)
+            db.commit()
+
 @router.post("/", response_model=QueryResult)
 def execute_query(
     query_request: QueryRequest,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    query_lower = query_request.query.lower().strip()
-    
+    cursor = None
     try:
         start = time.time()
-        result, message = execute_sql(query_request.query)
+        result, message = execute_sql(query_request.query, stream=True)
+        if result is not None:
+            cursor = Cursor(current_user.id, result['columns'], result['records'])
+            cursor.skip(query_request.offset)
+            records = cursor.fetch(query_request.limit)
+            if not query_request.cursor:
+                # count the rest here, no cursor is left open to read it later
+                total = cursor.count()
+                cursor.close()
         end = time.time()
         
-        if query_lower.startswith("create table") and "successfully" in message.lower():
-            table_name = query_lower.split("create table")[1].split("(")[0].strip()
-            
-            existing_table = db.query(Table).filter(
-                Table.user_id == current_user.id,
-                Table.name == table_name
-            ).first()
-            
-            if not existing_table:
-                db_table = Table(
-                    name=table_name,
-                    user_id=current_user.id
-                )
-                db.add(db_table)
-                db.commit()
+        register_created_table(query_request.query, message, current_user, db)
         
     except Exception as e:
         end = time.time()
         result, message = None, str(e)
+        if cursor:
+            cursor.close()
+            cursor = None
     
     result_pagination = {
         'columns': [],
         'records': []
     }
+    cursor_id = None
     
-    if result is not None:
+    if cursor is not None:
         result_pagination = {
-            'columns': result['columns'],
-            'records': result['records'][query_request.offset:query_request.offset + query_request.limit]
+            'columns': cursor.columns,
+            'records': records
         }
-        total = len(result['records'])
+        if query_request.cursor:
+            # rows read so far, the exact count once the cursor is exhausted
+            total = cursor.fetched
+            if not cursor.done:
+                cursor_id = cursor_store.open(cursor)
     else:
         total = 0
     
@@ -65,7 +89,85 @@ def execute_query(
         'data': result_pagination,
         'total': total,
         'message': message,
-        'execution_time': end - start
+        'execution_time': end - start,
+        'cursor_id': cursor_id,
+        'has_more': cursor_id is not None
+    }
+
+@router.post("/stream")
+def stream_query(
+    query_request: StreamQueryRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Run a query and stream its rows as NDJSON: a {"columns": [...]} line,
+    one JSON array per row, then a {"total", "message", "execution_time"}
+    trailer. Rows are serialized as they are read, never held all at once."""
+    start = time.time()
+    try:
+        result, message = execute_sql(query_request.query, stream=True)
+        register_created_table(query_request.query, message, current_user, db)
+    except Exception as e:
+        result, message = None, str(e)
+    
+    def lines():
+        total = 0
+        error = None
+        yield json.dumps({'columns': result['columns'] if result is not None else []}) + "\n"
+        if result is not None:
+            batch = []
+            try:
+                for record in result['records']:
+                    batch.append(json.dumps(record))
+                    total += 1
+                    if len(batch) == STREAM_BATCH_SIZE:
+                        yield "\n".join(batch) + "\n"
+                        batch = []
+            except Exception as e:
+                error = str(e)
+            if batch:
+                yield "\n".join(batch) + "\n"
+        yield json.dumps({
+            'total': total,
+            'message': error or message,
+            'execution_time': time.time() - start
+        }) + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@router.get("/cursor/{cursor_id}", response_model=QueryResult)
+def fetch_cursor(
+    cursor_id: str,
+    n: int = Query(50, gt=0),
+    current_user: User = Depends(get_current_active_user)
+):
+    cursor = cursor_store.get(cursor_id, current_user.id)
+    if cursor is None:
+        raise HTTPException(status_code=404, detail=f"Cursor {cursor_id} not found or expired")
+    
+    try:
+        start = time.time()
+        records = cursor.fetch(n)
+        end = time.time()
+        message = "Selection successful"
+    except Exception as e:
+        end = time.time()
+        records, message = [], str(e)
+        cursor.close()
+    
+    if cursor.done:
+        cursor_store.close(cursor_id)
+    
+    return {
+        'data': {
+            'columns': cursor.columns,
+            'records': records
+        },
+        'total': cursor.fetched,
+        'message': message,
+        'execution_time': end - start,
+        'cursor_id': None if cursor.done else cursor_id,
+        'has_more': not cursor.done
     }
 
 @router.get("/tables")
@@ -65,12 +65,18 @@ class QueryRequest(BaseModel):
     query: str
     offset: int = 0
     limit: int = 50
+    cursor: bool = False
+
+class StreamQueryRequest(BaseModel):
+    query: str
 
 class QueryResult(BaseModel):
     data: Dict[str, Any]
     total: int
     message: str
     execution_time: float
+    cursor_id: Optional[str] = None
+    has_more: bool = False
 
 # Dashboard schemas
 class Dashboard(BaseModel):
@@ -0,0 +1,99 @@
+import time
+import threading
+import uuid
+from itertools import islice
+
+CURSOR_IDLE_TIMEOUT = 300  # seconds a cursor survives without being fetched from
+MAX_OPEN_CURSORS = 64  # cursors kept at once, the least recently used is closed past it
+
+
+class Cursor:
+    """Open result of a SELECT, its records are read from the tables as they are
+    fetched. Rows written after the cursor opened may or may not show up, but
+    the rows returned still satisfy the WHERE unless it is a spatial predicate."""
+    def __init__(self, user_id: int, columns: list, records):
+        self.user_id = user_id
+        self.columns = columns
+        self.records = iter(records)
+        self.pending = []
+        self.fetched = 0
+        self.done = False
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    def skip(self, n: int) -> int:
+        """Discard the next n records, returns how many there were"""
+        with self.lock:
+            skipped = sum(1 for _ in islice(self.records, n))
+            self.fetched += skipped
+            return skipped
+
+    def fetch(self, n: int) -> list:
+        """Next n records, reading one more ahead to know whether any is left"""
+        with self.lock:
+            rows = self.pending + list(islice(self.records, n + 1 - len(self.pending)))
+            self.pending = rows[n:]
+            rows = rows[:n]
+            self.done = not self.pending
+            self.fetched += len(rows)
+            self.last_used = time.monotonic()
+            return rows
+
+    def count(self) -> int:
+        """Records fetched so far plus the ones left, which are read and discarded"""
+        with self.lock:
+            left = len(self.pending) + sum(1 for _ in self.records)
+            self.pending = []
+            self.done = True
+            return self.fetched + left
+
+    def close(self):
+        close = getattr(self.records, "close", None)
+        if close:
+            close()
+        self.done = True
+
+
+class CursorStore:
+    """Cursors left open by the SQL endpoints keyed by id. A cursor is dropped
+    once exhausted, after idle_timeout seconds without being fetched from, or
+    when max_open newer cursors are opened without it being fetched from."""
+    def __init__(self, idle_timeout: float = CURSOR_IDLE_TIMEOUT, max_open: int = MAX_OPEN_CURSORS):
+        self.idle_timeout = idle_timeout
+        self.max_open = max_open
+        self.cursors: dict[str, Cursor] = {}
+        self.lock = threading.Lock()
+
+    def expire(self):
+        now = time.monotonic()
+        with self.lock:
+            expired = [cursor_id for cursor_id, cursor in self.cursors.items() if now - cursor.last_used > self.idle_timeout]
+            for cursor_id in expired:
+                self.cursors.pop(cursor_id).close()
+
+    def open(self, cursor: Cursor) -> str:
+        self.expire()
+        cursor_id = uuid.uuid4().hex
+        with self.lock:
+            while len(self.cursors) >= self.max_open:
+                oldest = min(self.cursors, key=lambda key: self.cursors[key].last_used)
+                self.cursors.pop(oldest).close()
+            self.cursors[cursor_id] = cursor
+        return cursor_id
+
+    def get(self, cursor_id: str, user_id: int) -> Cursor | None:
+        self.expire()
+        with self.lock:
+            cursor = self.cursors.get(cursor_id)
+        if cursor is None or cursor.user_id != user_id:
+            return None
+        return cursor
+
+    def close(self, cursor_id: str):
+        with self.lock:
+            cursor = self.cursors.pop(cursor_id, None)
+        if cursor:
+            cursor.close()
+
+
+cursor_store = CursorStore()
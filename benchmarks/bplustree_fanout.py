@@ -0,0 +1,65 @@
+"""Height and reads per lookup of a B+Tree for several node page sizes.
+
+A page size of 40 bytes gives nodes of 3 INT keys, the fan-out the tree had
+before it was derived from the page size.
+
+    python benchmarks/bplustree_fanout.py [sizes...]
+"""
+import os, sys, shutil, random, logging, time
+root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if root_path not in sys.path:
+    sys.path.append(root_path)
+
+from engine.model import TableSchema, Column, DataType, IndexType
+from engine.buffer import BufferManager
+from engine import stats, utils
+from indexes.bplustree import BPlusTree
+
+PAGE_SIZES = [40, 4096, 8192]
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+LOOKUPS = 200
+
+
+def tree_height(tree : BPlusTree) -> int:
+    pos = tree.indexFile.getHeader()
+    height = 1
+    node = tree.indexFile.readBucket(pos)
+    while not node.isLeaf:
+        node = tree.indexFile.readBucket(node.pointers[0])
+        height += 1
+    return height
+
+
+def run(size : int, page_size : int) -> None:
+    table_name = f"bench_btree_{size}_{page_size}"
+    column = Column("id", DataType.INT, is_primary=True, index_type=IndexType.BTREE)
+    schema = TableSchema(table_name, [column])
+    table_dir = os.path.dirname(utils.get_record_file_path(table_name))
+    try:
+        tree = BPlusTree(schema, column, page_size)
+        start = time.perf_counter()
+        tree.bulk_load([(key, key) for key in range(size)])
+        build = time.perf_counter() - start
+
+        keys = random.sample(range(size), min(LOOKUPS, size))
+        stats.reset_counters()
+        start = time.perf_counter()
+        for key in keys:
+            tree.search(key)
+        lookup = (time.perf_counter() - start) / len(keys)
+        reads = stats.memory_accesses["reads"] / len(keys)
+
+        print(f"{size:>10} {page_size:>6} {tree.BLOCK_FACTOR:>6} {tree_height(tree):>7} {reads:>10.1f} {build:>9.2f}s {lookup * 1e6:>10.1f}us")
+    finally:
+        BufferManager().discard(table_dir)
+        shutil.rmtree(table_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    logging.disable(logging.CRITICAL)
+    random.seed(0)
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    print(f"{'keys':>10} {'page':>6} {'fanout':>6} {'height':>7} {'reads/op':>10} {'build':>10} {'lookup':>12}")
+    for size in sizes:
+        for page_size in PAGE_SIZES:
+            run(size, page_size)
@@ -0,0 +1,63 @@
+"""Fetching the rows an unclustered index lookup returns: one RecordFile.read
+per position against HeapScan.fetch, which sorts the positions and decodes
+them in batches, and a full sequential scan for reference.
+
+    python benchmarks/heap_fetch.py [rows] [fraction...]
+"""
+import os, sys, shutil, random, logging, time
+root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if root_path not in sys.path:
+    sys.path.append(root_path)
+
+import numpy as np
+from engine.model import TableSchema, Column, DataType
+from engine.buffer import BufferManager
+from engine.record import Record, RecordFile
+from engine.scan import HeapScan
+from engine import utils
+
+ROWS = 200_000
+FRACTIONS = [0.001, 0.01, 0.1, 0.5]
+BATCH_SIZE = 1000
+
+
+def timed(fn) -> tuple[float, int]:
+    start = time.perf_counter()
+    count = fn()
+    return time.perf_counter() - start, count
+
+
+def run(rows : int, fractions : list[float]) -> None:
+    table_name = "bench_heap_fetch"
+    schema = TableSchema(table_name, [
+        Column("id", DataType.INT, is_primary=True),
+        Column("name", DataType.VARCHAR, varchar_length=20),
+        Column("price", DataType.FLOAT),
+    ])
+    table_dir = os.path.dirname(utils.get_record_file_path(table_name))
+    try:
+        record_file = RecordFile(schema, use_mmap=True)
+        record_file.append_many([Record(schema, [i, f"item{i}", i / 7]) for i in range(rows)])
+        scan = HeapScan(record_file)
+        # first use maps the file and warms up numpy
+        list(scan.fetch([0], BATCH_SIZE))
+
+        full, _ = timed(lambda: sum(len(records) for _, records in scan.filter(lambda r: np.ones(len(r), dtype=bool), BATCH_SIZE)))
+        print(f"{'fraction':>9} {'rows':>8} {'read':>10} {'fetch':>10} {'speedup':>8}   full scan {full:.3f}s")
+        for fraction in fractions:
+            # positions in the random order an unclustered index returns them
+            positions = random.sample(range(rows), int(rows * fraction))
+            read, count = timed(lambda: sum(record_file.read(pos) is not None for pos in positions))
+            fetch, _ = timed(lambda: sum(len(records) for _, records in scan.fetch(positions, BATCH_SIZE)))
+            print(f"{fraction:>9} {count:>8} {read:>9.3f}s {fetch:>9.3f}s {read / fetch:>7.1f}x")
+    finally:
+        BufferManager().discard(table_dir)
+        shutil.rmtree(table_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    logging.disable(logging.CRITICAL)
+    random.seed(0)
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    fractions = [float(arg) for arg in sys.argv[2:]] or FRACTIONS
+    run(rows, fractions)
@@ -0,0 +1,202 @@
+import os, sys, atexit, threading
+from collections import OrderedDict
+root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if root_path not in sys.path:
+    sys.path.append(root_path)
+
+from engine import stats
+from engine.filepool import FilePool
+import logger
+
+PAGE_SIZE = 4096
+DEFAULT_MEMORY_BUDGET = 32 * 1024 * 1024
+
+
+class Frame:
+    """A page of PAGE_SIZE bytes of a file held in the buffer pool"""
+    __slots__ = ("path", "page_no", "data", "dirty", "pin_count")
+
+    def __init__(self, path : str, page_no : int, data : bytes):
+        self.path = path
+        self.page_no = page_no
+        self.data = bytearray(data.ljust(PAGE_SIZE, b"\x00"))
+        self.dirty = False
+        self.pin_count = 0
+
+
+class BufferManager:
+    """Process-wide page cache shared by the heap and index files.
+
+    Files are split in fixed-size frames keyed by (path, page number). Frames
+    are evicted in LRU order once the memory budget is exhausted, skipping the
+    pinned ones, and dirty frames are written back when evicted or flushed.
+    """
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(BufferManager, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self, memory_budget : int = DEFAULT_MEMORY_BUDGET):
+        if self._initialized:
+            return
+        self.page_size = PAGE_SIZE
+        self.capacity = max(1, memory_budget // PAGE_SIZE)
+        self.frames : OrderedDict[tuple[str, int], Frame] = OrderedDict()
+        self.sizes : dict[str, int] = {}
+        self.dirty : set[tuple[str, int]] = set()
+        self.files = FilePool()
+        self.lock = threading.RLock()
+        self.logger = logger.CustomLogger("BUFFERMANAGER")
+        atexit.register(self.flush)
+        self._initialized = True
+
+    def set_memory_budget(self, memory_budget : int) -> None:
+        with self.lock:
+            self.capacity = max(1, memory_budget // self.page_size)
+            self._evict()
+
+    def get_memory_budget(self) -> int:
+        return self.capacity * self.page_size
+
+    @staticmethod
+    def _key(path : str) -> str:
+        return os.path.abspath(path)
+
+    def _physical_read(self, path : str, page_no : int) -> bytes:
+        data = self.files.pread(path, self.page_size, page_no * self.page_size)
+        stats.count_disk_read()
+        return data
+
+    def _physical_write(self, frame : Frame) -> None:
+        valid = min(self.page_size, self.sizes[frame.path] - frame.page_no * self.page_size)
+        if valid > 0:
+            self.files.pwrite(frame.path, bytes(frame.data[:valid]), frame.page_no * self.page_size)
+            stats.count_disk_write()
+        frame.dirty = False
+        self.dirty.discard((frame.path, frame.page_no))
+
+    def _evict(self, reserve : int = 0) -> None:
+        while len(self.frames) + reserve > self.capacity:
+            victim = next((frame for frame in self.frames.values() if frame.pin_count == 0), None)
+            if victim is None:
+                self.logger.warning("All frames are pinned, exceeding memory budget")
+                return
+            if victim.dirty:
+                self._physical_write(victim)
+            del self.frames[(victim.path, victim.page_no)]
+
+    def _size(self, path : str) -> int:
+        if path not in self.sizes:
+            self.sizes[path] = os.path.getsize(path) if os.path.exists(path) else 0
+        return self.sizes[path]
+
+    def _pin(self, path : str, page_no : int, load : bool = True) -> Frame:
+        stats.count_page_request()
+        key = (path, page_no)
+        frame = self.frames.get(key)
+        if frame is None:
+            self._evict(reserve=1)
+            data = b""
+            if load and page_no * self.page_size < self._size(path):
+                data = self._physical_read(path, page_no)
+            frame = Frame(path, page_no, data)
+            self.frames[key] = frame
+        else:
+            self.frames.move_to_end(key)
+        frame.pin_count += 1
+        return frame
+
+    def pin(self, path : str, page_no : int) -> Frame:
+        """Fetch a page and pin it so it can't be evicted until unpinned"""
+        with self.lock:
+            return self._pin(self._key(path), page_no)
+
+    def unpin(self, frame : Frame, dirty : bool = False) -> None:
+        with self.lock:
+            if frame.pin_count <= 0:
+                raise Exception(f"Frame {frame.page_no} of {frame.path} is not pinned")
+            frame.pin_count -= 1
+            if dirty:
+                frame.dirty = True
+                self.dirty.add((frame.path, frame.page_no))
+
+    def size(self, path : str) -> int:
+        """Logical size of the file, including pages not yet written back"""
+        with self.lock:
+            return self._size(self._key(path))
+
+    def read(self, path : str, offset : int, size : int) -> bytes:
+        """Read up to size bytes at offset, short reads past the end like file.read"""
+        with self.lock:
+            path = self._key(path)
+            end = min(offset + size, self._size(path))
+            if offset >= end:
+                return b""
+            data = bytearray()
+            pos = offset
+            while pos < end:
+                page_no, start = divmod(pos, self.page_size)
+                length = min(self.page_size - start, end - pos)
+                frame = self._pin(path, page_no)
+                data += frame.data[start:start + length]
+                frame.pin_count -= 1
+                pos += length
+            return bytes(data)
+
+    def write(self, path : str, offset : int, data : bytes) -> None:
+        with self.lock:
+            path = self._key(path)
+            size = self._size(path)
+            pos = offset
+            written = 0
+            while written < len(data):
+                page_no, start = divmod(pos, self.page_size)
+                length = min(self.page_size - start, len(data) - written)
+                whole_page = start == 0 and (length == self.page_size or pos + length >= size)
+                frame = self._pin(path, page_no, load=not whole_page)
+                frame.data[start:start + length] = data[written:written + length]
+                frame.dirty = True
+                self.dirty.add((path, page_no))
+                frame.pin_count -= 1
+                pos += length
+                written += length
+            if offset + len(data) > size:
+                self.sizes[path] = offset + len(data)
+
+    def append(self, path : str, data : bytes) -> int:
+        """Write data at the end of the file and return its offset"""
+        with self.lock:
+            offset = self._size(self._key(path))
+            self.write(path, offset, data)
+            return offset
+
+    def create(self, path : str) -> None:
+        """Create or truncate a file, dropping any cached page of it"""
+        with self.lock:
+            self.discard(path)
+            self.files.truncate(path)
+            self.sizes[self._key(path)] = 0
+
+    def flush(self, path : str = None) -> None:
+        """Write back the dirty frames of a file, or of every file if path is None"""
+        with self.lock:
+            key = self._key(path) if path else None
+            for frame_key in sorted(k for k in self.dirty if key is None or k[0] == key):
+                self._physical_write(self.frames[frame_key])
+
+    def discard(self, path : str) -> None:
+        """Forget every cached page of a file or of the files inside a directory
+        without writing them back and close their descriptors, used before
+        removing them from disk"""
+        with self.lock:
+            self.files.close(path)
+            key = self._key(path)
+            prefix = key + os.sep
+            for frame_key in [k for k in self.frames if k[0] == key or k[0].startswith(prefix)]:
+                del self.frames[frame_key]
+                self.dirty.discard(frame_key)
+            for size_key in [k for k in self.sizes if k == key or k.startswith(prefix)]:
+                del self.sizes[size_key]
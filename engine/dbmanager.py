@@ -1,26 +1,38 @@
-import os, sys, shutil, pickle
+import os, sys, shutil, pickle, functools, itertools
+import numpy as np
 from collections import Counter
-from bitarray import bitarray
 import heapq
 root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if root_path not in sys.path:
     sys.path.append(root_path)
 
 from engine.model_condition import Condition, BinaryCondition, BetweenCondition, NotCondition, BooleanColumn, ConditionColumn, ConditionValue, ConditionSchema, BinaryOp
-from engine.model import DataType, TableSchema, IndexType, SelectSchema, DeleteSchema
+from engine.model import DataType, TableSchema, IndexType, CompositeIndex, SelectSchema, DeleteSchema
 from engine import utils
+from engine.roaring import RoaringBitmap
+from engine import planner
 from indexes.bplustree import BPlusTree
 from indexes.avltree import AVLTree
 from indexes.EHtree import ExtendibleHashTree
 from indexes.Rtree import RTreeIndex, MBR, Circle
 from indexes.ISAMtree import ISAMIndex, test_isam_integrity
 from indexes.noindex import NoIndex
+from indexes.brin import BRINIndex
+from indexes.bitmapindex import BitmapIndex
+from indexes.composite import CompositeKeyIndex
 
 import csv
 
 from engine.record import Record, RecordFile
+from engine.scan import HeapScan
+from engine.statistics import TableStatistics
+from engine.buffer import BufferManager
 import logger
 
+CSV_BATCH_SIZE = 1000
+SCAN_BATCH_SIZE = 1000
+FETCH_FIRST_CHUNK = 16
+
 class DBManager:
     _instance = None
 
@@ -36,6 +48,10 @@ class DBManager:
         self.tables_path = f"{os.path.dirname(__file__)}/../tables"
         self.logger = logger.CustomLogger("DBManager")
         self.indexes = {}
+        self.record_files = {}
+        self.heap_scans = {}
+        self.statistics = {}
+        self.buffer = BufferManager()
         self._initialized = True
 
     def error(self, error : str):
@@ -72,6 +88,10 @@ class DBManager:
                         index = BPlusTree(table_schema, column)
                     case IndexType.RTREE:
                         index = RTreeIndex(table_schema, column)
+                    case IndexType.BRIN:
+                        index = BRINIndex(table_schema, column)
+                    case IndexType.BITMAP:
+                        index = BitmapIndex(table_schema, column)
                     case IndexType.NONE:
                         index = NoIndex(table_schema, column)
                     case _:
@@ -79,81 +99,124 @@ class DBManager:
         self.indexes[index_name] = index
         return index
 
-    def list_to_bitmap(self, list : list[int]) -> bitarray:
-        if len(list) == 0:
-            bitmap = bitarray(1)
-        else:
-            max_id = max(list)
-            bitmap = bitarray(max_id + 1 + 1)
-        bitmap.setall(0)
-
-        for id in list:
-            bitmap[id + 1] = 1
+    def get_composite_index(self, table_schema : TableSchema, composite : CompositeIndex) -> CompositeKeyIndex:
+        index_name = f"{table_schema.table_name}.{'+'.join(composite.key_columns())}"
+        if index_name not in self.indexes:
+            self.indexes[index_name] = CompositeKeyIndex(table_schema, composite)
+        return self.indexes[index_name]
+
+    def get_record_file(self, table_schema : TableSchema) -> RecordFile:
+        if table_schema.table_name not in self.record_files:
+            self.record_files[table_schema.table_name] = RecordFile(table_schema, use_mmap=True)
+        return self.record_files[table_schema.table_name]
+
+    def get_heap_scan(self, table_schema : TableSchema) -> HeapScan:
+        if table_schema.table_name not in self.heap_scans:
+            self.heap_scans[table_schema.table_name] = HeapScan(self.get_record_file(table_schema))
+        return self.heap_scans[table_schema.table_name]
+
+    def get_statistics(self, table_schema : TableSchema) -> TableStatistics:
+        """Statistics of the table, analyzed on first use for tables that
+        were created without them"""
+        if table_schema.table_name not in self.statistics:
+            statistics = TableStatistics.load(table_schema.table_name)
+            if statistics is None:
+                statistics = TableStatistics.analyze(table_schema, self.get_heap_scan(table_schema))
+                statistics.save()
+            self.statistics[table_schema.table_name] = statistics
+        return self.statistics[table_schema.table_name]
+
+    def analyze(self, table_name : str) -> None:
+        table_schema = self.get_table_schema(table_name)
+        statistics = TableStatistics.analyze(table_schema, self.get_heap_scan(table_schema))
+        statistics.save()
+        self.statistics[table_name] = statistics
 
-        return bitmap
+    def list_to_bitmap(self, list : list[int], size : int = 0) -> RoaringBitmap:
+        return RoaringBitmap.from_positions(list, size)
     
-    def bitmap_to_list(self, bitmap : bitarray) -> list[int]:
-        return [i for i, bit in enumerate(bitmap[1:]) if bit]
+    def bitmap_to_list(self, bitmap : RoaringBitmap) -> list[int]:
+        return bitmap.to_positions().tolist()
     
-    def bitmap_or(self, a : bitarray, b : bitarray) -> bitarray:
-        len_diff = len(a) - len(b)
-        if len_diff > 0:
-            b.extend([b[0]] * len_diff)
-        else:
-            a.extend([a[0]] * (-len_diff))
-
+    def bitmap_or(self, a : RoaringBitmap, b : RoaringBitmap) -> RoaringBitmap:
         return a | b
 
-    def bitmap_and(self, a : bitarray, b : bitarray) -> bitarray:
-        len_diff = len(a) - len(b)
-        if len_diff > 0:
-            b.extend([b[0]] * len_diff)
-        else:
-            a.extend([a[0]] * (-len_diff))
-
+    def bitmap_and(self, a : RoaringBitmap, b : RoaringBitmap) -> RoaringBitmap:
         return a & b
 
-    def bitmap_not(self, a : bitarray) -> bitarray:
+    def bitmap_not(self, a : RoaringBitmap) -> RoaringBitmap:
         return ~a
     
-    def bitmap_difference(self, a : bitarray, b : bitarray) -> bitarray:
-        return self.bitmap_and(a, self.bitmap_not(b))
+    def bitmap_difference(self, a : RoaringBitmap, b : RoaringBitmap) -> RoaringBitmap:
+        return a - b
     
-    def retrieve_data(self, table_schema : TableSchema, bitmap : bitarray, limit = None) -> list[Record]:
-        ids = self.bitmap_to_list(bitmap)
-        records = []
-        record_file = RecordFile(table_schema)
+    def retrieve_data(self, table_schema : TableSchema, bitmap : RoaringBitmap, limit = None) -> list[Record]:
+        return list(self.iter_data(table_schema, bitmap, limit))
+
+    def iter_data(self, table_schema : TableSchema, bitmap : RoaringBitmap, limit = None, predicate = None):
+        """Live records selected by bitmap in position order, read as they are
+        consumed and decoded SCAN_BATCH_SIZE records at a time. predicate
+        drops the rows it rejects, see HeapScan.fetch"""
+        scan = self.get_heap_scan(table_schema)
         count = 0
-        for id in ids:
-            if limit != None and count >= limit:
-                break
-            records.append(record_file.read(id))
-            count += 1
-        if bitmap[0]:
-            id = len(bitmap) -1
-            while id < record_file.max_id():
+        for _, records in scan.fetch(bitmap.to_positions(), SCAN_BATCH_SIZE, predicate):
+            if limit != None and count + len(records) >= limit:
+                yield from records[:limit - count]
+                return
+            yield from records
+            count += len(records)
+
+    def iter_ordered_data(self, table_schema : TableSchema, bitmap : RoaringBitmap, positions, limit = None, predicate = None):
+        """Records selected by bitmap (every one if None), taken in the order
+        positions yields them. positions is consumed lazily so an index
+        iterator stops being traversed once limit records are found. They are
+        taken in chunks, growing up to SCAN_BATCH_SIZE, each fetched from the
+        heap in one sweep, without the rows predicate rejects."""
+        scan = self.get_heap_scan(table_schema)
+        positions = iter(positions)
+        count = 0
+        chunk_size = FETCH_FIRST_CHUNK
+        while limit == None or count < limit:
+            chunk = list(itertools.islice(positions, chunk_size))
+            if not chunk:
+                return
+            if bitmap != None:
+                chunk = [pos for pos in chunk if pos in bitmap]
+            fetched = {}
+            for found, records in scan.fetch(chunk, SCAN_BATCH_SIZE, predicate):
+                fetched.update(zip(found.tolist(), records))
+            for pos in chunk:
+                record = fetched.pop(pos, None)
+                if record is None:
+                    continue
                 if limit != None and count >= limit:
-                    break
-                record = record_file.read(id)
-                records.append(record)
-                id += 1
+                    return
+                yield record
                 count += 1
-        return records
-    
-    def retrieve_data_and_delete(self, table_schema : TableSchema, bitmap : bitarray) -> list[Record]:
-        ids = self.bitmap_to_list(bitmap)
-        records = []
-        record_file = RecordFile(table_schema)
-        for id in ids:
-            records.append(record_file.read(id))
-            record_file.delete(id)
-        if bitmap[0]:
-            id = ids[-1] + 1
-            while id < record_file.max_id():
-                records.append(record_file.read(id))
-                record_file.delete(id)
-                id += 1
-        return records
+            chunk_size = min(2 * chunk_size, SCAN_BATCH_SIZE)
+
+    def use_ordered_scan(self, table_schema : TableSchema, bitmap : RoaringBitmap, column_name : str, limit : int) -> bool:
+        """Whether ORDER BY column_name LIMIT limit should walk an ordered index
+        instead of sorting every selected record. The walk visits about
+        limit * rows / selected entries before it has limit matches."""
+        column = next(column for column in table_schema.columns if column.name == column_name)
+        # the AVL tree keeps one node per key, only the primary key has them all
+        if column.index_type != IndexType.BTREE and not (column.index_type == IndexType.AVL and column.is_primary):
+            return False
+        rows = self.get_statistics(table_schema).live
+        selected = bitmap.cardinality()
+        return selected > 0 and limit * rows <= selected * selected
+
+    def retrieve_data_and_delete(self, table_schema : TableSchema, bitmap : RoaringBitmap) -> list[tuple[int, Record]]:
+        """Delete the selected records, returning them with the position they had"""
+        deleted = []
+        record_file = self.get_record_file(table_schema)
+        scan = self.get_heap_scan(table_schema)
+        for positions, records in list(scan.fetch(bitmap.to_positions(), SCAN_BATCH_SIZE)):
+            for pos, record in zip(positions.tolist(), records):
+                record_file.delete(pos)
+                deleted.append((pos, record))
+        return deleted
 
     def create_table(self, table_schema : TableSchema, if_not_exists : bool = False) -> None:
         path = f"{self.tables_path}/{table_schema.table_name}"
@@ -199,6 +262,7 @@ class DBManager:
             
             os.makedirs(path)
             self.save_table_schema(table_schema, path)
+            TableStatistics(table_schema).save()
 
             for column in table_schema.columns:
                 print(column.index_type)
@@ -209,6 +273,12 @@ class DBManager:
     def drop_table(self, table_name : str, if_exists : bool = False) -> None:
         path = f"{self.tables_path}/{table_name}"
         if os.path.exists(path):
+            self.record_files.pop(table_name, None)
+            self.heap_scans.pop(table_name, None)
+            self.statistics.pop(table_name, None)
+            for index_name in [name for name in self.indexes if name.startswith(f"{table_name}.")]:
+                del self.indexes[index_name]
+            self.buffer.discard(path)
             shutil.rmtree(path)
             
             try:
@@ -237,6 +307,14 @@ class DBManager:
                 return
 
     def select(self, select_schema : SelectSchema) -> dict[str, list]:
+        result = self.select_cursor(select_schema)
+        result['records'] = list(result['records'])
+        return result
+
+    def select_cursor(self, select_schema : SelectSchema) -> dict:
+        """Like select but 'records' is a generator that reads the rows as they
+        are consumed, so a caller can fetch them in batches. The query is
+        checked and planned here, only ORDER BY without an index sorts upfront."""
         table = self.get_table_schema(select_schema.table_name)
         column_names = [column.name for column in table.columns]
         if not select_schema.all:
@@ -250,15 +328,45 @@ class DBManager:
             if select_schema.limit <= 0:
                 self.error("limit must be positive")
 
-        if select_schema.condition_schema.condition:
-            bitmap = self.select_condition(table, select_schema.condition_schema.condition)
+        condition = select_schema.condition_schema.condition
+        covered = self.iter_covered(table, select_schema, condition) if condition and not select_schema.all and select_schema.order_by == None else None
+        if covered != None:
+            return {
+                'columns': select_schema.column_list,
+                'records': covered
+            }
+        bounds = self.range_bounds(table, condition) if select_schema.order_by == None and select_schema.limit != None else None
+        # without an index to walk in order, records can come straight from a filtering scan
+        scan_filter = condition and bounds == None and self.is_scan_filter(table, condition) and (select_schema.order_by == None or select_schema.limit == None)
+        if bounds != None or scan_filter:
+            bitmap = None
+        elif condition:
+            bitmap = self.select_condition(table, condition)
         else:
-            bitmap = bitarray(1)
-            bitmap.setall(1)
-        if select_schema.order_by == None:
-            result = self.retrieve_data(table, bitmap, select_schema.limit)
+            bitmap = RoaringBitmap.full(self.get_record_file(table).max_id())
+        # rows fetched lazily may be read after a delete freed their slot and
+        # an insert reused it, so they are checked against the condition again.
+        # Spatial conditions can't be, those rows may not match it
+        recheck = planner.compile_condition(self.get_heap_scan(table), table, condition) if condition and planner.is_filterable(table, condition) else None
+        if bounds != None:
+            # a lone range with LIMIT reads the index lazily and stops with the limit
+            column_name, lo, hi = bounds
+            index = self.get_index(table, column_name)
+            positions = iter(index.search(lo)) if lo == hi else index.iter_range(lo, hi)
+            result = self.iter_ordered_data(table, None, positions, select_schema.limit, recheck)
+        elif select_schema.order_by == None:
+            if scan_filter:
+                result = self.iter_filtered(table, condition, select_schema.limit)
+            else:
+                result = self.iter_data(table, bitmap, select_schema.limit, recheck)
+        elif select_schema.limit != None and self.use_ordered_scan(table, bitmap, select_schema.order_by, select_schema.limit):
+            index = self.get_index(table, select_schema.order_by)
+            result = self.iter_ordered_data(table, bitmap, index.iter_ordered(reverse=not select_schema.asc), select_schema.limit, recheck)
         else:
-            result = self.retrieve_data(table, bitmap)
+            if scan_filter:
+                result = list(self.iter_filtered(table, condition))
+            else:
+                result = self.retrieve_data(table, bitmap)
             for i, column in enumerate(column_names):
                 if select_schema.order_by == column:
                     ordered_column_num = i
@@ -279,32 +387,136 @@ class DBManager:
                     result = sorted(result, key=lambda x : x.values[ordered_column_num])
                 else:
                     result = sorted(result, reverse=True, key=lambda x : x.values[ordered_column_num])
-        if not select_schema.all:
-            for record in result:
-                value_map = {col.name: val for col, val in zip(table.columns, record.values)}
-                record.values = [value_map[name] for name in select_schema.column_list]
-        final_result = []
-        for record in result:
-            if record:
-                for i, value in enumerate(record.values):
-                    if isinstance(value, tuple):
-                        record.values[i] = str(value)
-                final_result.append(record.values)
         return {
             'columns': column_names if select_schema.all else select_schema.column_list,
-            'records': final_result
+            'records': self.iter_values(table, select_schema, result)
         }
 
-    def select_condition(self, table_schema : TableSchema, condition : Condition) -> bitarray:
+    def iter_values(self, table_schema : TableSchema, select_schema : SelectSchema, records):
+        """Values of the selected columns of each record, points as strings"""
+        for record in records:
+            if not record:
+                continue
+            if not select_schema.all:
+                value_map = {col.name: val for col, val in zip(table_schema.columns, record.values)}
+                record.values = [value_map[name] for name in select_schema.column_list]
+            for i, value in enumerate(record.values):
+                if isinstance(value, tuple):
+                    record.values[i] = str(value)
+            yield record.values
+
+    def iter_covered(self, table_schema : TableSchema, select_schema : SelectSchema, condition : Condition):
+        """Values of the selected columns read from the leaves of a B+Tree
+        alone, without a single heap read, when the tree answers the whole
+        condition and holds every selected column. None if no index covers
+        the query."""
+        entries = None
+        bounds = self.range_bounds(table_schema, condition)
+        if bounds != None and set(select_schema.column_list) <= {bounds[0]}:
+            column_name, lo, hi = bounds
+            if table_schema.get_column_by_name(column_name).index_type == IndexType.BTREE:
+                names = [column_name]
+                entries = (([key], pos) for key, pos in self.get_index(table_schema, column_name).iter_entries(lo, hi))
+        if entries == None:
+            probe = planner.covering_probe(table_schema, condition, select_schema.column_list)
+            if probe == None:
+                return None
+            names = probe.index.key_columns()
+            entries = self.get_composite_index(table_schema, probe.index).iter_entries(probe.prefix, probe.lo, probe.hi)
+        if select_schema.limit != None:
+            # like the lone range with LIMIT, in index order and stopping with the limit
+            entries = itertools.islice(entries, select_schema.limit)
+        else:
+            entries = sorted(entries, key=lambda entry: entry[1])
+        fields = [names.index(name) for name in select_schema.column_list]
+        return ([values[i] for i in fields] for values, _ in entries)
+
+    def range_bounds(self, table_schema : TableSchema, condition : Condition) -> tuple[str, any, any] | None:
+        """(column, lo, hi) when condition is a single inclusive range over a
+        column that an index can scan, None otherwise or when select_condition
+        has to report an error for it"""
+        if type(condition) == BetweenCondition:
+            column_name, lo, hi = condition.left.column_name, condition.mid.value, condition.right.value
+        elif type(condition) == BinaryCondition and condition.op in (BinaryOp.EQ, BinaryOp.LE, BinaryOp.GE):
+            column_name, value = condition.left.column_name, condition.right.value
+            lo = None if condition.op == BinaryOp.LE else value
+            hi = None if condition.op == BinaryOp.GE else value
+        else:
+            return None
+        column = next((column for column in table_schema.columns if column.name == column_name), None)
+        if column == None or column.data_type == DataType.POINT or column.index_type == IndexType.RTREE:
+            return None
+        if any(value != None and utils.get_data_type(value) != column.data_type for value in (lo, hi)):
+            return None
+        return column_name, lo, hi
+
+    def select_condition(self, table_schema : TableSchema, condition : Condition) -> RoaringBitmap:
+        """Positions matching condition. Conjunctions and conditions no index
+        can help with are planned by engine.planner, the rest is answered
+        by probe_condition."""
+        record_file = self.get_record_file(table_schema)
+        scan = self.get_heap_scan(table_schema)
+        if self.is_scan_filter(table_schema, condition):
+            predicate = planner.compile_condition(scan, table_schema, condition)
+            rows = scan.rows()
+            return self.list_to_bitmap(np.flatnonzero(scan.live(rows) & predicate(rows)), record_file.max_id())
+        predicates = planner.conjuncts(condition)
+        if len(predicates) == 1 and not planner.composite_probes(table_schema, predicates):
+            return self.probe_condition(table_schema, condition)
+        probes, filters = planner.plan_conjunction(table_schema, predicates, self.get_statistics(table_schema))
+        self.logger.info(f"planned {len(probes)} index probes and {len(filters)} filters")
+        bitmap = None
+        for probe in probes:
+            if type(probe) == planner.CompositeProbe:
+                result = self.list_to_bitmap(self.probe_composite(table_schema, probe), record_file.max_id())
+            else:
+                result = self.probe_condition(table_schema, probe)
+            bitmap = result if bitmap is None else self.bitmap_and(bitmap, result)
+        if bitmap is None:
+            positions = scan.live_positions()
+        else:
+            positions = scan.live_at(bitmap.to_positions())
+        if filters and len(positions):
+            predicate = planner.compile_condition(scan, table_schema, functools.reduce(lambda a, b: BinaryCondition(a, BinaryOp.AND, b), filters))
+            positions = positions[predicate(scan.rows()[positions])]
+        return self.list_to_bitmap(positions, record_file.max_id())
+
+    def is_scan_filter(self, table_schema : TableSchema, condition : Condition) -> bool:
+        """Whether condition is best answered by one sequential pass over the
+        heap, true when it can be compiled and no index can help"""
+        if not planner.is_filterable(table_schema, condition) or self.uses_index(table_schema, condition):
+            return False
+        return not planner.composite_probes(table_schema, planner.conjuncts(condition))
+
+    def iter_filtered(self, table_schema : TableSchema, condition : Condition, limit = None):
+        """Live records satisfying condition in position order, found and
+        decoded in the same pass over the heap, which stops with the limit"""
+        scan = self.get_heap_scan(table_schema)
+        predicate = planner.compile_condition(scan, table_schema, condition)
+        count = 0
+        for _, records in scan.filter(predicate, SCAN_BATCH_SIZE):
+            if limit != None and count + len(records) >= limit:
+                yield from records[:limit - count]
+                return
+            yield from records
+            count += len(records)
+
+    def uses_index(self, table_schema : TableSchema, condition : Condition) -> bool:
+        """Whether any predicate inside condition has an index access path"""
+        if type(condition) == BinaryCondition and condition.op in (BinaryOp.AND, BinaryOp.OR):
+            return self.uses_index(table_schema, condition.left) or self.uses_index(table_schema, condition.right)
+        if type(condition) == NotCondition:
+            return self.uses_index(table_schema, condition.condition)
+        return planner.has_index_access(table_schema, condition)
+
+    def probe_condition(self, table_schema : TableSchema, condition : Condition) -> RoaringBitmap:
+        # every bitmap of the query spans the whole table, NOT complements within it
+        size = self.get_record_file(table_schema).max_id()
         condition_type = type(condition)
         if condition_type == BinaryCondition:
             op = condition.op
-            if op in [BinaryOp.AND, BinaryOp.OR]:
-                match op:
-                    case BinaryOp.AND:
-                        return self.bitmap_and(self.select_condition(table_schema, condition.left), self.select_condition(table_schema, condition.right))
-                    case BinaryOp.OR:
-                        return self.bitmap_or(self.select_condition(table_schema, condition.left), self.select_condition(table_schema, condition.right))
+            if op == BinaryOp.OR:
+                return self.bitmap_or(self.select_condition(table_schema, condition.left), self.select_condition(table_schema, condition.right))
             else:
                 column = None
                 for i in table_schema.columns:
@@ -322,7 +534,7 @@ class DBManager:
                                 self.error("min coordinates on rectangle definition must not be larger than max coordinates")
                             index = self.get_index(table_schema, condition.left.column_name)
                             mbr = MBR(condition.right.value[0], condition.right.value[1], condition.right.value[2], condition.right.value[3])
-                            return self.list_to_bitmap(index.rangeSearch(mbr))
+                            return self.list_to_bitmap(index.rangeSearch(mbr), size)
                         case BinaryOp.WC:
                             if utils.get_data_type(condition.right.value) != "circle":
                                 self.error(f"value '{condition.right.value}' is not a valid circle definition")
@@ -330,47 +542,49 @@ class DBManager:
                                 self.error("radius on circle definition must be positive")
                             index = self.get_index(table_schema, condition.left.column_name)
                             circle = Circle(condition.right.value[0], condition.right.value[1], condition.right.value[2])
-                            return self.list_to_bitmap(index.rangeSearch(circle))
+                            return self.list_to_bitmap(index.rangeSearch(circle), size)
                         case BinaryOp.KNN:
                             if utils.get_data_type(condition.right.value) != "knn":
                                 self.error(f"value '{condition.right.value}' is not a valid knn definition")
                             if condition.right.value[2] <= 0:
                                 self.error("k value on knn must be positive")
                             index = self.get_index(table_schema, condition.left.column_name)
-                            return self.list_to_bitmap(index.knnSearch(condition.right.value[0], condition.right.value[1], condition.right.value[2]))
+                            return self.list_to_bitmap(index.knnSearch(condition.right.value[0], condition.right.value[1], condition.right.value[2]), size)
                         case BinaryOp.EQ:
                             if utils.get_data_type(condition.right.value) != DataType.POINT:
                                 self.error(f"value '{condition.right.value}' is not of data type {column.data_type}")
                             index = self.get_index(table_schema, condition.left.column_name)
-                            return self.list_to_bitmap(index.search(condition.right.value))
+                            return self.list_to_bitmap(index.search(condition.right.value), size)
                         case BinaryOp.NEQ:
                             if utils.get_data_type(condition.right.value) != DataType.POINT:
                                 self.error(f"value '{condition.right.value}' is not of data type {column.data_type}")
                             index = self.get_index(table_schema, condition.left.column_name)
-                            return self.bitmap_not(self.list_to_bitmap(index.search(condition.right.value)))
+                            return self.bitmap_not(self.list_to_bitmap(index.search(condition.right.value), size))
                         case _:
                             self.error("operation not supported for POINT type")
                 if column.data_type != utils.get_data_type(condition.right.value):
                     self.error(f"value '{condition.right.value}' is not of data type {column.data_type}")
+                if column.index_type == IndexType.BITMAP:
+                    return self.probe_bitmap_index(table_schema, column, op, condition.right.value, size)
                 match op:
                     case BinaryOp.EQ:
                         index = self.get_index(table_schema, condition.left.column_name)
-                        return self.list_to_bitmap(index.search(condition.right.value))
+                        return self.list_to_bitmap(index.search(condition.right.value), size)
                     case BinaryOp.NEQ:
                         index = self.get_index(table_schema, condition.left.column_name)
-                        return self.bitmap_not(self.list_to_bitmap(index.search(condition.right.value)))
+                        return self.bitmap_not(self.list_to_bitmap(index.search(condition.right.value), size))
                     case BinaryOp.LT:
                         index = self.get_index(table_schema, condition.left.column_name)
-                        return self.bitmap_difference(self.list_to_bitmap(index.rangeSearch(None, condition.right.value)), self.list_to_bitmap(index.search(condition.right.value)))
+                        return self.bitmap_difference(self.list_to_bitmap(index.rangeSearch(None, condition.right.value), size), self.list_to_bitmap(index.search(condition.right.value), size))
                     case BinaryOp.GT:
                         index = self.get_index(table_schema, condition.left.column_name)
-                        return self.bitmap_difference(self.list_to_bitmap(index.rangeSearch(condition.right.value, None)), self.list_to_bitmap(index.search(condition.right.value)))
+                        return self.bitmap_difference(self.list_to_bitmap(index.rangeSearch(condition.right.value, None), size), self.list_to_bitmap(index.search(condition.right.value), size))
                     case BinaryOp.LE:
                         index = self.get_index(table_schema, condition.left.column_name)
-                        return self.list_to_bitmap(index.rangeSearch(None, condition.right.value))
+                        return self.list_to_bitmap(index.rangeSearch(None, condition.right.value), size)
                     case BinaryOp.GE:
                         index = self.get_index(table_schema, condition.left.column_name)
-                        return self.list_to_bitmap(index.rangeSearch(condition.right.value, None))
+                        return self.list_to_bitmap(index.rangeSearch(condition.right.value, None), size)
         elif condition_type == BetweenCondition:
             column = None
             for i in table_schema.columns:
@@ -384,7 +598,9 @@ class DBManager:
             if column.data_type != utils.get_data_type(condition.mid.value) or column.data_type != utils.get_data_type(condition.right.value):
                 self.error(f"value '{condition.right.value}' is not of data type {column.data_type}")
             index = self.get_index(table_schema, condition.left.column_name)
-            return self.list_to_bitmap(index.rangeSearch(condition.mid.value, condition.right.value))
+            if column.index_type == IndexType.BITMAP:
+                return index.lookup(condition.mid.value, condition.right.value, size)
+            return self.list_to_bitmap(index.rangeSearch(condition.mid.value, condition.right.value), size)
         elif condition_type == NotCondition:
             return self.bitmap_not(self.select_condition(table_schema, condition.condition))
         elif condition_type == BooleanColumn:
@@ -397,16 +613,42 @@ class DBManager:
                 self.error(f"column '{condition.column_name}' doesn't exist in table '{table_schema.table_name}'")
             if column.data_type != DataType.BOOL:
                 self.error(f"column '{condition.column_name}' is not of data type {DataType.BOOL}")
-            if DataType.BOOL != utils.get_data_type(condition.right.value):
-                self.error(f"value '{condition.right.value}' is not of data type {DataType.BOOL}")
             index = self.get_index(table_schema, condition.column_name)
-            return self.list_to_bitmap(index.search(True))
+            if column.index_type == IndexType.BITMAP:
+                return index.lookup(True, True, size)
+            return self.list_to_bitmap(index.search(True), size)
         else:
             self.error("invalid condition")
         
 
+    def probe_composite(self, table_schema : TableSchema, probe : planner.CompositeProbe) -> list[int]:
+        index = self.get_composite_index(table_schema, probe.index)
+        if probe.is_full_key():
+            return index.search(probe.prefix)
+        return index.prefix_search(probe.prefix, probe.lo, probe.hi)
+
+    def probe_bitmap_index(self, table_schema : TableSchema, column, op : BinaryOp, value, size : int) -> RoaringBitmap:
+        """A comparison answered with the bitmaps of a BITMAP index as they are"""
+        index = self.get_index(table_schema, column.name)
+        match op:
+            case BinaryOp.EQ:
+                return index.lookup(value, value, size)
+            case BinaryOp.NEQ:
+                return self.bitmap_not(index.lookup(value, value, size))
+            case BinaryOp.LT:
+                return index.lookup(None, value, size, hi_inclusive=False)
+            case BinaryOp.GT:
+                return index.lookup(value, None, size, lo_inclusive=False)
+            case BinaryOp.LE:
+                return index.lookup(None, value, size)
+            case BinaryOp.GE:
+                return index.lookup(value, None, size)
+
     def insert(self, table_name:str, values: list, columns: list):
-        tableSchema: TableSchema = self.get_table_schema(table_name)
+        self.insert_many(table_name, [values], columns)
+
+    def check_insert_values(self, tableSchema : TableSchema, values : list, columns : list) -> list:
+        """Validate a row against the table and return it in the table's column order"""
         table_columns = [column.name for column in tableSchema.columns]
 
         if columns and sorted(columns) != sorted(table_columns):
@@ -427,28 +669,80 @@ class DBManager:
             if tableSchema.columns[i].data_type == DataType.VARCHAR:
                 if len(value) > tableSchema.columns[i].varchar_length:
                     self.error(f"varchar value '{value}' exceeds column's varchar length")
-
-        record = Record(tableSchema, reordered_values)
-        record_file = RecordFile(tableSchema)
-        pos = record_file.append(record)
+        return reordered_values
+
+    def check_unique_composite(self, tableSchema : TableSchema, composite : CompositeIndex, rows : list[list]) -> None:
+        """Reject rows repeating the values of a HASH composite index, among
+        themselves or with a row already in the table"""
+        index = self.get_composite_index(tableSchema, composite)
+        keys = set()
+        for values in rows:
+            key = index.row_key(values)
+            if key in keys or index.contains(values):
+                self.error(f"HASH index on ({', '.join(composite.columns)}) requires unique values, {tuple(index.key.decode(key))} is repeated")
+            keys.add(key)
+
+    def insert_many(self, table_name:str, rows: list[list], columns: list):
+        """Insert a batch of rows: every row is validated before anything is
+        written, the records are appended in one go and each index then gets
+        its (pos, key) pairs sorted by key"""
+        tableSchema: TableSchema = self.get_table_schema(table_name)
+        records = [Record(tableSchema, self.check_insert_values(tableSchema, values, columns)) for values in rows]
+        for composite in tableSchema.composite_indexes:
+            if composite.index_type == IndexType.HASH:
+                self.check_unique_composite(tableSchema, composite, [record.values for record in records])
+        record_file = self.get_record_file(tableSchema)
+        statistics = self.get_statistics(tableSchema)
+        positions = record_file.append_many(records)
 
         for i, column in enumerate(tableSchema.columns):
             index = self.get_index(tableSchema, column.name)
             if index:
-                index.insert(pos, record.values[i])
+                batch = sorted(zip((record.values[i] for record in records), positions))
+                if column.index_type == IndexType.BTREE and index.isEmpty():
+                    index.bulk_load(batch)
+                    continue
+                if column.index_type == IndexType.BITMAP:
+                    index.insert_many(batch)
+                    continue
+                for key, pos in batch:
+                    index.insert(pos, key)
+        for composite in tableSchema.composite_indexes:
+            self.get_composite_index(tableSchema, composite).insert_many(zip((record.values for record in records), positions))
+        statistics.inserted(tableSchema, self.get_heap_scan(tableSchema), positions)
+        statistics.save()
+        self.buffer.flush()
 
     def delete(self, delete_schema : DeleteSchema) -> None:
         table = self.get_table_schema(delete_schema.table_name)
+        statistics = self.get_statistics(table)
         bitmap = self.select_condition(table, delete_schema.condition_schema.condition)
         result = self.retrieve_data_and_delete(table, bitmap)
-        for record in result:
-            for pos, value in enumerate(record.values):
-                index = self.get_index(table, table.columns[pos].name)
-                index.delete(value)
-
-    def create_index(self, table_name : str, index_name : str, columns : list[str], index_type : IndexType = None):
-        if len(columns) > 1:
-            self.error(f"Index on more than one column not supported")
+        bitmap_deletes = {}
+        for pos, record in result:
+            for i, value in enumerate(record.values):
+                column = table.columns[i]
+                index = self.get_index(table, column.name)
+                if column.index_type == IndexType.BTREE:
+                    index.delete(value, pos)
+                elif column.index_type == IndexType.BITMAP:
+                    bitmap_deletes.setdefault(column.name, []).append((value, pos))
+                else:
+                    index.delete(value)
+        for column_name, pairs in bitmap_deletes.items():
+            self.get_index(table, column_name).delete_many(pairs)
+        for composite in table.composite_indexes:
+            index = self.get_composite_index(table, composite)
+            for pos, record in result:
+                index.delete(record.values, pos)
+        statistics.removed(len(result))
+        statistics.save()
+        self.buffer.flush()
+
+    def create_index(self, table_name : str, index_name : str, columns : list[str], index_type : IndexType = None, include : list[str] = None):
+        if len(columns) > 1 or include:
+            self.create_composite_index(table_name, index_name, columns, index_type, include)
+            return
         column_name = columns[0]
         table_schema = self.get_table_schema(table_name)
         column = None
@@ -475,32 +769,84 @@ class DBManager:
         column.index_type = index_type
         column.index_name = index_name
 
-        self.get_index(table_schema, column_name)
+        # the cached NoIndex of the column would keep serving it otherwise
+        self.indexes.pop(f"{table_name}.{column_name}", None)
+        index_structure = self.get_index(table_schema, column_name)
 
         path = f"{self.tables_path}/{table_name}"
         self.save_table_schema(table_schema, path)
 
-        record_file = RecordFile(table_schema)
-        pos = 0
-        max_pos = record_file.max_id()
+        record_file = self.get_record_file(table_schema)
 
-        indexes = table_schema.get_indexes()
         column_index = table_schema.columns.index(column)
-        index_structure = indexes[column.name]
         print(index_type)
         if index_type == IndexType.ISAM:
             index_structure.build_index()
             test_isam_integrity(index_structure)
+        elif index_type == IndexType.BRIN:
+            index_structure.build()
         else:
-            while pos < max_pos:
-                record = record_file.read(pos)
-                if record is not None:
-                    value = record.values[column_index]
-                    index_structure.insert(pos, value)
-                pos += 1
+            batch = [(record.values[column_index], pos) for pos, record in record_file]
+            if index_type == IndexType.BTREE:
+                index_structure.bulk_load(sorted(batch))
+            elif index_type == IndexType.BITMAP:
+                index_structure.insert_many(batch)
+            else:
+                for key, pos in batch:
+                    index_structure.insert(pos, key)
+        self.buffer.flush()
             
+    def create_composite_index(self, table_name : str, index_name : str, columns : list[str], index_type : IndexType = None, include : list[str] = None):
+        table_schema = self.get_table_schema(table_name)
+        include = include if include else []
+        for column_name in columns + include:
+            column = table_schema.get_column_by_name(column_name)
+            if not column:
+                self.error(f"column with name '{column_name}' doesn't exist")
+            if column.data_type == DataType.POINT:
+                self.error(f"composite index not supported for POINT data type")
+        if len(set(columns + include)) != len(columns + include):
+            self.error(f"the index can't have the same column more than once")
+        if index_type == None:
+            index_type = IndexType.BTREE
+        if include and index_type != IndexType.BTREE:
+            self.error(f"INCLUDE columns not supported for {index_type} indexes")
+        if index_type not in (IndexType.BTREE, IndexType.HASH):
+            self.error(f"{index_type} index not supported on more than one column")
+        if any(column.index_name == index_name for column in table_schema.columns) or table_schema.get_composite_index(index_name):
+            self.error(f"index with name '{index_name}' already exists")
+        if any(index.columns == columns for index in table_schema.composite_indexes):
+            self.error(f"columns already have an index")
+        if index_type == IndexType.HASH:
+            # the extendible hash can't hold many entries under one key
+            fields = [table_schema.columns.index(table_schema.get_column_by_name(name)) for name in columns]
+            seen = set()
+            for _, record in self.get_record_file(table_schema):
+                key = tuple(record.values[i] for i in fields)
+                if key in seen:
+                    self.error(f"HASH index on ({', '.join(columns)}) requires unique values, {key} is repeated")
+                seen.add(key)
+
+        composite = CompositeIndex(index_name, columns, index_type, include)
+        table_schema.composite_indexes.append(composite)
+        index_structure = self.get_composite_index(table_schema, composite)
+
+        path = f"{self.tables_path}/{table_name}"
+        self.save_table_schema(table_schema, path)
+
+        record_file = self.get_record_file(table_schema)
+        index_structure.insert_many((record.values, pos) for pos, record in record_file)
+        self.buffer.flush()
+
     def drop_index(self, table_name : str, index_name : str) -> None:
         table_schema = self.get_table_schema(table_name)
+        composite = table_schema.get_composite_index(index_name)
+        if composite:
+            self.get_composite_index(table_schema, composite).clear()
+            self.indexes.pop(f"{table_name}.{'+'.join(composite.key_columns())}", None)
+            table_schema.composite_indexes.remove(composite)
+            self.save_table_schema(table_schema, f"{self.tables_path}/{table_schema.table_name}")
+            return
         for column in table_schema.columns:
             if column.index_name == index_name:
                 index = self.get_index(table_schema, column.name)
@@ -509,6 +855,7 @@ class DBManager:
                 if column.is_primary:
                     self.error("Cannot drop the primary key's index")
                 index.clear()
+                self.indexes.pop(f"{table_name}.{column.name}", None)
                 column.index_type = IndexType.NONE
                 column.index_name = None
                 path = f"{self.tables_path}/{table_schema.table_name}"
@@ -516,6 +863,24 @@ class DBManager:
                 return
         self.error(f"Index with name '{index_name}' on table '{table_name}' doesn't exist")
 
+    def vacuum_index(self, table_name : str, index_name : str) -> None:
+        table_schema = self.get_table_schema(table_name)
+        composite = table_schema.get_composite_index(index_name)
+        if composite:
+            if composite.index_type != IndexType.BTREE:
+                self.error(f"VACUUM INDEX not supported for {composite.index_type} indexes")
+            self.get_composite_index(table_schema, composite).vacuum()
+            self.buffer.flush()
+            return
+        for column in table_schema.columns:
+            if column.index_name == index_name:
+                if column.index_type != IndexType.BTREE:
+                    self.error(f"VACUUM INDEX not supported for {column.index_type} indexes")
+                self.get_index(table_schema, column.name).vacuum()
+                self.buffer.flush()
+                return
+        self.error(f"Index with name '{index_name}' on table '{table_name}' doesn't exist")
+
     def import_csv(self, table_name: str, csv_path: str):
         table_schema: TableSchema = self.get_table_schema(table_name)
 
@@ -531,6 +896,7 @@ class DBManager:
                 table_schema.get_column_by_name(col_name).data_type for col_name in header
             ]
 
+            batch = []
             for row_num, row in enumerate(reader, start=2):
                 if not row or all(cell.strip() == '' for cell in row):
                     continue
@@ -540,6 +906,12 @@ class DBManager:
                         utils.convert_value(value, col_type)
                         for value, col_type in zip(row, column_types)
                     ]
-                    self.insert(table_name, converted, header)
+                    self.check_insert_values(table_schema, converted, header)
                 except Exception as e:
                     raise RuntimeError(f"Error en fila {row_num}: {e}")
+                batch.append(converted)
+                if len(batch) == CSV_BATCH_SIZE:
+                    self.insert_many(table_name, batch, header)
+                    batch = []
+            if batch:
+                self.insert_many(table_name, batch, header)
@@ -0,0 +1,83 @@
+import os, sys, atexit, threading
+root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if root_path not in sys.path:
+    sys.path.append(root_path)
+
+import logger
+
+
+class FilePool:
+    """Process-wide pool of open file descriptors keyed by path.
+
+    Every file is opened once and its descriptor is shared by all readers and
+    writers. I/O is positional (os.pread/os.pwrite) so no shared file offset
+    has to be protected between callers.
+    """
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(FilePool, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self.fds : dict[str, int] = {}
+        self.lock = threading.RLock()
+        self.logger = logger.CustomLogger("FILEPOOL")
+        atexit.register(self.close_all)
+        self._initialized = True
+
+    @staticmethod
+    def _key(path : str) -> str:
+        return os.path.abspath(path)
+
+    def get(self, path : str) -> int:
+        """Return the shared descriptor of a file, opening (or creating) it on first use"""
+        key = self._key(path)
+        fd = self.fds.get(key)
+        if fd is None:
+            with self.lock:
+                fd = self.fds.get(key)
+                if fd is None:
+                    fd = os.open(key, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0))
+                    self.fds[key] = fd
+        return fd
+
+    def pread(self, path : str, size : int, offset : int) -> bytes:
+        fd = self.get(path)
+        if hasattr(os, "pread"):
+            return os.pread(fd, size, offset)
+        with self.lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            return os.read(fd, size)
+
+    def pwrite(self, path : str, data : bytes, offset : int) -> int:
+        fd = self.get(path)
+        if hasattr(os, "pwrite"):
+            return os.pwrite(fd, data, offset)
+        with self.lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            return os.write(fd, data)
+
+    def size(self, path : str) -> int:
+        return os.fstat(self.get(path)).st_size
+
+    def truncate(self, path : str, size : int = 0) -> None:
+        os.ftruncate(self.get(path), size)
+
+    def close(self, path : str) -> None:
+        """Close the descriptor of a file, or of every file inside a directory"""
+        with self.lock:
+            key = self._key(path)
+            prefix = key + os.sep
+            for fd_key in [k for k in self.fds if k == key or k.startswith(prefix)]:
+                os.close(self.fds.pop(fd_key))
+
+    def close_all(self) -> None:
+        with self.lock:
+            for fd in self.fds.values():
+                os.close(fd)
+            self.fds.clear()
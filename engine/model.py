@@ -24,6 +24,8 @@ class IndexType(Enum):
     RTREE = auto()
     BRIN = auto()
     NONE = auto()
+    # after NONE, metadata.dat pickles index types by value
+    BITMAP = auto()
 
     def __str__(self):
         return self.name
@@ -37,14 +39,45 @@ class Column:
         self.index_name = index_name
         self.varchar_length = varchar_length
 
+class CompositeIndex:
+    """Index keyed on the tuple of values of several columns, in order. The
+    include columns are stored after them in the key only to be read back."""
+    def __init__(self, name : str, columns : list[str], index_type = IndexType.BTREE, include : list[str] = None):
+        self.name = name
+        self.columns = columns
+        self.index_type = index_type
+        self.include = include if include else []
+
+    def key_columns(self) -> list[str]:
+        return self.columns + self.include
+
 class TableSchema:
-    def __init__(self, table_name: str = None, columns: list[Column] = None):
+    def __init__(self, table_name: str = None, columns: list[Column] = None, composite_indexes: list[CompositeIndex] = None):
         self.table_name = table_name.lower() if table_name else None
         self.columns = columns if columns else []
+        self.composite_indexes = composite_indexes if composite_indexes else []
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_codec", None)
+        return state
+
+    def __setstate__(self, state):
+        # tables saved before composite indexes existed
+        state.setdefault("composite_indexes", [])
+        self.__dict__.update(state)
 
     def error(self, error : str):
         raise RuntimeError(error)
 
+    def get_codec(self):
+        """Compiled record layout of the table, built on first use"""
+        codec = self.__dict__.get("_codec")
+        if codec is None:
+            from engine.record import RecordCodec
+            codec = self._codec = RecordCodec(self)
+        return codec
+
     def get_primary_key(self):
         return next((col for col in self.columns if col.is_primary), None)
 
@@ -53,6 +86,9 @@ class TableSchema:
 
     def get_column_by_name(self, name: str):
         return next((col for col in self.columns if col.name == name), None)
+
+    def get_composite_index(self, name: str):
+        return next((index for index in self.composite_indexes if index.name == name), None)
     
     def get_indexes(self):
         indexes = {}
@@ -79,7 +115,11 @@ class TableSchema:
                 from indexes.Rtree import RTreeIndex
                 return RTreeIndex(self, column)
             case IndexType.BRIN:
-                pass
+                from indexes.brin import BRINIndex
+                return BRINIndex(self, column)
+            case IndexType.BITMAP:
+                from indexes.bitmapindex import BitmapIndex
+                return BitmapIndex(self, column)
             case IndexType.NONE:
                 return None
             case _:
@@ -0,0 +1,294 @@
+"""Access path selection for WHERE conditions.
+
+A conjunction is not evaluated predicate by predicate any more: the most
+selective predicate that an index can answer is probed first and every
+other predicate is checked as a filter over the rows it fetched, the way
+System R plans a single table access. Without any usable index the whole
+condition is compiled into one predicate over the rows and evaluated in
+a single sequential pass of the heap.
+
+Selectivities come from the table statistics: equality matches 1/NDV of
+the rows and ranges are read off the equi-depth histograms. Without them
+the System R defaults are used. A unique column matches one row on
+equality.
+
+Predicates over BITMAP indexed columns are always probed: their bitmaps are
+combined as they are, which is cheaper than checking them over fetched rows.
+
+A composite index competes with the single column ones as a whole: the
+equalities on a leftmost prefix of its columns and the range on the next
+one are answered by one probe of it. When that probe answers the whole
+condition and the key holds every selected column the query is answered
+from the index alone.
+"""
+import os, sys
+import numpy as np
+root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if root_path not in sys.path:
+    sys.path.append(root_path)
+
+from engine.model_condition import Condition, BinaryCondition, BetweenCondition, NotCondition, BooleanColumn, BinaryOp
+from engine.model import DataType, TableSchema, Column, CompositeIndex, IndexType
+from engine.scan import HeapScan
+from engine.statistics import TableStatistics, ColumnStatistics
+from engine import utils
+
+EQ_SELECTIVITY = 1 / 10
+RANGE_SELECTIVITY = 1 / 3
+BETWEEN_SELECTIVITY = 1 / 4
+SPATIAL_SELECTIVITY = 1 / 10
+DEFAULT_SELECTIVITY = 1 / 2
+
+COMPARISONS = {
+    BinaryOp.EQ: np.equal,
+    BinaryOp.NEQ: np.not_equal,
+    BinaryOp.LT: np.less,
+    BinaryOp.GT: np.greater,
+    BinaryOp.LE: np.less_equal,
+    BinaryOp.GE: np.greater_equal,
+}
+
+# operations every index type answers without reading the whole table
+INDEX_ACCESS = {
+    IndexType.AVL: (BinaryOp.EQ, BinaryOp.LT, BinaryOp.GT, BinaryOp.LE, BinaryOp.GE, BetweenCondition),
+    IndexType.BTREE: (BinaryOp.EQ, BinaryOp.LT, BinaryOp.GT, BinaryOp.LE, BinaryOp.GE, BetweenCondition),
+    IndexType.ISAM: (BinaryOp.EQ, BinaryOp.LT, BinaryOp.GT, BinaryOp.LE, BinaryOp.GE, BetweenCondition),
+    IndexType.HASH: (BinaryOp.EQ,),
+    IndexType.BRIN: (BinaryOp.EQ, BinaryOp.LT, BinaryOp.GT, BinaryOp.LE, BinaryOp.GE, BetweenCondition),
+    IndexType.BITMAP: (BinaryOp.EQ, BinaryOp.NEQ, BinaryOp.LT, BinaryOp.GT, BinaryOp.LE, BinaryOp.GE, BetweenCondition),
+    IndexType.RTREE: (BinaryOp.EQ, BinaryOp.WR, BinaryOp.WC, BinaryOp.KNN),
+}
+
+
+def conjuncts(condition : Condition) -> list[Condition]:
+    """Predicates of a chain of ANDs, the condition itself otherwise"""
+    if type(condition) == BinaryCondition and condition.op == BinaryOp.AND:
+        return conjuncts(condition.left) + conjuncts(condition.right)
+    return [condition]
+
+
+def find_column(table_schema : TableSchema, column_name : str) -> Column | None:
+    return next((column for column in table_schema.columns if column.name == column_name), None)
+
+
+def is_comparison(condition : Condition) -> bool:
+    return type(condition) == BinaryCondition and condition.op not in (BinaryOp.AND, BinaryOp.OR)
+
+
+def leaf_column(table_schema : TableSchema, condition : Condition) -> Column | None:
+    if is_comparison(condition) or type(condition) == BetweenCondition:
+        return find_column(table_schema, condition.left.column_name)
+    return None
+
+
+def has_index_access(table_schema : TableSchema, condition : Condition) -> bool:
+    """Whether condition is a single predicate its column's index can answer"""
+    column = leaf_column(table_schema, condition)
+    if column == None:
+        return False
+    access = INDEX_ACCESS.get(column.index_type, ())
+    return (condition.op if is_comparison(condition) else BetweenCondition) in access
+
+
+def is_bitmap_answerable(table_schema : TableSchema, condition : Condition) -> bool:
+    """Whether condition only combines predicates over BITMAP indexed columns"""
+    if type(condition) == BinaryCondition and condition.op in (BinaryOp.AND, BinaryOp.OR):
+        return is_bitmap_answerable(table_schema, condition.left) and is_bitmap_answerable(table_schema, condition.right)
+    if type(condition) == NotCondition:
+        return is_bitmap_answerable(table_schema, condition.condition)
+    if type(condition) == BooleanColumn:
+        column = find_column(table_schema, condition.column_name)
+        return column != None and column.index_type == IndexType.BITMAP
+    column = leaf_column(table_schema, condition)
+    return column != None and column.index_type == IndexType.BITMAP and has_index_access(table_schema, condition)
+
+
+class CompositeProbe:
+    """Lookup of a composite index: equality with prefix on its first
+    columns and, when lo or hi are set, an inclusive range on the next one.
+    predicates are the conditions it was built from, exact those it answers
+    without checking the rows again (strict ranges are fetched inclusive)."""
+    def __init__(self, index : CompositeIndex, prefix : list, lo, hi, predicates : list[Condition], exact : list[Condition]):
+        self.index = index
+        self.prefix = prefix
+        self.lo = lo
+        self.hi = hi
+        self.predicates = predicates
+        self.exact = exact
+
+    def is_full_key(self) -> bool:
+        return len(self.prefix) == len(self.index.columns)
+
+
+def _key_value(column : Column, value) -> bool:
+    """Whether value fits in the composite key of column"""
+    if utils.get_data_type(value) != column.data_type:
+        return False
+    if column.data_type == DataType.INT:
+        return -2**31 <= value < 2**31
+    if column.data_type == DataType.VARCHAR:
+        return len(value.encode()) <= column.varchar_length
+    return True
+
+
+def match_composite(table_schema : TableSchema, index : CompositeIndex, predicates : list[Condition]) -> CompositeProbe | None:
+    """Probe of index for the longest leftmost prefix of its columns the
+    predicates fix with equalities, plus the range they put on the next
+    column. Hash indexes only match when every column is fixed."""
+    prefix, covered = [], []
+    for name in index.columns:
+        column = find_column(table_schema, name)
+        equality = next((c for c in predicates if is_comparison(c) and c.op == BinaryOp.EQ and c.left.column_name == name and _key_value(column, c.right.value)), None)
+        if equality is None:
+            break
+        prefix.append(equality.right.value)
+        covered.append(equality)
+    exact = list(covered)
+    lows, highs = [], []
+    if len(prefix) < len(index.columns):
+        if index.index_type == IndexType.HASH:
+            return None
+        name = index.columns[len(prefix)]
+        column = find_column(table_schema, name)
+        for c in predicates:
+            if type(c) == BetweenCondition and c.left.column_name == name and _key_value(column, c.mid.value) and _key_value(column, c.right.value):
+                lows.append(c.mid.value)
+                highs.append(c.right.value)
+            elif is_comparison(c) and c.op in (BinaryOp.LT, BinaryOp.LE, BinaryOp.GT, BinaryOp.GE) and c.left.column_name == name and _key_value(column, c.right.value):
+                (lows if c.op in (BinaryOp.GT, BinaryOp.GE) else highs).append(c.right.value)
+            else:
+                continue
+            covered.append(c)
+            if not (is_comparison(c) and c.op in (BinaryOp.LT, BinaryOp.GT)):
+                exact.append(c)
+    if not covered:
+        return None
+    return CompositeProbe(index, prefix, max(lows) if lows else None, min(highs) if highs else None, covered, exact)
+
+
+def composite_probes(table_schema : TableSchema, predicates : list[Condition]) -> list[CompositeProbe]:
+    """Probes of every composite index of the table the predicates can use"""
+    probes = [match_composite(table_schema, index, predicates) for index in table_schema.composite_indexes]
+    return [probe for probe in probes if probe is not None]
+
+
+def covering_probe(table_schema : TableSchema, condition : Condition, column_names : list[str]) -> CompositeProbe | None:
+    """Probe of a composite B+Tree that answers the whole condition and whose
+    key holds every one of column_names, so the rows need not be read"""
+    predicates = conjuncts(condition)
+    for probe in composite_probes(table_schema, predicates):
+        if probe.index.index_type != IndexType.BTREE or not set(column_names) <= set(probe.index.key_columns()):
+            continue
+        if all(any(c is exact for exact in probe.exact) for c in predicates):
+            return probe
+    return None
+
+
+def is_filterable(table_schema : TableSchema, condition : Condition) -> bool:
+    """Whether condition can be evaluated over fetched rows. Spatial
+    predicates always go through their index, and so does anything
+    select_condition would reject, to keep its error messages."""
+    if type(condition) == BinaryCondition and condition.op in (BinaryOp.AND, BinaryOp.OR):
+        return is_filterable(table_schema, condition.left) and is_filterable(table_schema, condition.right)
+    if type(condition) == NotCondition:
+        return is_filterable(table_schema, condition.condition)
+    column = leaf_column(table_schema, condition)
+    if column == None or column.data_type == DataType.POINT:
+        return False
+    if type(condition) == BetweenCondition:
+        values = (condition.mid.value, condition.right.value)
+    elif condition.op in COMPARISONS:
+        values = (condition.right.value,)
+    else:
+        return False
+    return all(utils.get_data_type(value) == column.data_type for value in values)
+
+
+def _fraction_le(column : Column, column_statistics : ColumnStatistics | None, value) -> float | None:
+    if column_statistics is None or utils.get_data_type(value) != column.data_type:
+        return None
+    return column_statistics.fraction_le(value)
+
+
+def _equality(column : Column, column_statistics : ColumnStatistics | None, rows : int) -> float:
+    if column.is_primary:
+        return 1 / max(rows, 1)
+    ndv = column_statistics.ndv() if column_statistics is not None else 0
+    return 1 / ndv if ndv > 0 else EQ_SELECTIVITY
+
+
+def selectivity(table_schema : TableSchema, condition : Condition, statistics : TableStatistics | None) -> float:
+    """Estimated fraction of the rows that satisfy condition"""
+    if type(condition) == BinaryCondition and condition.op == BinaryOp.AND:
+        return selectivity(table_schema, condition.left, statistics) * selectivity(table_schema, condition.right, statistics)
+    if type(condition) == BinaryCondition and condition.op == BinaryOp.OR:
+        left, right = selectivity(table_schema, condition.left, statistics), selectivity(table_schema, condition.right, statistics)
+        return left + right - left * right
+    if type(condition) == NotCondition:
+        return 1 - selectivity(table_schema, condition.condition, statistics)
+    column = leaf_column(table_schema, condition)
+    if column == None:
+        return DEFAULT_SELECTIVITY
+    rows = statistics.live if statistics is not None else 0
+    column_statistics = statistics.column(column.name) if statistics is not None else None
+    if type(condition) == BetweenCondition:
+        lo = _fraction_le(column, column_statistics, condition.mid.value)
+        hi = _fraction_le(column, column_statistics, condition.right.value)
+        if lo is None or hi is None:
+            return BETWEEN_SELECTIVITY
+        return min(1, max(0, hi - lo) + _equality(column, column_statistics, rows))
+    match condition.op:
+        case BinaryOp.EQ | BinaryOp.NEQ:
+            eq = _equality(column, column_statistics, rows)
+            return eq if condition.op == BinaryOp.EQ else 1 - eq
+        case BinaryOp.LT | BinaryOp.LE | BinaryOp.GT | BinaryOp.GE:
+            fraction = _fraction_le(column, column_statistics, condition.right.value)
+            if fraction is None:
+                return RANGE_SELECTIVITY
+            return fraction if condition.op in (BinaryOp.LT, BinaryOp.LE) else 1 - fraction
+        case BinaryOp.WR | BinaryOp.WC:
+            return SPATIAL_SELECTIVITY
+        case BinaryOp.KNN:
+            return min(1, condition.right.value[2] / max(rows, 1)) if utils.get_data_type(condition.right.value) == "knn" else DEFAULT_SELECTIVITY
+    return DEFAULT_SELECTIVITY
+
+
+def plan_conjunction(table_schema : TableSchema, predicates : list[Condition], statistics : TableStatistics | None) -> tuple[list[Condition], list[Condition]]:
+    """Split the predicates of a conjunction in (probes, filters): probes are
+    answered by their index, most selective first, filters are checked over
+    the rows the probes fetched. A probe may be a CompositeProbe standing for
+    several predicates. No probes means a sequential scan."""
+    cost = lambda condition: selectivity(table_schema, condition, statistics)
+    indexed = [c for c in predicates if has_index_access(table_schema, c) or not is_filterable(table_schema, c)]
+    driver = min(indexed, key=cost) if indexed else None
+    composite_cost = lambda probe: float(np.prod([cost(c) for c in probe.predicates]))
+    composite = min(composite_probes(table_schema, predicates), key=composite_cost, default=None)
+    if composite is not None and (driver is None or composite_cost(composite) <= cost(driver)):
+        probes = [c for c in predicates if not is_filterable(table_schema, c) or is_bitmap_answerable(table_schema, c)]
+        answered = probes + composite.exact
+        filters = [c for c in predicates if not any(c is probe for probe in answered)]
+        return [composite] + sorted(probes, key=cost), filters
+    probes = [c for c in predicates if c is driver or not is_filterable(table_schema, c) or is_bitmap_answerable(table_schema, c)]
+    filters = [c for c in predicates if not any(c is probe for probe in probes)]
+    return sorted(probes, key=cost), filters
+
+
+def compile_condition(scan : HeapScan, table_schema : TableSchema, condition : Condition):
+    """Turn a condition accepted by is_filterable into a single function from
+    heap rows to the mask of the rows that satisfy it. Columns, operators
+    and values are resolved here once, not for every batch of rows."""
+    if type(condition) == BinaryCondition and condition.op in (BinaryOp.AND, BinaryOp.OR):
+        left = compile_condition(scan, table_schema, condition.left)
+        right = compile_condition(scan, table_schema, condition.right)
+        if condition.op == BinaryOp.AND:
+            return lambda rows: left(rows) & right(rows)
+        return lambda rows: left(rows) | right(rows)
+    if type(condition) == NotCondition:
+        inner = compile_condition(scan, table_schema, condition.condition)
+        return lambda rows: ~inner(rows)
+    column = leaf_column(table_schema, condition)
+    if type(condition) == BetweenCondition:
+        lo = scan.comparison(column, np.greater_equal, condition.mid.value)
+        hi = scan.comparison(column, np.less_equal, condition.right.value)
+        return lambda rows: lo(rows) & hi(rows)
+    return scan.comparison(column, COMPARISONS[condition.op], condition.right.value)
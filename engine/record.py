@@ -1,17 +1,107 @@
 import struct
 from engine.model import TableSchema, DataType
 from engine import utils
+from engine.buffer import BufferManager
 import logger
 import os
+import mmap
+
+def _decode_varchar(value: bytes) -> str:
+	return value.decode().strip("\x00")
+
+def _decode_float(value: float) -> float:
+	return round(float(value), 6)
+
+_loggers = {}
+
+def _logger(name: str) -> logger.CustomLogger:
+	"""One logger per name, records and nodes are too many to build one each"""
+	if name not in _loggers:
+		_loggers[name] = logger.CustomLogger(name)
+	return _loggers[name]
+
+
+class RecordCodec:
+	"""Compiled layout of a TableSchema, built once and cached on the schema
+
+	Holds the prebuilt struct.Struct of a record and of the next_del field of
+	a FreeListNode together with the per-column encoders and decoders, so rows
+	are packed and unpacked without recomputing the format string.
+	"""
+	NEXT_DEL = struct.Struct("i")
+
+	def __init__(self, schema: TableSchema):
+		self.format = utils.calculate_record_format(schema.columns)
+		self.struct = struct.Struct(self.format)
+		self.size = self.struct.size
+		self.node_size = self.size + self.NEXT_DEL.size
+		self.types = [col.data_type for col in schema.columns]
+		self.has_point = DataType.POINT in self.types
+		self.decoders = []
+		self.encoders = []
+		for col in schema.columns:
+			if col.data_type == DataType.VARCHAR:
+				self.decoders.append(_decode_varchar)
+				self.encoders.append(lambda val, length=col.varchar_length: utils.pad_str(val, length))
+			elif col.data_type in (DataType.FLOAT, DataType.POINT):
+				self.decoders.append(_decode_float)
+				self.encoders.append(None)
+			else:
+				self.decoders.append(None)
+				self.encoders.append(None)
+
+	def pack(self, values: list) -> bytes:
+		if not self.has_point:
+			return self.struct.pack(*[val if enc is None else enc(val) for enc, val in zip(self.encoders, values)])
+		packed = []
+		for enc, val, data_type in zip(self.encoders, values, self.types):
+			if data_type == DataType.POINT:
+				packed.extend(val)
+			else:
+				packed.append(val if enc is None else enc(val))
+		return self.struct.pack(*packed)
+
+	def decode(self, raw: tuple) -> list:
+		"""Turn the flat tuple returned by the struct into column values"""
+		if not self.has_point:
+			return [val if dec is None else dec(val) for dec, val in zip(self.decoders, raw)]
+		values = []
+		i = 0
+		for dec, data_type in zip(self.decoders, self.types):
+			if data_type == DataType.POINT:
+				values.append((dec(raw[i]), dec(raw[i+1])))
+				i += 2
+			else:
+				values.append(raw[i] if dec is None else dec(raw[i]))
+				i += 1
+		return values
+
+	def unpack_from(self, buffer, offset: int = 0) -> list:
+		return self.decode(self.struct.unpack_from(buffer, offset))
+
+	def unpack_next_del(self, buffer, offset: int = 0) -> int:
+		return self.NEXT_DEL.unpack_from(buffer, offset + self.size)[0]
+
 
 class Record:
+	__slots__ = ("schema", "values", "id")
+
 	def __init__(self, schema: TableSchema, values: list):
 		self.schema = schema
 		self.values = values
 		self.id = values[0]
-		self.format = utils.calculate_record_format(schema.columns)
-		self.size = struct.calcsize(self.format)
-		self.logger = logger.CustomLogger(f"RECORD-{schema.table_name}".upper())
+
+	@property
+	def format(self) -> str:
+		return self.schema.get_codec().format
+
+	@property
+	def size(self) -> int:
+		return self.schema.get_codec().size
+
+	@property
+	def logger(self):
+		return _logger(f"RECORD-{self.schema.table_name}".upper())
 
 	def debug(self):
 		attrs = [
@@ -22,43 +112,15 @@ class Record:
 		self.logger.debug(debug_msg)
 
 	def pack(self):
-		packed = []
-		for col, val in zip(self.schema.columns, self.values):
-			if col.data_type == DataType.POINT:
-				packed.append(val[0])
-				packed.append(val[1])
-			elif col.data_type == DataType.VARCHAR:
-				packed.append(utils.pad_str(val, col.varchar_length))
-			else:
-				packed.append(val)
-		return struct.pack(self.format, *packed)
+		return self.schema.get_codec().pack(self.values)
 
 	@classmethod
 	def unpack(cls, schema:TableSchema, raw_bytes):
-		format = utils.calculate_record_format(schema.columns)
-		values = list(struct.unpack(format, raw_bytes))
-		final_values = []
-		i = 0
-		col_idx = 0
-		while col_idx < len(schema.columns):
-			col = schema.columns[col_idx]
-			if col.data_type == DataType.VARCHAR:
-				final_values.append(values[i].decode().strip("\x00"))
-				i += 1
-			elif col.data_type == DataType.FLOAT:
-				final_values.append(round(float(values[i]), 6))
-				i += 1
-			elif col.data_type == DataType.POINT:
-				x = round(float(values[i]), 6)
-				y = round(float(values[i+1]), 6)
-				final_values.append((x, y))
-				i += 2
-			else:
-				final_values.append(values[i])
-				i += 1
-			col_idx += 1
+		return cls.unpack_from(schema, raw_bytes)
 
-		return cls(schema, final_values)
+	@classmethod
+	def unpack_from(cls, schema:TableSchema, buffer, offset:int = 0):
+		return cls(schema, schema.get_codec().unpack_from(buffer, offset))
 
 	def __str__(self):
 		attrs = [
@@ -69,10 +131,15 @@ class Record:
 
 
 class FreeListNode:
+	__slots__ = ("record", "next_del")
+
 	def __init__(self, record: Record, next_del=-2):
 		self.record = record
 		self.next_del = next_del
-		self.logger = logger.CustomLogger(f"FREELIST-NODE-{record.schema.table_name}".upper())
+
+	@property
+	def logger(self):
+		return _logger(f"FREELIST-NODE-{self.record.schema.table_name}".upper())
 
 	def debug(self):
 		self.logger.debug(f"FreeListNode: {self.record.id} -> {self.next_del}")
@@ -80,95 +147,125 @@ class FreeListNode:
 	@classmethod
 	def get_node_size(cls, schema:TableSchema):
 		"""Calculate the size of a FreeListNode"""
-		return struct.calcsize(utils.calculate_record_format(schema.columns)) + 4
+		return schema.get_codec().node_size
 
 	def pack(self):
-		return self.record.pack() + struct.pack("i", self.next_del)
+		return self.record.pack() + RecordCodec.NEXT_DEL.pack(self.next_del)
 
 	@classmethod
 	def unpack(cls, schema:TableSchema, raw_bytes):
-		record = Record.unpack(schema, raw_bytes[:-4])
-		next_del = struct.unpack("i", raw_bytes[-4:])[0]
-		return cls(record, next_del)
-
+		return cls.unpack_from(schema, raw_bytes)
 
+	@classmethod
+	def unpack_from(cls, schema:TableSchema, buffer, offset:int = 0):
+		codec = schema.get_codec()
+		record = Record(schema, codec.unpack_from(buffer, offset))
+		return cls(record, codec.unpack_next_del(buffer, offset))
 
 
 class RecordFile:
-	"""HeapFile with Free List for deleted records"""
+	"""HeapFile with Free List for deleted records
+
+	With use_mmap the file is read through a read-only memory map instead of
+	the buffer pool, and every write is flushed right away so the map sees it.
+	"""
 	HEADER_FORMAT = "i"
 	HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
 	HEADER:int
 
-	def __init__(self, schema: TableSchema):
+	def __init__(self, schema: TableSchema, use_mmap: bool = False):
 		self.filename = utils.get_record_file_path(schema.table_name)
 		self.schema = schema
 		self.node_size = FreeListNode.get_node_size(schema)
+		self.buffer = BufferManager()
+		self.use_mmap = use_mmap
+		self._map = None
+		self._view = None
+		self._map_size = 0
 		self.logger = logger.CustomLogger(f"RECORDFILE-{schema.table_name}".upper())
 		
 		if not os.path.exists(self.filename):
 			self.logger.fileNotFound(self.filename)
-			open(self.filename, "wb").close()
+			self.buffer.create(self.filename)
 		self._initialize_file()
 
 	def _initialize_file(self):
-		with open(self.filename, "rb+") as file:
-			header = file.read(self.HEADER_SIZE)
-			if not header:
-				self.logger.fileIsEmpty(self.filename)
-				self.HEADER = -1
-				file.write(struct.pack(self.HEADER_FORMAT, self.HEADER))
-			else:
-				self.HEADER = struct.unpack(self.HEADER_FORMAT, header)[0]
+		header = self.buffer.read(self.filename, 0, self.HEADER_SIZE)
+		if not header:
+			self.logger.fileIsEmpty(self.filename)
+			self.HEADER = -1
+			self.buffer.write(self.filename, 0, struct.pack(self.HEADER_FORMAT, self.HEADER))
+		else:
+			self.HEADER = struct.unpack(self.HEADER_FORMAT, header)[0]
 
 	def _get_header(self):
 		return self.HEADER
 
 	def _set_header(self, header:int):
 		self.HEADER = header
-		with open(self.filename, "r+b") as file:
-			file.seek(0)
-			file.write(struct.pack(self.HEADER_FORMAT, self.HEADER))
-			self.logger.writingHeader(self.filename, header)
+		self.buffer.write(self.filename, 0, struct.pack(self.HEADER_FORMAT, self.HEADER))
+		self._write_through()
+		self.logger.writingHeader(self.filename, header)
 
 	def _append_node(self, record: Record) -> int:
 		"""Append a record to the end of the file and return its position"""
-		with open(self.filename, "ab") as file:
-			offset = file.tell() // self.node_size
-			node = FreeListNode(record)
-			file.write(node.pack())
-			self.logger.writingRecord(self.filename, offset, record.values[0], node.next_del)
-			return offset
+		node = FreeListNode(record)
+		offset = (self.buffer.append(self.filename, node.pack()) - self.HEADER_SIZE) // self.node_size
+		self._write_through()
+		self.logger.writingRecord(self.filename, offset, record.values[0], node.next_del)
+		return offset
 
 	def _read_node(self, pos: int) -> FreeListNode:
-		with open(self.filename, "rb") as file:
-			self.logger.readingNode(self.filename, pos)
-			file.seek(self.HEADER_SIZE + (pos * self.node_size))
-			data = file.read(self.node_size)
-			if not data:
-				self.logger.invalidPosition(self.filename, pos)
-				raise Exception(f"Invalid record position: {pos}")
-			node = FreeListNode.unpack(self.schema, data)
-			node.debug()
-			return node
+		self.logger.readingNode(self.filename, pos)
+		if self.use_mmap:
+			return self._read_mapped_node(pos)
+		data = self.buffer.read(self.filename, self.HEADER_SIZE + (pos * self.node_size), self.node_size)
+		if len(data) < self.node_size:
+			self.logger.invalidPosition(self.filename, pos)
+			raise Exception(f"Invalid record position: {pos}")
+		return FreeListNode.unpack(self.schema, data)
 
 	def _patch_node(self, pos: int, node: FreeListNode):
-		with open(self.filename, "rb+") as file:
-			offset = self.HEADER_SIZE + pos * self.node_size
-			file.seek(offset)
-			if file.tell() != offset:
-				self.logger.invalidPosition(self.filename, pos)
-				raise Exception(f"Invalid record position: {pos}")
-			file.write(node.pack())
-			self.logger.writingRecord(self.filename, pos, node.record.values[0], node.next_del)
+		if pos < 0 or pos >= self.max_id():
+			self.logger.invalidPosition(self.filename, pos)
+			raise Exception(f"Invalid record position: {pos}")
+		self.buffer.write(self.filename, self.HEADER_SIZE + pos * self.node_size, node.pack())
+		self._write_through()
+		self.logger.writingRecord(self.filename, pos, node.record.values[0], node.next_del)
 
 	def max_id(self):
-		with open(self.filename, "rb") as file:
-			file.seek(0, os.SEEK_END)
-			size = file.tell()
-			if size == 0:
-				return 0
-			return (size - self.HEADER_SIZE) // self.node_size
+		size = self.buffer.size(self.filename)
+		if size == 0:
+			return 0
+		return (size - self.HEADER_SIZE) // self.node_size
+
+	def flush(self):
+		self.buffer.flush(self.filename)
+
+	def _write_through(self):
+		if self.use_mmap:
+			self.flush()
+
+	def mapping(self) -> mmap.mmap:
+		"""Read-only map of the whole file, remapped when the file grew"""
+		if not self.use_mmap:
+			self.flush()
+		size = self.buffer.size(self.filename)
+		if self._map is None or self._map_size != size:
+			fd = self.buffer.files.get(self.filename)
+			self._map = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+			self._view = memoryview(self._map)
+			self._map_size = size
+		return self._map
+
+	def _read_mapped_node(self, pos: int) -> FreeListNode:
+		offset = self.HEADER_SIZE + pos * self.node_size
+		if pos < 0 or offset + self.node_size > self._map_size:
+			self.mapping()
+			if pos < 0 or offset + self.node_size > self._map_size:
+				self.logger.invalidPosition(self.filename, pos)
+				raise Exception(f"Invalid record position: {pos}")
+		return FreeListNode.unpack_from(self.schema, self._view, offset)
 		
 
 	def append(self, record: Record) -> int:
@@ -182,6 +279,21 @@ class RecordFile:
 		self._patch_node(tdel_pos,FreeListNode(record))
 		return tdel_pos
 	
+	def append_many(self, records: list[Record]) -> list[int]:
+		"""Append several records and return their positions, reusing the
+		deleted slots first and writing the rest as a single block"""
+		positions = []
+		i = 0
+		while i < len(records) and self._get_header() != -1:
+			positions.append(self.append(records[i]))
+			i += 1
+		if i < len(records):
+			data = b"".join(FreeListNode(record).pack() for record in records[i:])
+			first = (self.buffer.append(self.filename, data) - self.HEADER_SIZE) // self.node_size
+			self._write_through()
+			positions.extend(range(first, first + len(records) - i))
+		return positions
+
 	def read(self, pos: int) -> Record:
 		"""Read a record from the file at the given position"""
 		self.logger.warning(f"READING Record at pos {pos}")
@@ -192,6 +304,13 @@ class RecordFile:
 			self.logger.notFoundRecord(self.filename, pos)
 			return None
 	
+	def __iter__(self):
+		"""Yield (pos, record) for every live record in file order"""
+		for pos in range(self.max_id()):
+			node = self._read_node(pos)
+			if node.next_del == -2:
+				yield pos, node.record
+
 	def delete(self, pos: int)-> Record:
 		"""Delete a record at the given position and add it to the free list"""
 		self.logger.warning(f"DELETING Record at pos {pos}")
@@ -203,6 +322,8 @@ class RecordFile:
 
 	def clear(self):
 		self.logger.info("Cleaning data, removing files")
+		self._map = self._view = None
+		self.buffer.discard(self.filename)
 		os.remove(self.filename)
 
 	def __str__(self):
@@ -0,0 +1,283 @@
+"""Compressed bitmaps of record positions in the Roaring layout.
+
+Positions are split in chunks of 2^16 by their high bits and every
+non-empty chunk keeps its low 16 bits in the cheapest container:
+
+- ArrayContainer: sorted uint16 values, for at most ARRAY_MAX positions
+- BitmapContainer: 2^16 bits packed in 8 KiB, for dense chunks
+- RunContainer: [start, end) ranges, for long stretches such as the
+  result of a NOT or a wide range
+
+A bitmap also knows the size of the table it was built for, positions
+are always below it and NOT complements within it.
+"""
+import struct
+import numpy as np
+
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+CHUNK_MASK = CHUNK_SIZE - 1
+ARRAY_MAX = 4096
+PACKED_BYTES = CHUNK_SIZE // 8
+
+# serialized layout: (size, containers) then (key, kind, count) and the payload of each
+HEADER = struct.Struct("<qi")
+CONTAINER_HEADER = struct.Struct("<iBi")
+ARRAY, BITMAP, RUN = range(3)
+
+
+class ArrayContainer:
+    __slots__ = ("values",)
+
+    def __init__(self, values : np.ndarray):
+        self.values = values.astype(np.uint16, copy=False)
+
+    def cardinality(self) -> int:
+        return len(self.values)
+
+    def lows(self) -> np.ndarray:
+        return self.values.astype(np.int64)
+
+    def packed(self) -> np.ndarray:
+        bits = np.zeros(CHUNK_SIZE, dtype=np.bool_)
+        bits[self.values] = True
+        return np.packbits(bits)
+
+    def contains_many(self, lows : np.ndarray) -> np.ndarray:
+        idx = np.searchsorted(self.values, lows)
+        found = idx < len(self.values)
+        found[found] = self.values[idx[found]] == lows[found]
+        return found
+
+    def nbytes(self) -> int:
+        return self.values.nbytes
+
+
+class BitmapContainer:
+    __slots__ = ("bytes",)
+
+    def __init__(self, packed : np.ndarray):
+        self.bytes = packed
+
+    def cardinality(self) -> int:
+        return int(np.bitwise_count(self.bytes).sum())
+
+    def lows(self) -> np.ndarray:
+        return np.flatnonzero(np.unpackbits(self.bytes))
+
+    def packed(self) -> np.ndarray:
+        return self.bytes
+
+    def contains_many(self, lows : np.ndarray) -> np.ndarray:
+        lows = lows.astype(np.int64)
+        return ((self.bytes[lows >> 3] >> (7 - (lows & 7))) & 1).astype(np.bool_)
+
+    def nbytes(self) -> int:
+        return self.bytes.nbytes
+
+
+class RunContainer:
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, starts : np.ndarray, ends : np.ndarray):
+        self.starts = starts.astype(np.int32, copy=False)
+        self.ends = ends.astype(np.int32, copy=False)
+
+    def cardinality(self) -> int:
+        return int((self.ends - self.starts).sum())
+
+    def bits(self) -> np.ndarray:
+        delta = np.zeros(CHUNK_SIZE + 1, dtype=np.int32)
+        delta[self.starts] += 1
+        delta[self.ends] -= 1
+        return np.cumsum(delta[:CHUNK_SIZE]) > 0
+
+    def lows(self) -> np.ndarray:
+        return np.concatenate([np.arange(start, end) for start, end in zip(self.starts.tolist(), self.ends.tolist())])
+
+    def packed(self) -> np.ndarray:
+        return np.packbits(self.bits())
+
+    def contains_many(self, lows : np.ndarray) -> np.ndarray:
+        idx = np.searchsorted(self.starts, lows, side="right") - 1
+        found = idx >= 0
+        found[found] = lows[found] < self.ends[idx[found]]
+        return found
+
+    def is_full(self) -> bool:
+        return len(self.starts) == 1 and self.starts[0] == 0 and self.ends[0] == CHUNK_SIZE
+
+    def nbytes(self) -> int:
+        return self.starts.nbytes + self.ends.nbytes
+
+
+def _use_runs(runs : int, cardinality : int) -> bool:
+    # serialized sizes of Roaring: 4 bytes per run against 2 per value or 8 KiB
+    return 4 * runs + 2 < min(2 * cardinality + 2, PACKED_BYTES)
+
+
+def container_from_lows(lows : np.ndarray):
+    """Cheapest container for sorted distinct low bits, None if there are none"""
+    if len(lows) == 0:
+        return None
+    lows = lows.astype(np.int64, copy=False)
+    if len(lows) > ARRAY_MAX:
+        bits = np.zeros(CHUNK_SIZE, dtype=np.bool_)
+        bits[lows] = True
+        return container_from_packed(np.packbits(bits))
+    breaks = np.flatnonzero(np.diff(lows) != 1)
+    if _use_runs(len(breaks) + 1, len(lows)):
+        starts = np.concatenate(([lows[0]], lows[breaks + 1]))
+        ends = np.concatenate((lows[breaks] + 1, [lows[-1] + 1]))
+        return RunContainer(starts, ends)
+    return ArrayContainer(lows)
+
+
+def container_from_packed(packed : np.ndarray):
+    """Cheapest container for 2^16 packed bits, None if none is set"""
+    cardinality = int(np.bitwise_count(packed).sum())
+    if cardinality == 0:
+        return None
+    bits = np.unpackbits(packed).astype(np.int8)
+    edges = np.flatnonzero(np.diff(bits, prepend=0, append=0))
+    if _use_runs(len(edges) // 2, cardinality):
+        return RunContainer(edges[0::2], edges[1::2])
+    if cardinality <= ARRAY_MAX:
+        return ArrayContainer(np.flatnonzero(bits))
+    return BitmapContainer(packed)
+
+
+def full_container(end : int = CHUNK_SIZE) -> RunContainer:
+    return RunContainer(np.array([0]), np.array([end]))
+
+
+def _and(a, b):
+    if isinstance(b, ArrayContainer):
+        a, b = b, a
+    if isinstance(b, RunContainer) and b.is_full():
+        return a
+    if isinstance(a, ArrayContainer):
+        return container_from_lows(a.values[b.contains_many(a.values)])
+    return container_from_packed(a.packed() & b.packed())
+
+
+def _or(a, b):
+    if isinstance(a, RunContainer) and a.is_full():
+        return a
+    if isinstance(b, RunContainer) and b.is_full():
+        return b
+    if isinstance(a, ArrayContainer) and isinstance(b, ArrayContainer) and len(a.values) + len(b.values) <= ARRAY_MAX:
+        return container_from_lows(np.union1d(a.values, b.values))
+    return container_from_packed(a.packed() | b.packed())
+
+
+def _andnot(a, b):
+    if isinstance(b, RunContainer) and b.is_full():
+        return None
+    if isinstance(a, ArrayContainer):
+        return container_from_lows(a.values[~b.contains_many(a.values)])
+    return container_from_packed(a.packed() & ~b.packed())
+
+
+class RoaringBitmap:
+    """Set of positions below size, see the module docstring for the layout"""
+    __slots__ = ("size", "containers")
+
+    def __init__(self, size : int = 0, containers : dict = None):
+        self.size = size
+        self.containers = containers if containers is not None else {}
+
+    @classmethod
+    def from_positions(cls, positions, size : int = 0) -> "RoaringBitmap":
+        positions = np.unique(np.asarray(positions, dtype=np.int64))
+        if len(positions):
+            size = max(size, int(positions[-1]) + 1)
+        keys, starts = np.unique(positions >> CHUNK_BITS, return_index=True)
+        ends = np.append(starts[1:], len(positions))
+        containers = {}
+        for key, start, end in zip(keys.tolist(), starts.tolist(), ends.tolist()):
+            containers[key] = container_from_lows(positions[start:end] & CHUNK_MASK)
+        return cls(size, containers)
+
+    @classmethod
+    def full(cls, size : int) -> "RoaringBitmap":
+        """Every position below size"""
+        containers = {}
+        for key in range(-(-size // CHUNK_SIZE)):
+            containers[key] = full_container(min(CHUNK_SIZE, size - (key << CHUNK_BITS)))
+        return cls(size, containers)
+
+    def cardinality(self) -> int:
+        return sum(container.cardinality() for container in self.containers.values())
+
+    def nbytes(self) -> int:
+        return sum(container.nbytes() for container in self.containers.values())
+
+    def to_positions(self) -> np.ndarray:
+        """Positions in increasing order"""
+        chunks = [(key << CHUNK_BITS) + self.containers[key].lows() for key in sorted(self.containers)]
+        if not chunks:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(chunks)
+
+    def __contains__(self, pos : int) -> bool:
+        container = self.containers.get(pos >> CHUNK_BITS)
+        if container is None:
+            return False
+        return bool(container.contains_many(np.array([pos & CHUNK_MASK]))[0])
+
+    def _combine(self, other : "RoaringBitmap", keys, op) -> "RoaringBitmap":
+        containers = {}
+        for key in keys:
+            container = op(self.containers.get(key), other.containers.get(key))
+            if container is not None:
+                containers[key] = container
+        return RoaringBitmap(max(self.size, other.size), containers)
+
+    def __and__(self, other : "RoaringBitmap") -> "RoaringBitmap":
+        keys = self.containers.keys() & other.containers.keys()
+        return self._combine(other, keys, _and)
+
+    def __or__(self, other : "RoaringBitmap") -> "RoaringBitmap":
+        keys = self.containers.keys() | other.containers.keys()
+        return self._combine(other, keys, lambda a, b: b if a is None else a if b is None else _or(a, b))
+
+    def __sub__(self, other : "RoaringBitmap") -> "RoaringBitmap":
+        return self._combine(other, self.containers.keys(), lambda a, b: a if b is None else _andnot(a, b))
+
+    def __invert__(self) -> "RoaringBitmap":
+        """Positions below size that aren't in the bitmap"""
+        return RoaringBitmap.full(self.size) - self
+
+    def to_bytes(self) -> bytes:
+        parts = [HEADER.pack(self.size, len(self.containers))]
+        for key in sorted(self.containers):
+            container = self.containers[key]
+            if isinstance(container, ArrayContainer):
+                parts += [CONTAINER_HEADER.pack(key, ARRAY, len(container.values)), container.values.astype("<u2").tobytes()]
+            elif isinstance(container, BitmapContainer):
+                parts += [CONTAINER_HEADER.pack(key, BITMAP, PACKED_BYTES), container.bytes.tobytes()]
+            else:
+                parts += [CONTAINER_HEADER.pack(key, RUN, len(container.starts)), container.starts.astype("<i4").tobytes(), container.ends.astype("<i4").tobytes()]
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data : bytes) -> "RoaringBitmap":
+        size, count = HEADER.unpack_from(data, 0)
+        offset = HEADER.size
+        containers = {}
+        for _ in range(count):
+            key, kind, n = CONTAINER_HEADER.unpack_from(data, offset)
+            offset += CONTAINER_HEADER.size
+            if kind == ARRAY:
+                containers[key] = ArrayContainer(np.frombuffer(data, "<u2", n, offset).copy())
+                offset += 2 * n
+            elif kind == BITMAP:
+                containers[key] = BitmapContainer(np.frombuffer(data, np.uint8, n, offset).copy())
+                offset += n
+            else:
+                starts = np.frombuffer(data, "<i4", n, offset)
+                ends = np.frombuffer(data, "<i4", n, offset + 4 * n)
+                containers[key] = RunContainer(starts.copy(), ends.copy())
+                offset += 8 * n
+        return cls(size, containers)
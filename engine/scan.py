@@ -0,0 +1,211 @@
+import os, sys, struct, mmap
+import numpy as np
+root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if root_path not in sys.path:
+    sys.path.append(root_path)
+
+from engine.model import TableSchema, Column, DataType
+from engine.record import Record, RecordFile
+from engine import utils
+import logger
+
+NUMPY_FORMATS = {
+    "i": "i4",
+    "f": "f4",
+    "?": "?",
+}
+
+
+def column_fields(index : int, column : Column) -> list[tuple[str, str]]:
+    """Structured dtype fields (name, struct code) that store a column"""
+    if column.data_type == DataType.POINT:
+        return [(f"c{index}x", "f"), (f"c{index}y", "f")]
+    return [(f"c{index}", utils.calculate_column_format(column))]
+
+
+def calculate_node_dtype(schema : TableSchema) -> np.dtype:
+    """numpy view of a FreeListNode: the record laid out exactly like
+    utils.calculate_record_format (native alignment) plus the next_del field"""
+    names, formats, offsets = [], [], []
+    fmt = ""
+    for i, column in enumerate(schema.columns):
+        for name, code in column_fields(i, column):
+            offsets.append(struct.calcsize(fmt + code) - struct.calcsize(code))
+            fmt += code
+            names.append(name)
+            formats.append(NUMPY_FORMATS.get(code, f"S{code[:-1]}"))
+    names.append("next_del")
+    formats.append("i4")
+    offsets.append(struct.calcsize(fmt))
+    return np.dtype({
+        "names": names,
+        "formats": formats,
+        "offsets": offsets,
+        "itemsize": struct.calcsize(fmt) + 4
+    })
+
+
+class HeapScan:
+    """Column-wise scans over a memory-mapped table.dat.
+
+    The heap is viewed as a numpy structured array of FreeListNodes, so
+    predicates are evaluated over whole columns and return the matching
+    positions as an array instead of decoding one Record per slot.
+    """
+    def __init__(self, record_file : RecordFile):
+        self.record_file = record_file
+        self.schema = record_file.schema
+        self.dtype = calculate_node_dtype(self.schema)
+        self.columns = {column.name: i for i, column in enumerate(self.schema.columns)}
+        self.logger = logger.CustomLogger(f"HEAPSCAN-{self.schema.table_name}".upper())
+
+    def rows(self) -> np.ndarray:
+        """Structured array over every node in the file"""
+        record_file = self.record_file
+        count = record_file.max_id()
+        if count == 0:
+            return np.empty(0, dtype=self.dtype)
+        return np.ndarray((count,), dtype=self.dtype, buffer=record_file.mapping(), offset=record_file.HEADER_SIZE)
+
+    def _column(self, rows : np.ndarray, column : Column) -> list[np.ndarray]:
+        i = self.columns[column.name]
+        values = []
+        for name, _ in column_fields(i, column):
+            data = rows[name]
+            if column.data_type in (DataType.FLOAT, DataType.POINT):
+                data = np.round(data.astype(np.float64), 6)
+            values.append(data)
+        return values
+
+    def comparison_values(self, rows : np.ndarray, column : Column) -> np.ndarray:
+        """A non POINT column as the comparisons see it, VARCHAR as bytes"""
+        return self._column(rows, column)[0]
+
+    @staticmethod
+    def _encode(column : Column, value):
+        if column.data_type == DataType.VARCHAR:
+            return value.encode()
+        return value
+
+    def live(self, rows : np.ndarray) -> np.ndarray:
+        return rows["next_del"] == -2
+
+    def comparison(self, column : Column, op, value):
+        """Function from rows to the mask of those where op(column, value)
+        holds, op is a numpy comparison such as np.less. The field and the
+        encoded value are resolved once. Not defined for POINT columns."""
+        name = column_fields(self.columns[column.name], column)[0][0]
+        value = self._encode(column, value)
+        if column.data_type == DataType.FLOAT:
+            return lambda rows: op(np.round(rows[name].astype(np.float64), 6), value)
+        return lambda rows: op(rows[name], value)
+
+    def search(self, column : Column, key, start : int = 0, stop : int = None) -> np.ndarray:
+        """Positions of the live records whose column equals key, among the
+        slots from start to stop (the end of the file if None)"""
+        rows = self.rows()[start:stop]
+        mask = self.live(rows)
+        if column.data_type == DataType.POINT:
+            x, y = self._column(rows, column)
+            mask &= (x == key[0]) & (y == key[1])
+        else:
+            mask &= self._column(rows, column)[0] == self._encode(column, key)
+        return np.flatnonzero(mask) + start
+
+    def range_search(self, column : Column, ini = None, end = None, start : int = 0, stop : int = None) -> np.ndarray:
+        """Positions of the live records with ini <= column <= end, None is
+        unbounded, among the slots from start to stop"""
+        if column.data_type == DataType.POINT:
+            raise Exception("range search not supported for POINT type")
+        rows = self.rows()[start:stop]
+        mask = self.live(rows)
+        values = self._column(rows, column)[0]
+        if ini is not None:
+            mask &= values >= self._encode(column, ini)
+        if end is not None:
+            mask &= values <= self._encode(column, end)
+        return np.flatnonzero(mask) + start
+
+    def live_positions(self, start : int = 0) -> np.ndarray:
+        """Positions of every live record from start to the end of the file"""
+        rows = self.rows()[start:]
+        return np.flatnonzero(self.live(rows)) + start
+
+    def live_at(self, positions) -> np.ndarray:
+        """The given positions that are inside the file and hold a live record"""
+        rows = self.rows()
+        positions = np.asarray(positions, dtype=np.int64)
+        positions = positions[positions < len(rows)]
+        return positions[self.live(rows[positions])]
+
+    def filter(self, predicate, batch_size : int):
+        """Single sequential pass over the heap yielding (positions, records)
+        of the live rows accepted by predicate, a function from rows to a
+        mask, batch_size slots at a time"""
+        count = self.record_file.max_id()
+        for start in range(0, count, batch_size):
+            rows = self.rows()[start:start + batch_size]
+            mask = self.live(rows) & predicate(rows)
+            if mask.any():
+                yield np.flatnonzero(mask) + start, self.decode(rows[mask])
+
+    def fetch(self, positions, batch_size : int, predicate = None):
+        """Live records at the given positions in position order, yielded as
+        (positions, records) batch_size positions at a time. Sorting the
+        positions turns the random reads of an index lookup into one forward
+        sweep over the file, and the pages of the next batch are requested
+        from the kernel while the current one is decoded. predicate, a
+        function from rows to a mask like filter takes, drops the rows it
+        rejects."""
+        rows = self.rows()
+        positions = np.unique(np.asarray(positions, dtype=np.int64))
+        positions = positions[(positions >= 0) & (positions < len(rows))]
+        for start in range(0, len(positions), batch_size):
+            batch = positions[start:start + batch_size]
+            self.prefetch(positions[start + batch_size:start + 2 * batch_size])
+            picked = rows[batch]
+            mask = self.live(picked)
+            if predicate is not None:
+                mask &= predicate(picked)
+            if mask.any():
+                yield batch[mask], self.decode(picked[mask])
+
+    def runs(self, positions : np.ndarray) -> list[tuple[int, int]]:
+        """Slot spans [start, stop) covering sorted positions, positions less
+        than a page apart share a span"""
+        if len(positions) == 0:
+            return []
+        gap = max(1, mmap.PAGESIZE // self.record_file.node_size)
+        breaks = np.flatnonzero(np.diff(positions) > gap) + 1
+        starts = positions[np.r_[0, breaks]]
+        stops = positions[np.r_[breaks - 1, len(positions) - 1]] + 1
+        return list(zip(starts.tolist(), stops.tolist()))
+
+    def prefetch(self, positions : np.ndarray) -> None:
+        """Start reading the pages that hold sorted positions in the
+        background, one request per run of nearby slots"""
+        if not hasattr(mmap, "MADV_WILLNEED") or len(positions) == 0:
+            return
+        mapping = self.record_file.mapping()
+        node_size = self.record_file.node_size
+        header = self.record_file.HEADER_SIZE
+        for start, stop in self.runs(positions):
+            begin = header + start * node_size
+            aligned = begin - begin % mmap.PAGESIZE
+            mapping.madvise(mmap.MADV_WILLNEED, aligned, header + stop * node_size - aligned)
+
+    def records(self, positions) -> list[Record]:
+        """Decode the records at the given positions column by column"""
+        return self.decode(self.rows()[np.asarray(positions, dtype=np.int64)])
+
+    def decode(self, rows : np.ndarray) -> list[Record]:
+        columns = []
+        for column in self.schema.columns:
+            data = [values.tolist() for values in self._column(rows, column)]
+            if column.data_type == DataType.VARCHAR:
+                columns.append([value.decode() for value in data[0]])
+            elif column.data_type == DataType.POINT:
+                columns.append(list(zip(data[0], data[1])))
+            else:
+                columns.append(data[0])
+        return [Record(self.schema, list(values)) for values in zip(*columns)]
@@ -0,0 +1,191 @@
+"""Table and column statistics for planning, kept in statistics.dat next to
+metadata.dat.
+
+ANALYZE computes them from a scan of the heap. Inserts and deletes keep the
+counts exact and widen min/max and the distinct value sketch as they go,
+the histograms only change on the next ANALYZE.
+"""
+import os, sys, pickle
+from bisect import bisect_right
+import numpy as np
+root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if root_path not in sys.path:
+    sys.path.append(root_path)
+
+from engine.model import TableSchema, Column, DataType
+from engine.scan import HeapScan, column_fields
+from engine import utils
+
+HLL_PRECISION = 12
+HISTOGRAM_BUCKETS = 32
+
+FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+FNV_PRIME = np.uint64(0x100000001b3)
+
+
+def hash_values(values : np.ndarray) -> np.ndarray:
+    """64 bit hashes of a heap field, equal values get equal hashes"""
+    if values.dtype.kind == "S":
+        width = values.dtype.itemsize
+        chars = np.ascontiguousarray(values).view(np.uint8).reshape(-1, width)
+        h = np.full(len(values), FNV_OFFSET, dtype=np.uint64)
+        for j in range(width):
+            h = (h ^ chars[:, j]) * FNV_PRIME
+    else:
+        values = np.ascontiguousarray(values)
+        h = values.view(f"u{values.dtype.itemsize}").astype(np.uint64)
+    # splitmix64 finalizer
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return h ^ (h >> np.uint64(31))
+
+
+class HyperLogLog:
+    """Distinct value sketch of 2^precision one byte registers"""
+    def __init__(self, precision : int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes : np.ndarray) -> None:
+        p = self.precision
+        index = (hashes >> np.uint64(64 - p)).astype(np.int64)
+        rest = hashes << np.uint64(p)
+        # rank = leading zeros of the remaining bits + 1
+        rank = np.ones(len(hashes), dtype=np.uint8)
+        for shift in (32, 16, 8, 4, 2, 1):
+            short = rest < np.uint64(1 << (64 - shift))
+            rank[short] += shift
+            rest[short] <<= np.uint64(shift)
+        np.minimum(rank, 64 - p + 1, out=rank)
+        np.maximum.at(self.registers, index, rank)
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+class ColumnStatistics:
+    """min, max, distinct values and an equi-depth histogram of a column.
+    POINT columns only get the distinct values."""
+    def __init__(self, column : Column):
+        self.column = column.name
+        self.numeric = column.data_type in (DataType.INT, DataType.FLOAT)
+        self.ordered = column.data_type != DataType.POINT
+        self.min = None
+        self.max = None
+        self.sketch = HyperLogLog()
+        self.histogram = []
+
+    @staticmethod
+    def _values(scan : HeapScan, rows : np.ndarray, column : Column) -> list[np.ndarray]:
+        return [rows[name] for name, _ in column_fields(scan.columns[column.name], column)]
+
+    @staticmethod
+    def _decode(value):
+        value = value.item()
+        return value.decode() if isinstance(value, bytes) else value
+
+    def add(self, scan : HeapScan, rows : np.ndarray, column : Column) -> None:
+        """Widen min, max and the sketch with the given heap rows"""
+        if len(rows) == 0:
+            return
+        fields = self._values(scan, rows, column)
+        hashes = hash_values(fields[0])
+        for field in fields[1:]:
+            hashes = hash_values(hashes ^ hash_values(field))
+        self.sketch.add_hashes(hashes)
+        if self.ordered:
+            values = scan.comparison_values(rows, column)
+            if values.dtype.kind == "S":
+                # numpy has no min/max over byte strings
+                values = values.tolist()
+                lo, hi = min(values).decode(), max(values).decode()
+            else:
+                lo, hi = values.min().item(), values.max().item()
+            self.min = lo if self.min is None else min(self.min, lo)
+            self.max = hi if self.max is None else max(self.max, hi)
+
+    def build_histogram(self, scan : HeapScan, rows : np.ndarray, column : Column) -> None:
+        """Bucket bounds holding the same number of rows each"""
+        self.histogram = []
+        if not self.ordered or len(rows) == 0:
+            return
+        values = np.sort(scan.comparison_values(rows, column))
+        picks = np.linspace(0, len(values) - 1, min(HISTOGRAM_BUCKETS, len(values)) + 1).astype(np.int64)
+        self.histogram = [self._decode(value) for value in values[picks]]
+
+    def ndv(self) -> int:
+        return self.sketch.count()
+
+    def fraction_le(self, value) -> float | None:
+        """Estimated fraction of the rows with column <= value, None without a histogram"""
+        bounds = self.histogram
+        if not bounds:
+            return None
+        if value < bounds[0]:
+            return 0.0
+        if value >= bounds[-1]:
+            return 1.0
+        i = bisect_right(bounds, value) - 1
+        within = 0.5
+        if self.numeric and bounds[i + 1] > bounds[i]:
+            within = (value - bounds[i]) / (bounds[i + 1] - bounds[i])
+        return (i + within) / (len(bounds) - 1)
+
+
+class TableStatistics:
+    def __init__(self, table_schema : TableSchema):
+        self.table_name = table_schema.table_name
+        self.slots = 0
+        self.live = 0
+        self.deleted = 0
+        self.analyzed = False
+        self.columns = {column.name: ColumnStatistics(column) for column in table_schema.columns}
+
+    @classmethod
+    def analyze(cls, table_schema : TableSchema, scan : HeapScan) -> "TableStatistics":
+        """Statistics computed from every live row of the heap"""
+        statistics = cls(table_schema)
+        all_rows = scan.rows()
+        rows = all_rows[scan.live(all_rows)]
+        statistics.slots = len(all_rows)
+        statistics.live = len(rows)
+        statistics.deleted = statistics.slots - statistics.live
+        for column in table_schema.columns:
+            column_statistics = statistics.columns[column.name]
+            column_statistics.add(scan, rows, column)
+            column_statistics.build_histogram(scan, rows, column)
+        statistics.analyzed = True
+        return statistics
+
+    def inserted(self, table_schema : TableSchema, scan : HeapScan, positions) -> None:
+        rows = scan.rows()[np.asarray(positions, dtype=np.int64)]
+        self.live += len(rows)
+        self.slots = scan.record_file.max_id()
+        self.deleted = self.slots - self.live
+        for column in table_schema.columns:
+            self.columns[column.name].add(scan, rows, column)
+
+    def removed(self, count : int) -> None:
+        self.live -= count
+        self.deleted += count
+
+    def column(self, column_name : str) -> ColumnStatistics | None:
+        return self.columns.get(column_name)
+
+    def save(self) -> None:
+        with open(utils.get_statistics_file_path(self.table_name), "wb") as file:
+            pickle.dump(self, file)
+
+    @staticmethod
+    def load(table_name : str) -> "TableStatistics | None":
+        path = utils.get_statistics_file_path(table_name)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as file:
+            return pickle.load(file)
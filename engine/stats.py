@@ -1,11 +1,14 @@
 memory_accesses = {
     "reads": 0,
-    "writes": 0
+    "writes": 0,
+    "page_requests": 0,
+    "disk_reads": 0,
+    "disk_writes": 0
 }
 
 def reset_counters():
-    memory_accesses["reads"] = 0
-    memory_accesses["writes"] = 0
+    for counter in memory_accesses:
+        memory_accesses[counter] = 0
 
 def count_read():
     memory_accesses["reads"] += 1
@@ -13,5 +16,21 @@ def count_read():
 def count_write():
     memory_accesses["writes"] += 1
 
+def count_page_request():
+    memory_accesses["page_requests"] += 1
+
+def count_disk_read():
+    memory_accesses["disk_reads"] += 1
+
+def count_disk_write():
+    memory_accesses["disk_writes"] += 1
+
+def hit_ratio():
+    if memory_accesses["page_requests"] == 0:
+        return 0.0
+    return 1 - memory_accesses["disk_reads"] / memory_accesses["page_requests"]
+
 def get_counts():
-    return dict(memory_accesses)
+    counts = dict(memory_accesses)
+    counts["hit_ratio"] = hit_ratio()
+    return counts
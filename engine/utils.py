@@ -22,12 +22,12 @@ def calculate_record_format(columns: list[Column]):
     return fmt
 
 def get_data_type(value) -> DataType:
-    if isinstance(value, int):
+    if isinstance(value, bool):
+        return DataType.BOOL
+    elif isinstance(value, int):
         return DataType.INT
     elif isinstance(value, float):
         return DataType.FLOAT
-    elif isinstance(value, bool):
-        return DataType.BOOL
     elif isinstance(value, str):
         return DataType.VARCHAR
     elif isinstance(value, tuple):
@@ -127,6 +127,7 @@ class IndexType(Enum):
     RTREE = auto()
     BRIN = auto()
     NONE = auto()
+    BITMAP = auto()
 
 
 def get_table_file_path(table_name: str, filename: str) -> str:
@@ -137,6 +138,9 @@ def get_table_file_path(table_name: str, filename: str) -> str:
 def get_record_file_path(table_name: str) -> str:
     return get_table_file_path(table_name, f"{table_name}.dat")
 
+def get_statistics_file_path(table_name: str) -> str:
+    return get_table_file_path(table_name, "statistics.dat")
+
 def get_index_file_path(table_name: str, column_name: str, index_type: IndexType) -> str:
     index_name = index_type.name.lower()
     return get_table_file_path(table_name, f"{table_name}_{column_name}_{index_name}.dat")
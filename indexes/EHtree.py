@@ -8,6 +8,7 @@ from engine.model import TableSchema, Column, IndexType
 from engine import utils
 import logger
 from engine import stats
+from engine.buffer import BufferManager
 import hashlib
 
 class Record:
@@ -133,23 +134,21 @@ class FileManager:
     def __init__(self, path: str, capacity: int):
         self.path     = path
         self.capacity = capacity
+        self.buffer   = BufferManager()
         if not os.path.exists(self.path):
-            with open(self.path, "wb") as f:
-                f.write(struct.pack(self.HEADER_FMT, 0, self.capacity, b"\x00"*8))
-                stats.count_write()
+            self.buffer.create(self.path)
+            self.buffer.write(self.path, 0, struct.pack(self.HEADER_FMT, 0, self.capacity, b"\x00"*8))
+            stats.count_write()
             self.next_bucket_id = 0
         else:
-            with open(self.path, "rb") as f:
-                nb, cap, _ = struct.unpack(self.HEADER_FMT, f.read(self.HEADER_SIZE))
-                stats.count_read()
-                self.next_bucket_id = nb
-                self.capacity       = cap
+            nb, cap, _ = struct.unpack(self.HEADER_FMT, self.buffer.read(self.path, 0, self.HEADER_SIZE))
+            stats.count_read()
+            self.next_bucket_id = nb
+            self.capacity       = cap
 
     def _write_header(self):
-        with open(self.path, "r+b") as f:
-            f.seek(0)
-            f.write(struct.pack(self.HEADER_FMT, self.next_bucket_id, self.capacity, b"\x00"*8))
-            stats.count_write()
+        self.buffer.write(self.path, 0, struct.pack(self.HEADER_FMT, self.next_bucket_id, self.capacity, b"\x00"*8))
+        stats.count_write()
 
     def _bucket_size(self):
         avg = 256
@@ -159,19 +158,15 @@ class FileManager:
         return self.HEADER_SIZE + bid * self._bucket_size()
 
     def _read_raw(self, bid: int) -> bytes:
-        with open(self.path, "rb") as f:
-            f.seek(self._bucket_offset(bid))
-            stats.count_read()
-            return f.read(self._bucket_size())
+        stats.count_read()
+        return self.buffer.read(self.path, self._bucket_offset(bid), self._bucket_size())
 
     def _write_raw(self, bid: int, data: bytes):
         if len(data) > self._bucket_size():
             raise ValueError("Bucket overflow")
         data = data.ljust(self._bucket_size(), b"\x00")
-        with open(self.path, "r+b") as f:
-            f.seek(self._bucket_offset(bid))
-            f.write(data)
-            stats.count_write()
+        self.buffer.write(self.path, self._bucket_offset(bid), data)
+        stats.count_write()
 
     def create_bucket(self) -> Bucket:
         bid = self.next_bucket_id
@@ -322,11 +317,21 @@ class ExtendibleHashTree:
         if(hi == None):
             hi = utils.get_max_value(self.column)
         self.logger.warning(f"RANGE-SEARCH: {lo}, {hi}")
-        out = []
-        for rec in self.get_all():
+        return list(self.iter_range(lo, hi))
+
+    def iter_range(self, lo, hi):
+        """
+        Versión perezosa de rangeSearch: el hash no guarda orden, así que
+        recorre los buckets uno a uno y entrega los punteros que caen en el
+        rango sin esperar a cargar el resto.
+        """
+        if(lo == None):
+            lo = utils.get_min_value(self.column)
+        if(hi == None):
+            hi = utils.get_max_value(self.column)
+        for rec in self.iter_records():
             if lo <= rec.key <= hi:
-                out.append(rec.pointer)
-        return out
+                yield rec.pointer
 
     def delete(self, key) -> None:
         """
@@ -345,16 +350,20 @@ class ExtendibleHashTree:
         Recorre todo el árbol y devuelve la lista de Record(key, pointer)
         sin convertirlos aún en punteros.
         """
-        recs: list[Record] = []
-        def dfs(node: TreeNode):
+        return list(self.iter_records())
+
+    def iter_records(self):
+        """
+        Igual que get_all pero carga cada bucket recién cuando se pide.
+        """
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
             if node.is_leaf():
-                recs.extend(self.fm.load_bucket(node.bucket_id).get_all())
+                yield from self.fm.load_bucket(node.bucket_id).get_all()
             else:
-                dfs(node.left)
-                dfs(node.right)
-
-        dfs(self.root)
-        return recs
+                stack.append(node.right)
+                stack.append(node.left)
 
     def getAll(self) -> list[int]:
         """
@@ -376,5 +385,6 @@ class ExtendibleHashTree:
 
     def clear(self):
         self.logger.info("Cleaning data, removing files")
+        self.fm.buffer.discard(self.data_path)
         os.remove(self.data_path)
         os.remove(self.tree_path)
@@ -2,7 +2,9 @@ import os, struct, math, re
 from engine.model import TableSchema, Column, IndexType
 from engine import utils
 from engine import stats
+from engine.buffer import BufferManager
 from engine.record import RecordFile
+from engine.statistics import TableStatistics
 import logger
 
 _SUFIJO = re.compile(r"(.*?)(\d+)$")
@@ -157,24 +159,25 @@ class ISAMFile:
                                 column.name,
                                 IndexType.ISAM)
         self.step = None
+        self.buffer = BufferManager()
 
         if not os.path.exists(self.filename):
-            open(self.filename, "wb").close()
-            with open(self.filename, "r+b") as f:
-                f.seek(0)
-                f.write(self.HEADER_STRUCT.pack(leaf_factor, index_factor))
-                stats.count_write()
+            self.buffer.create(self.filename)
+            self.write_header(leaf_factor, index_factor)
         else:
             lf, ix = self.read_header()
             self.leaf_factor = lf
             self.index_factor = ix
 
     def read_header(self):
-        with open(self.filename, "rb") as f:
-            lf, ix = self.HEADER_STRUCT.unpack(f.read(self.HEADER_SIZE))
-            stats.count_read()
+        lf, ix = self.HEADER_STRUCT.unpack(self.buffer.read(self.filename, 0, self.HEADER_SIZE))
+        stats.count_read()
         return lf, ix
 
+    def write_header(self, leaf_factor: int, index_factor: int):
+        self.buffer.write(self.filename, 0, self.HEADER_STRUCT.pack(leaf_factor, index_factor))
+        stats.count_write()
+
     def _fmt_root(self):
         key_fmt = utils.calculate_column_format(self.column)
         return "i" + (key_fmt + "ii") * self.index_factor
@@ -186,12 +189,9 @@ class ISAMFile:
         return self.HEADER_SIZE
 
     def read_root_page(self):
-        buf = None
         size = self._size_root()
-        with open(self.filename, "rb") as f:
-            f.seek(self._offset_root())
-            buf = f.read(size)
-            stats.count_read()
+        buf = self.buffer.read(self.filename, self._offset_root(), size)
+        stats.count_read()
         hdr = buf[:IndexPage.HSIZE]
         page_num = struct.unpack(IndexPage.HEADER_FMT, hdr)[0]
         records = []
@@ -203,10 +203,8 @@ class ISAMFile:
         return IndexPage(page_num, records, self.index_factor)
 
     def write_root_page(self, page: 'IndexPage'):
-        with open(self.filename, "r+b") as f:
-            f.seek(self._offset_root())
-            f.write(page.pack())
-            stats.count_write()
+        self.buffer.write(self.filename, self._offset_root(), page.pack())
+        stats.count_write()
 
     def _offset_level1(self):
         return self.HEADER_SIZE + self._size_root()
@@ -214,10 +212,8 @@ class ISAMFile:
     def read_level1_page(self, page_idx: int) -> 'IndexPage':
         lvl_size = self._size_root()
         off = self._offset_level1() + page_idx * lvl_size
-        with open(self.filename, "rb") as f:
-            f.seek(off)
-            buf = f.read(lvl_size)
-            stats.count_read()
+        buf = self.buffer.read(self.filename, off, lvl_size)
+        stats.count_read()
         hdr = buf[:IndexPage.HSIZE]
         page_num = struct.unpack(IndexPage.HEADER_FMT, hdr)[0]
         recs = []
@@ -231,10 +227,8 @@ class ISAMFile:
     def write_level1_page(self, page: 'IndexPage'):
         lvl_size = self._size_root()
         off = self._offset_level1() + page.page_num * lvl_size
-        with open(self.filename, "r+b") as f:
-            f.seek(off)
-            f.write(page.pack())
-            stats.count_write()
+        self.buffer.write(self.filename, off, page.pack())
+        stats.count_write()
 
     def _offset_leaves(self):
         return self.HEADER_SIZE + self._size_root() + self._size_root() * (1 + self.index_factor)
@@ -249,7 +243,7 @@ class ISAMFile:
         """
         Returns how many leaf-pages are currently in the file.
         """
-        total = os.path.getsize(self.filename)
+        total = self.buffer.size(self.filename)
         leaves_off = self._offset_leaves()
         leaf_sz    = self._size_leaf()
         return max(0, (total - leaves_off) // leaf_sz)
@@ -259,19 +253,15 @@ class ISAMFile:
         Writes the given LeafPage at the end of the file, under the
         assumption that its page_num field is already correct.
         """
-        with open(self.filename, "r+b") as f:
-            f.seek(0, os.SEEK_END)
-            f.write(page.pack())
-            stats.count_write()
+        self.buffer.append(self.filename, page.pack())
+        stats.count_write()
 
     def read_leaf_page(self, leaf_idx: int) -> 'LeafPage':
         lf, ix = self.read_header()
         sz   = self._size_leaf()
         off  = self._offset_leaves() + leaf_idx * sz
-        with open(self.filename, "rb") as f:
-            f.seek(off)
-            buf = f.read(sz)
-            stats.count_read()
+        buf = self.buffer.read(self.filename, off, sz)
+        stats.count_read()
         pn, nxt, nof = struct.unpack(LeafPage.HEADER_FMT, buf[:LeafPage.HSIZE])
         recs = []
         ptr = LeafPage.HSIZE
@@ -284,10 +274,8 @@ class ISAMFile:
     def write_leaf_page(self, page: 'LeafPage'):
         sz  = self._size_leaf()
         off = self._offset_leaves() + page.page_num * sz
-        with open(self.filename, "r+b") as f:
-            f.seek(off)
-            f.write(page.pack())
-            stats.count_write()
+        self.buffer.write(self.filename, off, page.pack())
+        stats.count_write()
 
     def write_leaf_page_at(self, leaf_num: int,
                            records: list[LeafRecord], next_page: int,
@@ -311,10 +299,8 @@ class ISAMFile:
             not_overflow = old.not_overflow if old else 0
 
         page = LeafPage(leaf_num, next_page, not_overflow, records, lf)
-        with open(self.filename, "r+b") as f:
-            f.seek(leaf_off + leaf_num * leaf_sz)
-            f.write(page.pack())
-            stats.count_write()
+        self.buffer.write(self.filename, leaf_off + leaf_num * leaf_sz, page.pack())
+        stats.count_write()
 
     def copy_to_leaf_records(self, rf: RecordFile):
         l = self.leaf_factor
@@ -339,88 +325,78 @@ class ISAMFile:
         max_pos = rf.max_id()
 
         if max_pos == 0:
-            with open(self.filename, "r+b") as f:
-                f.seek(0, os.SEEK_END)
-                if f.tell() < leaves_off:
-                    f.write(b'\x00' * (leaves_off - f.tell()))
-                    stats.count_write()
-                f.seek(leaves_off)
-                while reg_pages < p:
-                    chunk = [LeafRecord(self.column, empty_key, -1) for _ in range(l)]
-                    self.write_leaf_page(LeafPage(leaf_idx, -1, 1, chunk, l))
-                    leaf_idx += 1
-                    reg_pages += 1
+            self._pad_to_leaves(leaves_off)
+            while reg_pages < p:
+                chunk = [LeafRecord(self.column, empty_key, -1) for _ in range(l)]
+                self.write_leaf_page(LeafPage(leaf_idx, -1, 1, chunk, l))
+                leaf_idx += 1
+                reg_pages += 1
             self._link_leaf_pages(leaves_off, leaf_sz, leaf_idx)
             return
 
-        leafrecs = []
-        for pos in range(max_pos):
-            rec = rf.read(pos)
-            if rec is None:
-                continue
-            key = rec.values[col_idx]
-            leafrecs.append((key, pos))
+        leafrecs = [(rec.values[col_idx], pos) for pos, rec in rf]
         leafrecs.sort(key=lambda x: x[0])
 
-        with open(self.filename, "r+b") as f:
-            f.seek(0, os.SEEK_END)
-            if f.tell() < leaves_off:
-                f.write(b'\x00' * (leaves_off - f.tell()))
-                stats.count_write()
-            f.seek(leaves_off)
-
-            if len(leafrecs) <= p * l:
-                idx = 0
-                while reg_pages < p and idx < len(leafrecs):
-                    remain = len(leafrecs) - idx
-                    slots = p - reg_pages
-                    to_take = math.ceil(remain / slots)
-
-                    end = idx + to_take
-                    while end < len(leafrecs) and leafrecs[end][0] == leafrecs[end - 1][0]:
-                        end += 1
-                    window = leafrecs[idx:end]
-                    idx = end
-                    reg_pages += 1
-
-                    hoja = window[:l]
-                    overflow = window[l:]
-                    chunk = [LeafRecord(self.column, k, dp) for k, dp in hoja]
+        self._pad_to_leaves(leaves_off)
+
+        if len(leafrecs) <= p * l:
+            idx = 0
+            while reg_pages < p and idx < len(leafrecs):
+                remain = len(leafrecs) - idx
+                slots = p - reg_pages
+                to_take = math.ceil(remain / slots)
+
+                end = idx + to_take
+                while end < len(leafrecs) and leafrecs[end][0] == leafrecs[end - 1][0]:
+                    end += 1
+                window = leafrecs[idx:end]
+                idx = end
+                reg_pages += 1
+
+                hoja = window[:l]
+                overflow = window[l:]
+                chunk = [LeafRecord(self.column, k, dp) for k, dp in hoja]
+                while len(chunk) < l:
+                    chunk.append(LeafRecord(self.column, empty_key, -1))
+                self.write_leaf_page(LeafPage(leaf_idx, -1, 1, chunk, l))
+                leaf_idx += 1
+
+                for j in range(0, len(overflow), l):
+                    seg = overflow[j:j + l]
+                    chunk = [LeafRecord(self.column, k, dp) for k, dp in seg]
                     while len(chunk) < l:
                         chunk.append(LeafRecord(self.column, empty_key, -1))
-                    self.write_leaf_page(LeafPage(leaf_idx, -1, 1, chunk, l))
+                    self.write_leaf_page(LeafPage(leaf_idx, -1, 0, chunk, l))
                     leaf_idx += 1
 
-                    for j in range(0, len(overflow), l):
-                        seg = overflow[j:j + l]
-                        chunk = [LeafRecord(self.column, k, dp) for k, dp in seg]
-                        while len(chunk) < l:
-                            chunk.append(LeafRecord(self.column, empty_key, -1))
-                        self.write_leaf_page(LeafPage(leaf_idx, -1, 0, chunk, l))
-                        leaf_idx += 1
-
-                while reg_pages < p:
-                    chunk = [LeafRecord(self.column, empty_key, -1) for _ in range(l)]
-                    self.write_leaf_page(LeafPage(leaf_idx, -1, 1, chunk, l))
-                    leaf_idx += 1
-                    reg_pages += 1
+            while reg_pages < p:
+                chunk = [LeafRecord(self.column, empty_key, -1) for _ in range(l)]
+                self.write_leaf_page(LeafPage(leaf_idx, -1, 1, chunk, l))
+                leaf_idx += 1
+                reg_pages += 1
 
-            else:
-                chunk = []
-                for k, dp in leafrecs:
-                    chunk.append(LeafRecord(self.column, k, dp))
-                    if len(chunk) == l:
-                        self.write_leaf_page(LeafPage(leaf_idx, -1, 0, chunk, l))
-                        leaf_idx += 1
-                        chunk = []
-                if chunk:
-                    while len(chunk) < l:
-                        chunk.append(LeafRecord(self.column, empty_key, -1))
+        else:
+            chunk = []
+            for k, dp in leafrecs:
+                chunk.append(LeafRecord(self.column, k, dp))
+                if len(chunk) == l:
                     self.write_leaf_page(LeafPage(leaf_idx, -1, 0, chunk, l))
                     leaf_idx += 1
+                    chunk = []
+            if chunk:
+                while len(chunk) < l:
+                    chunk.append(LeafRecord(self.column, empty_key, -1))
+                self.write_leaf_page(LeafPage(leaf_idx, -1, 0, chunk, l))
+                leaf_idx += 1
 
         self._link_leaf_pages(leaves_off, leaf_sz, leaf_idx)
 
+    def _pad_to_leaves(self, leaves_off: int):
+        total = self.buffer.size(self.filename)
+        if total < leaves_off:
+            self.buffer.write(self.filename, total, b'\x00' * (leaves_off - total))
+            stats.count_write()
+
     def _link_leaf_pages(self, leaf_off: int, leaf_sz: int, count: int):
         """
         Re-escribe en cada LeafPage su next_page para apuntar a la siguiente,
@@ -445,7 +421,7 @@ class ISAMFile:
                 not_overflow=leaf.not_overflow
             )
 
-    def _build_level1_phase1(self, f, ctx):
+    def _build_level1_phase1(self, ctx):
         i = ctx['i']
         p = ctx['p']
         h = ctx['h']
@@ -625,14 +601,11 @@ class ISAMFile:
         leaf_record_size = lr0.STRUCT.size
 
         leaf_sz = LeafPage.HSIZE + lf * leaf_record_size
-        total = os.path.getsize(self.filename)
+        total = self.buffer.size(self.filename)
         leaf_off = self._offset_leaves()
         h = (total - leaf_off) // leaf_sz
 
 
-        level1_off = self.HEADER_SIZE + idx_sz
-
-
         ctx = {
             'i': i,
             'p': p,
@@ -648,25 +621,20 @@ class ISAMFile:
         }
 
 
-        with open(self.filename, 'r+b') as f:
-            f.seek(level1_off)
-
+        last_boundary, partial_chunk = self._build_level1_phase1(ctx)
 
 
-            last_boundary, partial_chunk = self._build_level1_phase1(f, ctx)
+        ctx['phase1_pages'] = ctx['page_idx']
 
 
-            ctx['phase1_pages'] = ctx['page_idx']
 
+        slots = (i + 1) ** 2 - ctx['phase1_pages']
 
+        ctx['step'] = compute_string_step(ctx['min_id'], ctx['max_id'], slots)
 
-            slots = (i + 1) ** 2 - ctx['phase1_pages']
 
-            ctx['step'] = compute_string_step(ctx['min_id'], ctx['max_id'], slots)
 
-
-
-            self._build_level1_phase2(ctx, last_boundary, partial_chunk)
+        self._build_level1_phase2(ctx, last_boundary, partial_chunk)
 
 
         self.num_level1 = ctx['page_idx']
@@ -743,7 +711,8 @@ class ISAMIndex:
         las hojas queden llenas en fill_factor (%) y el nivel-1 abarque todas.
         """
 
-        N = count_records_in_rf(self.rf)
+        statistics = TableStatistics.load(self.schema.table_name)
+        N = statistics.live if statistics is not None else count_records_in_rf(self.rf)
 
 
         leaf_header = LeafPage.HSIZE
@@ -775,9 +744,7 @@ class ISAMIndex:
 
         self.file.leaf_factor = l
         self.file.index_factor = i
-        with open(self.file.filename, "r+b") as fh:
-            fh.seek(0)
-            fh.write(self.file.HEADER_STRUCT.pack(l, i))
+        self.file.write_header(l, i)
 
     def build_index(self):
 
@@ -804,11 +771,21 @@ class ISAMIndex:
         if end is None:
             end = utils.get_max_value(self.column)
         self.logger.warning(f"RANGE-SEARCH: {ini}, {end}")
+        return list(self.iter_range(ini, end))
+
+    def iter_range(self, ini, end):
+        """
+        Versión perezosa de rangeSearch: entrega los datapos a medida que
+        recorre las hojas, así quien deja de consumir no lee las siguientes.
+        """
+        if ini is None:
+            ini = utils.get_min_value(self.column)
+        if end is None:
+            end = utils.get_max_value(self.column)
 
         empty_key = utils.get_empty_value(self.column)
-        results = []
         if end < ini:
-            return results
+            return
 
 
         root = self.file.read_root_page()
@@ -832,15 +809,13 @@ class ISAMIndex:
                     continue
 
                 if rec.key > end:
-                    return results
-                results.append(rec.datapos)
+                    return
+                yield rec.datapos
             if lp.next_page < 1:
                 print(self)
                 break
             lp = self.file.read_leaf_page(lp.next_page)
 
-        return results
-
     def search(self, key) -> list[int]:
         self.logger.warning(f"SEARCHING: {key}")
         """
@@ -1144,16 +1119,11 @@ class ISAMIndex:
 
     def clear(self):
         self.logger.info("Cleaning data, removing files")
+        self.rf.buffer.discard(self.rf.filename)
         os.remove(self.rf.filename)
 
 def count_records_in_rf(rf):
-    max_pos = rf.max_id()
-    count = 0
-    for pos in range(max_pos):
-        rec = rf.read(pos)
-        if rec is not None:
-            count += 1
-    return count
+    return sum(1 for _ in rf)
 
 def test_isam_integrity(isam: ISAMIndex):
     dbg = []
@@ -7,6 +7,7 @@ import logger
 from engine.model import TableSchema, Column, IndexType, DataType
 from engine import utils
 from engine import stats
+from engine.buffer import BufferManager
 
 class AVLNode:
     def __init__(self, column: Column, val, pointer: int = -1, left: int = -1, right: int = -1, height: int = 0):
@@ -53,51 +54,45 @@ class AVLFile:
         self.logger = logger.CustomLogger(f"AVLFIlE-{schema.table_name}-{column.name}".upper())
         self.root = -1
         self.NODE_SIZE = struct.calcsize(utils.calculate_column_format(column) + "iiii")
+        self.buffer = BufferManager()
         if not os.path.exists(self.filename):
             self.logger.fileNotFound(self.filename)
-            open(self.filename, 'ab+').close()
+            self.buffer.create(self.filename)
         self._initialize_file()
 
     def _initialize_file(self):
-        with open(self.filename, 'rb+') as file:
-            header = file.read(self.HEADER_SIZE)
-            stats.count_read()
-            if not header:
-                self.logger.fileIsEmpty(self.filename)
-                self.root = -1
-                header = struct.pack(self.HEADER_FORMAT, self.root)
-                file.write(header)
-                stats.count_write()
-            else:
-                self.root = struct.unpack(self.HEADER_FORMAT, header)[0]
+        header = self.buffer.read(self.filename, 0, self.HEADER_SIZE)
+        stats.count_read()
+        if not header:
+            self.logger.fileIsEmpty(self.filename)
+            self.root = -1
+            header = struct.pack(self.HEADER_FORMAT, self.root)
+            self.buffer.write(self.filename, 0, header)
+            stats.count_write()
+        else:
+            self.root = struct.unpack(self.HEADER_FORMAT, header)[0]
 
     def read(self,pos:int) -> AVLNode | None:
-
-        with open(self.filename, "rb") as file:
-            offset = self.HEADER_SIZE + pos * self.NODE_SIZE
-            file.seek(offset)
-            data = file.read(self.NODE_SIZE)
-            stats.count_read()
-            if not data or len(data) < self.NODE_SIZE:
-                return None
-            node = AVLNode.unpack(data, self.column)
-            self.logger.readingNode(self.filename, pos)
-            return node
+        offset = self.HEADER_SIZE + pos * self.NODE_SIZE
+        data = self.buffer.read(self.filename, offset, self.NODE_SIZE)
+        stats.count_read()
+        if not data or len(data) < self.NODE_SIZE:
+            return None
+        node = AVLNode.unpack(data, self.column)
+        self.logger.readingNode(self.filename, pos)
+        return node
 
     def write(self, node:AVLNode, pos:int = -1)-> int:
         data = node.pack()
-        with open(self.filename, "rb+") as file:
-            if pos == -1:
-                file.seek(0, 2)
-                offset = file.tell()
-                pos = (offset - self.HEADER_SIZE) // self.NODE_SIZE
-            else:
-                offset = self.HEADER_SIZE + pos * self.NODE_SIZE
-                file.seek(offset)
-            stats.count_write()
-            file.write(data)
-            self.logger.writingNode(self.filename, pos, node.val, node.right, node.left, node.height)
-            return pos
+        if pos == -1:
+            offset = self.buffer.append(self.filename, data)
+            pos = (offset - self.HEADER_SIZE) // self.NODE_SIZE
+        else:
+            offset = self.HEADER_SIZE + pos * self.NODE_SIZE
+            self.buffer.write(self.filename, offset, data)
+        stats.count_write()
+        self.logger.writingNode(self.filename, pos, node.val, node.right, node.left, node.height)
+        return pos
 
     def delete(self, pos: int):
         node = self.read(pos)
@@ -108,21 +103,17 @@ class AVLFile:
         if self.root != -1:
             return self.root
         else :
-            with open(self.filename, "rb") as file:
-                file.seek(0)
-                data = file.read(self.HEADER_SIZE)
-                stats.count_read()
-                self.root = struct.unpack("i", data)[0]
-                self.logger.readingHeader(self.filename, self.root)
-                return self.root
+            data = self.buffer.read(self.filename, 0, self.HEADER_SIZE)
+            stats.count_read()
+            self.root = struct.unpack("i", data)[0]
+            self.logger.readingHeader(self.filename, self.root)
+            return self.root
 
     def write_header(self, root_pos: int):
         self.root = root_pos
-        with open(self.filename, "rb+") as file:
-            file.seek(0)
-            file.write(struct.pack("i", self.root))
-            stats.count_write()
-            self.logger.writingHeader(self.filename, self.root)
+        self.buffer.write(self.filename, 0, struct.pack("i", self.root))
+        stats.count_write()
+        self.logger.writingHeader(self.filename, self.root)
 
 class AVLTree:
     indexFile: AVLFile
@@ -134,6 +125,7 @@ class AVLTree:
 
     def clear(self):
         self.logger.info("Cleaning data, removing files")
+        self.indexFile.buffer.discard(self.indexFile.filename)
         os.remove(self.indexFile.filename)
 
 
@@ -264,19 +256,6 @@ class AVLTree:
 
         return self._balance(point, pos)
 
-    def _range_search_aux(self, r: list[int], i, j, pos:int = -2):
-        if pos == -2:
-            pos = self.indexFile.get_header()
-        if pos == -1:
-            return
-        punt = self.indexFile.read(pos)
-        if i <= punt.val <= j:
-            r.append(punt.pointer)
-        if i < punt.val:
-            self._range_search_aux(r, i, j, punt.left)
-        if j > punt.val:
-            self._range_search_aux(r, i, j, punt.right)
-
     def _load_ord(self, r:list[int], pos:int = -2):
         if pos == -2:
             pos = self.indexFile.get_header()
@@ -349,10 +328,32 @@ class AVLTree:
         if(j == None):
             j = utils.get_max_value(self.column)
         print(i, j)
-        
-        r = []
-        self._range_search_aux(r, i, j)
-        return r
+        return list(self.iter_range(i, j))
+
+    def iter_range(self, i, j):
+        """Pointers with i <= key <= j in key order, None is unbounded. Only the
+        subtrees that can hold such keys are read, as the caller consumes them"""
+        if i is None:
+            i = utils.get_min_value(self.column)
+        if j is None:
+            j = utils.get_max_value(self.column)
+        stack = []
+        pos = self.indexFile.get_header()
+        while stack or pos != -1:
+            if pos != -1:
+                node = self.indexFile.read(pos)
+                if node.val < i:
+                    pos = node.right
+                    continue
+                stack.append(node)
+                pos = node.left
+                continue
+            node = stack.pop()
+            if node.val > j:
+                return
+            if node.pointer != -1:
+                yield node.pointer
+            pos = node.right
 
     def search(self, key) -> list[int]:
         self.logger.warning(f"SEARCHING: {key}")
@@ -367,6 +368,22 @@ class AVLTree:
         self._load_ord(r)
         return r
 
+    def iter_ordered(self, reverse: bool = False):
+        """Pointers in key order (descending when reverse), nodes are read
+        as the caller consumes them so stopping early skips the rest"""
+        stack = []
+        pos = self.indexFile.get_header()
+        while stack or pos != -1:
+            if pos != -1:
+                node = self.indexFile.read(pos)
+                stack.append(node)
+                pos = node.right if reverse else node.left
+                continue
+            node = stack.pop()
+            if node.pointer != -1:
+                yield node.pointer
+            pos = node.left if reverse else node.right
+
     def __str__(self):
         print(f"AVL Tree - {self.column.name}")
         print("Header:", self.indexFile.get_header())
@@ -0,0 +1,176 @@
+import os, sys, struct
+import numpy as np
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import logger
+from engine.model import TableSchema, Column, IndexType, DataType
+from engine import utils
+from engine import stats
+from engine.buffer import BufferManager
+from engine.roaring import RoaringBitmap
+
+
+class BitmapFile:
+    """Log of (key, added, length) entries each followed by the serialized
+    bitmap of the positions added to or removed from the key. Replaying it
+    in order gives the current bitmaps, a key left without positions is
+    gone. Floats are stored as doubles so keys come back exactly as they
+    were inserted."""
+    def __init__(self, schema : TableSchema, column : Column):
+        self.column = column
+        self.filename = utils.get_index_file_path(schema.table_name, column.name, IndexType.BITMAP)
+        self.logger = logger.CustomLogger(f"BITMAPFILE-{schema.table_name}-{column.name}".upper())
+        key_format = "d" if column.data_type == DataType.FLOAT else utils.calculate_column_format(column)
+        self.entry = struct.Struct(f"<{key_format}?i")
+        self.buffer = BufferManager()
+        if not os.path.exists(self.filename):
+            self.logger.fileNotFound(self.filename)
+            self.buffer.create(self.filename)
+
+    def size(self) -> int:
+        return self.buffer.size(self.filename)
+
+    def read_all(self) -> dict:
+        """Current bitmap of every key"""
+        data = self.buffer.read(self.filename, 0, self.size())
+        stats.count_read()
+        bitmaps = {}
+        offset = 0
+        while offset < len(data):
+            key, added, length = self.entry.unpack_from(data, offset)
+            offset += self.entry.size
+            if self.column.data_type == DataType.VARCHAR:
+                key = key.decode().rstrip("\x00")
+            apply_change(bitmaps, key, RoaringBitmap.from_bytes(data[offset:offset + length]), added)
+            offset += length
+        return bitmaps
+
+    def append(self, key, positions : RoaringBitmap, added : bool) -> int:
+        """Log positions added to (or removed from) key. Returns the bytes written"""
+        payload = positions.to_bytes()
+        packed_key = key.encode() if self.column.data_type == DataType.VARCHAR else key
+        data = self.entry.pack(packed_key, added, len(payload)) + payload
+        self.buffer.append(self.filename, data)
+        stats.count_write()
+        return len(data)
+
+    def rewrite(self, bitmaps : dict) -> int:
+        """Replace the log with one entry adding the whole bitmap of each key"""
+        self.buffer.create(self.filename)
+        return sum(self.append(key, bitmaps[key], True) for key in sorted(bitmaps))
+
+
+def apply_change(bitmaps : dict, key, positions : RoaringBitmap, added : bool) -> bool:
+    """Add positions to (or remove them from) the bitmap of key in bitmaps,
+    returns whether key was added or removed from bitmaps"""
+    bitmap = bitmaps.get(key)
+    if added:
+        bitmaps[key] = positions if bitmap is None else bitmap | positions
+        return bitmap is None
+    if bitmap is None:
+        return False
+    bitmap = bitmap - positions
+    if bitmap.cardinality() == 0:
+        del bitmaps[key]
+        return True
+    bitmaps[key] = bitmap
+    return False
+
+
+class BitmapIndex:
+    """One compressed bitmap of positions per distinct value, meant for low
+    cardinality columns (flags, categories). Lookups hand the bitmaps to
+    select_condition as they are, so conditions over these columns are
+    answered with bitmap AND/OR/NOT without building position lists.
+
+    Every change appends only the positions it adds or removes to the file,
+    which is rewritten with the current bitmaps once the log has grown to
+    twice its size after the last rewrite."""
+    def __init__(self, schema : TableSchema, column : Column):
+        if column.data_type == DataType.POINT:
+            raise Exception("BITMAP index not supported for POINT data type")
+        self.schema = schema
+        self.column = column
+        self.indexFile = BitmapFile(schema, column)
+        self.bitmaps = self.indexFile.read_all()
+        self.keys = sorted(self.bitmaps)
+        self.compacted = self.indexFile.size()
+        self.logger = logger.CustomLogger(f"BITMAPINDEX-{schema.table_name}-{column.name}".upper())
+
+    def _stored(self, key):
+        """An inserted key as the heap scans will read it back"""
+        if self.column.data_type == DataType.FLOAT:
+            return round(float(np.float32(key)), 6)
+        return key
+
+    def _update(self, changes : dict, added : bool) -> None:
+        """Add (or remove) the positions grouped by key in changes and log them"""
+        for key, positions in changes.items():
+            if not added and key not in self.bitmaps:
+                continue
+            bitmap = RoaringBitmap.from_positions(positions)
+            if apply_change(self.bitmaps, key, bitmap, added):
+                if added:
+                    self.keys.insert(bisect_left(self.keys, key), key)
+                else:
+                    self.keys.remove(key)
+            self.indexFile.append(key, bitmap, added)
+        if self.indexFile.size() > 2 * self.compacted + 4096:
+            self.logger.info("Rewriting bitmap file")
+            self.compacted = self.indexFile.rewrite(self.bitmaps)
+
+    def _group(self, pairs) -> dict:
+        groups = defaultdict(list)
+        for key, pos in pairs:
+            groups[self._stored(key)].append(pos)
+        return groups
+
+    def insert_many(self, pairs) -> None:
+        """Add (key, pos) pairs, one bitmap update per distinct key"""
+        self._update(self._group(pairs), True)
+
+    def insert(self, pos : int, key) -> None:
+        self.insert_many([(key, pos)])
+
+    def delete_many(self, pairs) -> None:
+        self._update(self._group(pairs), False)
+
+    def delete(self, key, pos : int) -> None:
+        self.delete_many([(key, pos)])
+
+    def lookup(self, lo, hi, size : int = 0, lo_inclusive : bool = True, hi_inclusive : bool = True) -> RoaringBitmap:
+        """Union of the bitmaps of the keys between lo and hi (None is
+        unbounded) spanning at least size positions"""
+        result = RoaringBitmap(size)
+        for key in self._keys_between(lo, hi, lo_inclusive, hi_inclusive):
+            result = result | self.bitmaps[key]
+        return result
+
+    def _keys_between(self, lo, hi, lo_inclusive : bool = True, hi_inclusive : bool = True) -> list:
+        start = 0 if lo is None else (bisect_left if lo_inclusive else bisect_right)(self.keys, lo)
+        stop = len(self.keys) if hi is None else (bisect_right if hi_inclusive else bisect_left)(self.keys, hi)
+        return self.keys[start:stop]
+
+    def search(self, key) -> list[int]:
+        bitmap = self.bitmaps.get(key)
+        return bitmap.to_positions().tolist() if bitmap is not None else []
+
+    def rangeSearch(self, ini, end) -> list[int]:
+        return self.lookup(ini, end).to_positions().tolist()
+
+    def iter_range(self, ini, end):
+        """Positions with ini <= key <= end in key order, a key's bitmap
+        is only expanded once the positions before it are consumed"""
+        for key in self._keys_between(ini, end):
+            # a key may be gone if rows were deleted in the meantime
+            bitmap = self.bitmaps.get(key)
+            if bitmap is not None:
+                yield from bitmap.to_positions().tolist()
+
+    def clear(self) -> None:
+        self.logger.info("Cleaning data, removing files")
+        self.indexFile.buffer.discard(self.indexFile.filename)
+        os.remove(self.indexFile.filename)
@@ -1,6 +1,8 @@
 import struct
 import os
 import sys
+from functools import lru_cache
+from bisect import bisect_left, bisect_right
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -8,17 +10,37 @@ import logger
 from engine.model import TableSchema, Column, DataType, IndexType
 from engine import utils
 from engine import stats
+from engine.buffer import BufferManager, PAGE_SIZE
+
+DEFAULT_NODE_PAGE_SIZE = PAGE_SIZE
+
+def node_format(column: Column, block_factor: int) -> str:
+	return "<" + (utils.calculate_column_format(column) * block_factor) + ("i" * (block_factor + 1)) + "iii"
+
+@lru_cache(maxsize=None)
+def compiled(fmt: str) -> struct.Struct:
+	return struct.Struct(fmt)
+
+def block_factor_for_page(column: Column, page_size: int) -> int:
+	"""Largest number of keys whose node (keys, pointers and the isLeaf, size,
+	nextNode trailer) fits in page_size bytes"""
+	key_size = struct.calcsize("<" + utils.calculate_column_format(column))
+	block_factor = (page_size - 16) // (key_size + 4)
+	if block_factor < 3:
+		raise Exception(f"page size {page_size} too small for B+Tree nodes of {column.name}")
+	return block_factor
 
 class NodeBPlus:
 	BLOCK_FACTOR = 3
-	def __init__(self, column: Column, keys=None, pointers=None, isLeaf:bool = False, size:int = 0, nextNode:int = -1):
+	def __init__(self, column: Column, keys=None, pointers=None, isLeaf:bool = False, size:int = 0, nextNode:int = -1, block_factor:int = BLOCK_FACTOR):
 		if pointers is None:
 			pointers = []
 		if keys is None:
 			keys = []
 		self.column = column
-		self.FORMAT = "<" + str(utils.calculate_column_format(column) * self.BLOCK_FACTOR) + str("i" * (self.BLOCK_FACTOR + 1)) + "iii"
-		self.NODE_SIZE = struct.calcsize(self.FORMAT)
+		self.BLOCK_FACTOR = block_factor
+		self.FORMAT = node_format(column, block_factor)
+		self.NODE_SIZE = compiled(self.FORMAT).size
 		if isLeaf:
 			if len(pointers) != len(keys):
 				raise Exception("Creating leaf node, number of keys and pointers must be equal")
@@ -28,10 +50,8 @@ class NodeBPlus:
 		
 
 		empty_key = utils.get_empty_value(self.column)
-		while len(keys) < self.BLOCK_FACTOR:
-			keys.append(empty_key)
-		while len(pointers) < self.BLOCK_FACTOR + 1:
-			pointers.append(-1)
+		keys.extend([empty_key] * (self.BLOCK_FACTOR - len(keys)))
+		pointers.extend([-1] * (self.BLOCK_FACTOR + 1 - len(pointers)))
 		
 		self.keys = keys
 		self.pointers = pointers
@@ -88,138 +108,333 @@ class NodeBPlus:
 		return self.size == len(self.keys)
 
 	def pack(self) -> bytes:
-		data_buf = b''
-		type = utils.calculate_column_format(self.column)
-		for key in self.keys:
-			data_buf += struct.pack(type, key.encode() if self.column.data_type == DataType.VARCHAR else key)
-		for pointer in self.pointers:
-			data_buf += struct.pack('i', pointer)
-		data_buf += struct.pack('iii', self.isLeaf, self.size, self.nextNode)
-		return data_buf
+		keys = self.keys
+		if self.column.data_type == DataType.VARCHAR:
+			keys = [key.encode() for key in keys]
+		return compiled(self.FORMAT).pack(*keys, *self.pointers, self.isLeaf, self.size, self.nextNode)
 
 	def debug(self):
 		print(f"Node with keys: {self.keys}, pointers: {self.pointers}, isLeaf: {self.isLeaf}, size: {self.size}, nextNode: {self.nextNode}")
 
 	@staticmethod
-	def unpack(record:bytes, column: Column):
+	def unpack(record:bytes, column: Column, blockFactor:int = BLOCK_FACTOR):
 		if(record == None):
 			raise Exception("record is None")
-		isLeaf, size, nextNode = struct.unpack('iii', record[-12:])
-
-		blockFactor = NodeBPlus.BLOCK_FACTOR
-		
 		key_fmt = utils.calculate_column_format(column)
 		key_size = struct.calcsize(key_fmt)
 
-		keys = []
-		pointers = []
+		isLeaf, size, nextNode = compiled("<iii").unpack_from(record, blockFactor * key_size + (blockFactor + 1) * 4)
 
-		for i in range(size):
-			start = i * key_size
-			end = start + key_size
-			val = struct.unpack(key_fmt, record[start:end])[0]
-			if column.data_type == DataType.FLOAT:
-				val = round(val,6)
-			if column.data_type == DataType.VARCHAR:
-				val = val.decode().strip("\x00")
-			keys.append(val)
+		keys = list(compiled("<" + key_fmt * size).unpack_from(record, 0))
+		if column.data_type == DataType.FLOAT:
+			keys = [round(val,6) for val in keys]
+		if column.data_type == DataType.VARCHAR:
+			keys = [val.decode().strip("\x00") for val in keys]
 
 		ptr_start = blockFactor * key_size
-		
-		for i in range(size + 1 - isLeaf):
-			start = ptr_start + i * 4
-			end = start + 4
-			ptr = struct.unpack('i', record[start:end])[0]
-			pointers.append(ptr)
+		pointers = list(compiled("<" + "i" * (size + 1 - isLeaf)).unpack_from(record, ptr_start))
 
-		return NodeBPlus(column, keys, pointers, isLeaf, size, nextNode)
+		return NodeBPlus(column, keys, pointers, isLeaf, size, nextNode, blockFactor)
 
-class BPlusFile:
-	HEADER_SIZE = 4
+class NodeCache:
+	"""Root position and upper internal nodes of an index file, shared by
+	every BPlusFile opened on it"""
+	__slots__ = ("root", "free", "nodes")
+
+	def __init__(self):
+		self.root = None
+		self.free = None
+		self.nodes = {}
 
-	def __init__(self, schema:TableSchema, column:Column):
+	def reset(self):
+		self.root = None
+		self.free = None
+		self.nodes.clear()
+
+class BPlusFile:
+	"""Index file of a B+Tree.
+
+	The first page holds the header (MAGIC, page size, block factor, root,
+	head of the free list) and every node takes one page after it. Freed
+	nodes are chained through nextNode and reused before the file grows.
+	A key inserted more than once keeps a single leaf entry whose pointer
+	refers to a posting list: a chain of pages holding (count, next page)
+	followed by the data positions, linked newest first. Leaf pointers
+	>= 0 are a single data position and <= -2 the page of a posting list.
+	Files written before the header existed start with just the root
+	position and pack nodes of NodeBPlus.BLOCK_FACTOR keys right after it,
+	BPlusTree rewrites them in this layout when it opens them.
+	"""
+	MAGIC = -0x42505431
+	HEADER_FORMAT = "iiiii"
+	POSTING_FORMAT = "<ii"
+	LEGACY_HEADER_SIZE = 4
+	CACHED_LEVELS = 3
+	caches: dict[str, NodeCache] = {}
+
+	def __init__(self, schema:TableSchema, column:Column, page_size:int = None):
 		self.column = column
 		if(column.index_type != IndexType.BTREE):
 			raise Exception("column index type doesn't match with BTREE")
 		self.filename = utils.get_index_file_path(schema.table_name, column.name, IndexType.BTREE)
 		self.logger = logger.CustomLogger(f"BPLUSFILE-{schema.table_name}-{column.name}".upper())
-		
-		self.NODE_SIZE = struct.calcsize("<" + (utils.calculate_column_format(column) * NodeBPlus.BLOCK_FACTOR) + ("i" * (NodeBPlus.BLOCK_FACTOR + 1)) + "iii")
+		self.buffer = BufferManager()
+		self.cache = BPlusFile.caches.setdefault(os.path.abspath(self.filename), NodeCache())
 
 		if not os.path.exists(self.filename):
 			self.logger.fileNotFound(self.filename)
-			self.initialize_file(self.filename)
+			self.initialize_file(self.filename, page_size)
+		elif self.buffer.size(self.filename) == 0:
+			self.logger.fileIsEmpty(self.filename)
+			self.initialize_file(self.filename, page_size)
+		else:
+			self.read_layout()
+
+	def set_layout(self, page_size:int, block_factor:int):
+		self.page_size = page_size
+		self.BLOCK_FACTOR = block_factor
+		raw_size = struct.calcsize(node_format(self.column, block_factor))
+		if page_size is None:
+			self.HEADER_SIZE = self.LEGACY_HEADER_SIZE
+			self.NODE_SIZE = raw_size
 		else:
-			with open(self.filename, "rb+") as file:
-				file.seek(0,2)
-				if(file.tell() == 0):
-					self.logger.fileIsEmpty(self.filename)
-					self.initialize_file(self.filename)
-
-	def initialize_file(self, filename):
-		with open(filename, "wb") as file:
-			header = -1
-			file.write(struct.pack("i", header))
-			stats.count_write()
+			self.HEADER_SIZE = page_size
+			self.NODE_SIZE = page_size
+		self.padding = b"\x00" * (self.NODE_SIZE - raw_size)
+
+	def read_layout(self):
+		size = struct.calcsize(self.HEADER_FORMAT)
+		data = self.buffer.read(self.filename, 0, size)
+		if len(data) == size and struct.unpack_from("i", data)[0] == self.MAGIC:
+			_, page_size, block_factor, _, _ = struct.unpack(self.HEADER_FORMAT, data)
+			self.set_layout(page_size, block_factor)
+		else:
+			self.set_layout(None, NodeBPlus.BLOCK_FACTOR)
+
+	def initialize_file(self, filename, page_size:int = None):
+		page_size = page_size or DEFAULT_NODE_PAGE_SIZE
+		self.set_layout(page_size, block_factor_for_page(self.column, page_size))
+		self.buffer.create(filename)
+		self.cache.reset()
+		header = -1
+		self.buffer.write(filename, 0, struct.pack(self.HEADER_FORMAT, self.MAGIC, page_size, self.BLOCK_FACTOR, header, -1).ljust(self.HEADER_SIZE, b"\x00"))
+		stats.count_write()
+
+	def newNode(self, keys=None, pointers=None, isLeaf:bool = False, size:int = 0, nextNode:int = -1) -> NodeBPlus:
+		return NodeBPlus(self.column, keys, pointers, isLeaf, size, nextNode, self.BLOCK_FACTOR)
+
+	def _root_offset(self) -> int:
+		return 0 if self.page_size is None else struct.calcsize(self.HEADER_FORMAT) - 8
+
+	def _free_offset(self) -> int:
+		return struct.calcsize(self.HEADER_FORMAT) - 4
+
+	def getFreeHead(self) -> int:
+		if self.page_size is None:
+			return -1
+		if self.cache.free is None:
+			data = self.buffer.read(self.filename, self._free_offset(), 4)
+			stats.count_read()
+			self.cache.free = struct.unpack("i", data)[0]
+		return self.cache.free
+
+	def writeFreeHead(self, pos: int):
+		self.cache.free = pos
+		self.buffer.write(self.filename, self._free_offset(), struct.pack("i", pos))
+		stats.count_write()
+
+	def freeBucket(self, pos: int):
+		"""Push a node no longer referenced by the tree onto the free list"""
+		self.cache.nodes.pop(pos, None)
+		if self.page_size is None:
+			return
+		self.writeBucket(pos, self.newNode(isLeaf=True, nextNode=self.getFreeHead()))
+		self.writeFreeHead(pos)
 	
 	def readBucket(self, pos: int) -> NodeBPlus:
 		if(pos == -1):
 			raise Exception(f"Error reading bucket at pos {pos}")
-		with open(self.filename, "rb") as file:
-			offset = self.HEADER_SIZE + pos * self.NODE_SIZE
-			file.seek(offset)
-			data = file.read(self.NODE_SIZE)
-			stats.count_read()
-			if not data or len(data) < self.NODE_SIZE:
-				self.logger.invalidPosition(self.filename, pos)
-				raise Exception(f"Invalid bucket position: {pos}")
-			node = NodeBPlus.unpack(data, self.column)
-			self.logger.readingBucket(self.filename, pos, node.keys)
+		offset = self.HEADER_SIZE + pos * self.NODE_SIZE
+		data = self.buffer.read(self.filename, offset, self.NODE_SIZE)
+		stats.count_read()
+		if not data or len(data) < self.NODE_SIZE:
+			self.logger.invalidPosition(self.filename, pos)
+			raise Exception(f"Invalid bucket position: {pos}")
+		node = NodeBPlus.unpack(data, self.column, self.BLOCK_FACTOR)
+		self.logger.readingBucket(self.filename, pos, node.keys)
+		return node
+
+	def readNode(self, pos: int, level: int) -> NodeBPlus:
+		"""readBucket for a node level steps below the root, internal nodes of
+		the top CACHED_LEVELS levels are kept decoded until they are rewritten"""
+		node = self.cache.nodes.get(pos)
+		if node is not None:
 			return node
+		node = self.readBucket(pos)
+		if not node.isLeaf and level < self.CACHED_LEVELS:
+			self.cache.nodes[pos] = node
+		return node
 
 	def writeBucket(self, pos: int, node: NodeBPlus) -> int:
-		data = node.pack()
-		with open(self.filename, "rb+") as file:
-			if pos == -1:
-				file.seek(0, 2)
-				offset = file.tell()
-				pos = (offset - self.HEADER_SIZE) // self.NODE_SIZE
-			else:
-				offset = self.HEADER_SIZE + pos * self.NODE_SIZE
-				file.seek(offset)
-			file.write(data)
-			stats.count_write()
-			self.logger.writingBucket(self.filename, pos, node.keys)
-			return pos		
+		self.cache.nodes.pop(pos, None)
+		data = node.pack() + self.padding
+		if pos == -1:
+			pos = self.allocate()
+		self.buffer.write(self.filename, self.HEADER_SIZE + pos * self.NODE_SIZE, data)
+		stats.count_write()
+		self.logger.writingBucket(self.filename, pos, node.keys)
+		return pos		
+
+	def writeBuckets(self, nodes: list[NodeBPlus]) -> int:
+		"""Append consecutive buckets in a single write, return the position of the first one"""
+		data = b"".join(node.pack() + self.padding for node in nodes)
+		offset = self.buffer.append(self.filename, data)
+		stats.count_write()
+		return (offset - self.HEADER_SIZE) // self.NODE_SIZE
+
+	def nextPosition(self) -> int:
+		return (self.buffer.size(self.filename) - self.HEADER_SIZE) // self.NODE_SIZE
+
+	def allocate(self) -> int:
+		"""Position for a new node or posting page, popped from the free list when possible"""
+		head = self.getFreeHead()
+		if head == -1:
+			return self.nextPosition()
+		self.writeFreeHead(self.readBucket(head).nextNode)
+		return head
+
+	@staticmethod
+	def isPosting(pointer: int) -> bool:
+		return pointer < -1
+
+	@staticmethod
+	def postingPointer(page: int) -> int:
+		return -page - 2
+
+	@staticmethod
+	def postingPage(pointer: int) -> int:
+		return -pointer - 2
+
+	def postingCapacity(self) -> int:
+		return (self.NODE_SIZE - struct.calcsize(self.POSTING_FORMAT)) // 4
+
+	def readPostingPage(self, page: int) -> tuple[list[int], int]:
+		"""Positions stored in a posting page and the page that follows it"""
+		data = self.buffer.read(self.filename, self.HEADER_SIZE + page * self.NODE_SIZE, self.NODE_SIZE)
+		stats.count_read()
+		if len(data) < self.NODE_SIZE:
+			self.logger.invalidPosition(self.filename, page)
+			raise Exception(f"Invalid posting page: {page}")
+		header = compiled(self.POSTING_FORMAT)
+		count, nextPage = header.unpack_from(data)
+		return list(compiled(f"<{count}i").unpack_from(data, header.size)), nextPage
+
+	def writePostingPage(self, page: int, positions: list[int], nextPage: int) -> int:
+		if len(positions) > self.postingCapacity():
+			raise Exception(f"Posting page overflow: {len(positions)} positions")
+		if page == -1:
+			page = self.allocate()
+		self.cache.nodes.pop(page, None)
+		data = compiled(f"{self.POSTING_FORMAT}{len(positions)}i").pack(len(positions), nextPage, *positions)
+		self.buffer.write(self.filename, self.HEADER_SIZE + page * self.NODE_SIZE, data.ljust(self.NODE_SIZE, b"\x00"))
+		stats.count_write()
+		return page
+
+	def readPostings(self, pointer: int) -> list[int]:
+		"""Every data position a leaf pointer stands for"""
+		if not self.isPosting(pointer):
+			return [pointer]
+		positions = []
+		page = self.postingPage(pointer)
+		while page != -1:
+			chunk, page = self.readPostingPage(page)
+			positions.extend(chunk)
+		return positions
+
+	def writePostings(self, positions: list[int]) -> int:
+		"""Store the positions of one key, returns the leaf pointer to them"""
+		if len(positions) == 1:
+			return positions[0]
+		capacity = self.postingCapacity()
+		page = -1
+		for start in reversed(range(0, len(positions), capacity)):
+			page = self.writePostingPage(-1, positions[start:start + capacity], page)
+		return self.postingPointer(page)
+
+	def addPosting(self, pointer: int, pos: int) -> int:
+		"""Add pos to the positions of a leaf pointer, returns the new pointer.
+		A full head page gets a new page chained in front of it."""
+		if not self.isPosting(pointer):
+			return self.writePostings([pointer, pos])
+		head = self.postingPage(pointer)
+		positions, nextPage = self.readPostingPage(head)
+		if len(positions) < self.postingCapacity():
+			self.writePostingPage(head, positions + [pos], nextPage)
+			return pointer
+		return self.postingPointer(self.writePostingPage(-1, [pos], head))
+
+	def removePosting(self, pointer: int, pos: int = None) -> tuple[bool, int]:
+		"""Remove pos (any position when None) from a leaf pointer. Returns
+		whether it was there and the new pointer, -1 once no position is left"""
+		if not self.isPosting(pointer):
+			if pos is None or pointer == pos:
+				return True, -1
+			return False, pointer
+		head = self.postingPage(pointer)
+		prev, page = -1, head
+		while page != -1:
+			positions, nextPage = self.readPostingPage(page)
+			if pos is None or pos in positions:
+				break
+			prev, page = page, nextPage
+		else:
+			return False, pointer
+
+		positions.remove(positions[-1] if pos is None else pos)
+		if positions:
+			if page == head and nextPage == -1 and len(positions) == 1:
+				self.freeBucket(page)
+				return True, positions[0]
+			self.writePostingPage(page, positions, nextPage)
+			return True, pointer
+		self.freeBucket(page)
+		if prev != -1:
+			self.writePostingPage(prev, self.readPostingPage(prev)[0], nextPage)
+			return True, pointer
+		return True, -1 if nextPage == -1 else self.postingPointer(nextPage)
 
 	def getHeader(self) -> int:
-		with open(self.filename, "rb") as file:
-			file.seek(0)
-			data = file.read(self.HEADER_SIZE)
-			stats.count_read()
-			rootPosition = struct.unpack("i", data)[0]
-			self.logger.readingHeader(self.filename, rootPosition)
-			return rootPosition
+		if self.cache.root is not None:
+			return self.cache.root
+		data = self.buffer.read(self.filename, self._root_offset(), 4)
+		stats.count_read()
+		rootPosition = struct.unpack("i", data)[0]
+		self.logger.readingHeader(self.filename, rootPosition)
+		self.cache.root = rootPosition
+		return rootPosition
 
 	def writeHeader(self, rootPosition: int):
-		with open(self.filename, "rb+") as file:
-			file.seek(0)
-			file.write(struct.pack("i", rootPosition))
-			stats.count_write()
-			self.logger.writingHeader(self.filename, rootPosition)
+		self.cache.root = rootPosition
+		self.buffer.write(self.filename, self._root_offset(), struct.pack("i", rootPosition))
+		stats.count_write()
+		self.logger.writingHeader(self.filename, rootPosition)
 
 
 class BPlusTree:
 	indexFile: BPlusFile
 
-	def __init__(self, schema:TableSchema, column:Column):
+	def __init__(self, schema:TableSchema, column:Column, page_size:int = None):
 		self.column = column
 		self.empty_key = utils.get_empty_value(self.column)
 		if column.index_type != IndexType.BTREE:
 			raise Exception("column index type doesn't match with BTREE")
-		self.indexFile = BPlusFile(schema, column)
-		self.BLOCK_FACTOR = NodeBPlus.BLOCK_FACTOR
+		self.indexFile = BPlusFile(schema, column, page_size)
+		self.BLOCK_FACTOR = self.indexFile.BLOCK_FACTOR
 		self.logger = logger.CustomLogger(f"BPLUSTREE-{schema.table_name}-{column.name}".upper())
+		# legacy files keep duplicate keys in separate entries, which merges
+		# and borrows can't rebalance safely, rebuild them first
+		if self.indexFile.page_size is None and not self.isEmpty():
+			self.vacuum()
 	
 	def insert(self, pos:int, val:any):
 		self.logger.warning(f"INSERTING: {val}")
@@ -227,7 +442,7 @@ class BPlusTree:
 		rootPos = self.indexFile.getHeader()
 		if(rootPos == -1):
 			self.logger.info(f"Creating new root, first record with id: {val}")
-			root = NodeBPlus(column=self.column, isLeaf=True)
+			root = self.indexFile.newNode(isLeaf=True)
 			root.addLeafId(val, pos)
 			rootPos = self.indexFile.writeBucket(-1, root)
 			self.indexFile.writeHeader(rootPos)
@@ -240,8 +455,7 @@ class BPlusTree:
 			return
 		
 		self.logger.info(f"Root was split, Creating new root")
-		newRoot = NodeBPlus(
-			self.column,
+		newRoot = self.indexFile.newNode(
 			keys=[newKey],
 			pointers=[rootPos, newPointer],
 			isLeaf=False,
@@ -252,9 +466,18 @@ class BPlusTree:
 		self.logger.info(f"New root created with keys: {newRoot.keys}")
 		self.logger.successfulInsertion(self.indexFile.filename, val)
 	
-	def insertAux(self, nodePos:int, key:any, pointer:int) -> tuple[bool, any, int]:
-		node:NodeBPlus = self.indexFile.readBucket(nodePos)
+	def insertAux(self, nodePos:int, key:any, pointer:int, level:int = 0) -> tuple[bool, any, int]:
+		node:NodeBPlus = self.indexFile.readNode(nodePos, level)
 		if(node.isLeaf):
+			ite = bisect_left(node.keys, key, 0, node.size)
+			if(ite < node.size and node.keys[ite] == key):
+				postings = self.indexFile.addPosting(node.pointers[ite], pointer)
+				if(postings != node.pointers[ite]):
+					node.pointers[ite] = postings
+					self.indexFile.writeBucket(nodePos, node)
+				self.logger.info(f"key {key} already in leaf, added {pointer} to its posting list")
+				return False, self.empty_key, -1
+
 			node.insertInLeaf(key, pointer)
 			if(not node.isFull()):
 				self.indexFile.writeBucket(nodePos, node)
@@ -265,19 +488,18 @@ class BPlusTree:
 			mid = node.size // 2
 			leftKeys, rightKeys = node.keys[:mid], node.keys[mid:]
 			leftPointers, rightPointers = node.pointers[:mid], node.pointers[mid:-1]
-			newNode = NodeBPlus(self.column, rightKeys, rightPointers, True, len(rightKeys), node.nextNode)
+			newNode = self.indexFile.newNode(rightKeys, rightPointers, True, len(rightKeys), node.nextNode)
 			pos = self.indexFile.writeBucket(-1, newNode)
-			node = NodeBPlus(self.column, leftKeys, leftPointers, True, len(leftKeys), pos)
+			node = self.indexFile.newNode(leftKeys, leftPointers, True, len(leftKeys), pos)
 			self.indexFile.writeBucket(nodePos, node)
 			self.logger.info(f"node leaf spplitted into left node with keys: {node.keys} and right node with keys: {newNode.keys}")
 
 			return True, newNode.keys[0], pos
 
 		else:
-			ite = 0
-			while(ite < node.size and node.keys[ite] < key):
-				ite += 1
-			split, newKey, newPointer = self.insertAux(node.pointers[ite], key, pointer)
+			# same routing as searchAux, keys equal to a separator live on its right
+			ite = bisect_right(node.keys, key, 0, node.size)
+			split, newKey, newPointer = self.insertAux(node.pointers[ite], key, pointer, level + 1)
 
 			if not split:
 				return False, self.empty_key, -1
@@ -295,14 +517,77 @@ class BPlusTree:
 			upKey = node.keys[mid]
 			leftPointers, rightPointers = node.pointers[:mid+1], node.pointers[mid+1:]
 			
-			newNode = NodeBPlus(self.column, rightKeys, rightPointers, False, len(rightKeys), -1)
+			newNode = self.indexFile.newNode(rightKeys, rightPointers, False, len(rightKeys), -1)
 			upPointer = self.indexFile.writeBucket(-1, newNode)
-			node = NodeBPlus(self.column, leftKeys, leftPointers, False, len(leftKeys), -1)
+			node = self.indexFile.newNode(leftKeys, leftPointers, False, len(leftKeys), -1)
 			self.indexFile.writeBucket(nodePos, node)
 			self.logger.info(f"node intern spplitted into left node with keys: {node.keys} and right node with keys: {newNode.keys}")
 
 			return True, upKey, upPointer
 	
+	def isEmpty(self) -> bool:
+		return self.indexFile.getHeader() == -1
+
+	@staticmethod
+	def _chunks(items: list, capacity: int) -> list[list]:
+		"""Split items into the fewest groups of at most capacity elements, as even as possible"""
+		groups = -(-len(items) // capacity)
+		size, extra = divmod(len(items), groups)
+		chunks, start = [], 0
+		for i in range(groups):
+			end = start + size + (1 if i < extra else 0)
+			chunks.append(items[start:end])
+			start = end
+		return chunks
+
+	def bulk_load(self, sorted_pairs: list[tuple[any, int]], fill_factor: float = 1.0):
+		"""Build the tree bottom-up from (key, pos) pairs sorted by key.
+
+		Leaves are packed with fill_factor of the keys a node holds between
+		splits, then every internal level is built over the one below. Each
+		level is written as one sequential block and the header goes last.
+		Pairs sharing a key become one entry whose posting pages are written
+		first. Only valid on an empty tree.
+		"""
+		if not self.isEmpty():
+			raise Exception("bulk load requires an empty B+Tree")
+		if not sorted_pairs:
+			return
+		self.logger.warning(f"BULK-LOADING: {len(sorted_pairs)} keys")
+		capacity = self.BLOCK_FACTOR - 1
+		leaf_capacity = max(1, min(capacity, int(capacity * fill_factor)))
+
+		entries = []
+		for key, pos in sorted_pairs:
+			if entries and entries[-1][0] == key:
+				entries[-1][1].append(pos)
+			else:
+				entries.append((key, [pos]))
+		entries = [(key, self.indexFile.writePostings(positions)) for key, positions in entries]
+
+		chunks = self._chunks(entries, leaf_capacity)
+		first = self.indexFile.nextPosition()
+		leaves = []
+		for i, chunk in enumerate(chunks):
+			nextNode = first + i + 1 if i + 1 < len(chunks) else -1
+			keys = [key for key, _ in chunk]
+			pointers = [pos for _, pos in chunk]
+			leaves.append(self.indexFile.newNode(keys, pointers, True, len(keys), nextNode))
+		first = self.indexFile.writeBuckets(leaves)
+		level = [(chunk[0][0], first + i) for i, chunk in enumerate(chunks)]
+
+		while len(level) > 1:
+			chunks = self._chunks(level, capacity + 1)
+			nodes = []
+			for chunk in chunks:
+				keys = [key for key, _ in chunk[1:]]
+				pointers = [pos for _, pos in chunk]
+				nodes.append(self.indexFile.newNode(keys, pointers, False, len(keys), -1))
+			first = self.indexFile.writeBuckets(nodes)
+			level = [(chunk[0][0], first + i) for i, chunk in enumerate(chunks)]
+
+		self.indexFile.writeHeader(level[0][1])
+
 	def getAll(self) -> list[int]:
 		self.logger.warning(f"GET ALL RECORDS")
 		firstPos:int = self.indexFile.getHeader()
@@ -310,16 +595,18 @@ class BPlusTree:
 			self.logger.info(f"File: {self.indexFile.filename} is empty: []")
 			return []
 		
-		node:NodeBPlus = self.indexFile.readBucket(firstPos)
+		node:NodeBPlus = self.indexFile.readNode(firstPos, 0)
+		level = 0
 		while(not node.isLeaf):
 			firstPos = node.pointers[0]
-			node = self.indexFile.readBucket(firstPos)
+			level += 1
+			node = self.indexFile.readNode(firstPos, level)
 
 		pointers: list[int] = []
 		while(True):
 			assert(node.isLeaf)
 			for i in range(node.size):
-				pointers.append(node.pointers[i])
+				pointers.extend(self.indexFile.readPostings(node.pointers[i]))
 			if(node.nextNode == -1): break
 			node = self.indexFile.readBucket(node.nextNode)
 
@@ -346,55 +633,227 @@ class BPlusTree:
 
 		return self.rangeSearchAux(ini, end)
 
-	def delete(self, key:any):
+	def minKeys(self) -> int:
+		"""Fewest keys a node other than the root may keep, what a split leaves on its smaller side"""
+		return (self.BLOCK_FACTOR - 1) // 2
+
+	def delete(self, key:any, pos:int = None) -> bool:
+		"""Remove one entry with key (and data position pos when given),
+		rebalancing the nodes that underflow. Returns whether it existed."""
 		self.logger.warning(f"DELETING: {key}")
-		pass
+		rootPos = self.indexFile.getHeader()
+		if rootPos == -1:
+			return False
+		found, _ = self.deleteAux(rootPos, key, pos, 0)
+		if not found:
+			self.logger.info(f"NOT FOUND key to delete: {key}")
+			return False
+
+		root = self.indexFile.readNode(rootPos, 0)
+		if root.size == 0:
+			self.logger.info(f"Root with no keys left, shrinking tree")
+			self.indexFile.writeHeader(-1 if root.isLeaf else root.pointers[0])
+			self.indexFile.freeBucket(rootPos)
+		return True
+
+	def deleteAux(self, nodePos:int, key:any, pos:int, level:int) -> tuple[bool, bool]:
+		"""Returns (found, underflow) for the subtree at nodePos"""
+		node:NodeBPlus = self.indexFile.readNode(nodePos, level)
+		keys = node.keys[:node.size]
+		if node.isLeaf:
+			pointers = node.pointers[:node.size]
+			ite = bisect_left(keys, key)
+			while ite < len(keys) and keys[ite] == key:
+				found, pointer = self.indexFile.removePosting(pointers[ite], pos)
+				if found:
+					break
+				ite += 1
+			else:
+				return False, False
+			if pointer != -1:
+				if pointer != pointers[ite]:
+					pointers[ite] = pointer
+					self.indexFile.writeBucket(nodePos, self.indexFile.newNode(keys, pointers, True, len(keys), node.nextNode))
+				return True, False
+			del keys[ite]
+			del pointers[ite]
+			size = len(keys)
+			self.indexFile.writeBucket(nodePos, self.indexFile.newNode(keys, pointers, True, size, node.nextNode))
+			return True, size < self.minKeys()
+
+		# equal keys may sit on both sides of a separator
+		for ite in range(bisect_left(keys, key), bisect_right(keys, key) + 1):
+			found, underflow = self.deleteAux(node.pointers[ite], key, pos, level + 1)
+			if found:
+				break
+		else:
+			return False, False
+		if not underflow:
+			return True, False
+		node = self.fixChild(nodePos, node, ite, level)
+		return True, node.size < self.minKeys()
+
+	def fixChild(self, nodePos:int, node:NodeBPlus, ite:int, level:int) -> NodeBPlus:
+		"""Merge the underflowing child ite of node with a sibling, or borrow
+		from it when both don't fit in one node, and rewrite the separator"""
+		keys = node.keys[:node.size]
+		pointers = node.pointers[:node.size + 1]
+		left = ite - 1 if ite > 0 else ite
+		leftPos, rightPos = pointers[left], pointers[left + 1]
+		leftNode = self.indexFile.readNode(leftPos, level + 1)
+		rightNode = self.indexFile.readNode(rightPos, level + 1)
+		capacity = self.BLOCK_FACTOR - 1
+		isLeaf = leftNode.isLeaf
+		leftKeys = leftNode.keys[:leftNode.size]
+		rightKeys = rightNode.keys[:rightNode.size]
+		leftPointers = leftNode.pointers[:leftNode.size + (not isLeaf)]
+		rightPointers = rightNode.pointers[:rightNode.size + (not isLeaf)]
+		if isLeaf:
+			allKeys = leftKeys + rightKeys
+		else:
+			allKeys = leftKeys + [keys[left]] + rightKeys
+		allPointers = leftPointers + rightPointers
+
+		if len(allKeys) <= capacity:
+			self.logger.info(f"Merging nodes {leftPos} and {rightPos}")
+			nextNode = rightNode.nextNode if isLeaf else -1
+			self.indexFile.writeBucket(leftPos, self.indexFile.newNode(allKeys, allPointers, isLeaf, len(allKeys), nextNode))
+			self.indexFile.freeBucket(rightPos)
+			del keys[left]
+			del pointers[left + 1]
+		else:
+			self.logger.info(f"Redistributing keys between nodes {leftPos} and {rightPos}")
+			mid = len(allKeys) // 2
+			if isLeaf:
+				newLeft = self.indexFile.newNode(allKeys[:mid], allPointers[:mid], True, mid, rightPos)
+				newRight = self.indexFile.newNode(allKeys[mid:], allPointers[mid:], True, len(allKeys) - mid, rightNode.nextNode)
+			else:
+				newLeft = self.indexFile.newNode(allKeys[:mid], allPointers[:mid + 1], False, mid, -1)
+				newRight = self.indexFile.newNode(allKeys[mid + 1:], allPointers[mid + 1:], False, len(allKeys) - mid - 1, -1)
+			self.indexFile.writeBucket(leftPos, newLeft)
+			self.indexFile.writeBucket(rightPos, newRight)
+			keys[left] = allKeys[mid]
+
+		node = self.indexFile.newNode(keys, pointers, False, len(keys), -1)
+		self.indexFile.writeBucket(nodePos, node)
+		return node
+
+	def entries(self) -> list[tuple[any, int]]:
+		"""Every (key, pos) pair in key order, following the leaf chain"""
+		rootPos = self.indexFile.getHeader()
+		if rootPos == -1:
+			return []
+		node = self.indexFile.readNode(rootPos, 0)
+		level = 0
+		while not node.isLeaf:
+			level += 1
+			node = self.indexFile.readNode(node.pointers[0], level)
+		pairs = []
+		while True:
+			for key, pointer in zip(node.keys[:node.size], node.pointers[:node.size]):
+				pairs.extend((key, pos) for pos in self.indexFile.readPostings(pointer))
+			if node.nextNode == -1:
+				return pairs
+			node = self.indexFile.readBucket(node.nextNode)
+
+	def iter_ordered(self, reverse: bool = False):
+		"""Data positions in key order (descending when reverse). Leaves are
+		read as the caller consumes them so stopping early skips the rest"""
+		rootPos = self.indexFile.getHeader()
+		if rootPos == -1:
+			return
+		if not reverse:
+			node = self.indexFile.readNode(rootPos, 0)
+			level = 0
+			while not node.isLeaf:
+				level += 1
+				node = self.indexFile.readNode(node.pointers[0], level)
+			while True:
+				for pointer in node.pointers[:node.size]:
+					yield from self.indexFile.readPostings(pointer)
+				if node.nextNode == -1:
+					return
+				node = self.indexFile.readBucket(node.nextNode)
+
+		# leaves only link forward, walk back through the internal nodes instead
+		stack = [(rootPos, 0)]
+		while stack:
+			nodePos, level = stack.pop()
+			node = self.indexFile.readNode(nodePos, level)
+			if node.isLeaf:
+				for pointer in reversed(node.pointers[:node.size]):
+					yield from self.indexFile.readPostings(pointer)
+			else:
+				stack.extend((child, level + 1) for child in node.pointers[:node.size + 1])
+
+	def vacuum(self):
+		"""Rewrite the index file packed, dropping free nodes and upgrading legacy files"""
+		self.logger.warning(f"VACUUM: {self.indexFile.filename}")
+		pairs = sorted(self.entries(), key=lambda pair: pair[0])
+		self.indexFile.initialize_file(self.indexFile.filename, self.indexFile.page_size)
+		self.BLOCK_FACTOR = self.indexFile.BLOCK_FACTOR
+		self.bulk_load(pairs)
 
 	def rangeSearchAux(self, ini, end) -> list[int]:
+		return list(self.iter_range(ini, end))
+
+	def iter_range(self, ini, end):
+		"""Data positions with ini <= key <= end in key order, None is unbounded.
+		Leaves are read as the caller consumes them so stopping early skips the rest"""
+		for _, pos in self.iter_entries(ini, end):
+			yield pos
+
+	def iter_entries(self, ini, end):
+		"""(key, data position) pairs with ini <= key <= end in key order, like
+		iter_range but keeping the keys the leaves hold"""
+		if(ini == None):
+			ini = utils.get_min_value(self.column)
+		if(end == None):
+			end = utils.get_max_value(self.column)
 		rootPos = self.indexFile.getHeader()
 		if(rootPos == -1):
 			self.logger.fileIsEmpty(self.indexFile.filename)
 			self.logger.info(f"NOT FOUND records in range start: {ini} and end: {end}")
-			return []
+			return
 		
-		leafPos = self.searchAux(rootPos, ini)
+		leafPos, leafNode = self.searchAux(rootPos, ini)
 		
-		ite = 0
-		result = []
-		leafNode = self.indexFile.readBucket(leafPos)
-		while(ite < leafNode.size and leafNode.keys[ite] < ini):
-			ite += 1
+		# legacy files may hold a key in several entries spread over sibling
+		# leaves, paged ones keep it in one entry so the scan stops at end
+		distinct = self.indexFile.page_size is not None
+		ite = bisect_left(leafNode.keys, ini, 0, leafNode.size)
 
-		if(leafNode.nextNode != -1 and ite == leafNode.size):
+		if(leafNode.nextNode != -1 and ite == leafNode.size and not (distinct and ini == end)):
 			leafNode = self.indexFile.readBucket(leafNode.nextNode)
 			ite = 0
 			
-		while(leafNode.keys[ite] <= end):
-			result.append(leafNode.pointers[ite])
+		while(ite < leafNode.size and leafNode.keys[ite] <= end):
+			key = leafNode.keys[ite]
+			for pos in self.indexFile.readPostings(leafNode.pointers[ite]):
+				yield key, pos
 			ite += 1
 			if(ite == leafNode.size):
-				if(leafNode.nextNode == -1):
+				if(leafNode.nextNode == -1 or (distinct and leafNode.keys[ite - 1] >= end)):
 					break
 				leafNode = self.indexFile.readBucket(leafNode.nextNode)
 				ite = 0
-		return result
 	
-	def searchAux(self, nodePos:int, key) -> int:
-		node:NodeBPlus = self.indexFile.readBucket(nodePos)
+	def searchAux(self, nodePos:int, key, level:int = 0) -> tuple[int, NodeBPlus]:
+		node:NodeBPlus = self.indexFile.readNode(nodePos, level)
 		if(node.isLeaf):
-			return nodePos
+			return nodePos, node
 		else:
 			self.logger.info(f"Searching in internal node: key={key}")
-			ite = 0
-			while(ite < node.size and node.keys[ite] < key):
-				ite += 1
+			ite = bisect_left(node.keys, key, 0, node.size)
 			if(ite < node.size and node.keys[ite] == key):
 				ite += 1
 			self.logger.info(f"Going to pointer: {node.pointers[ite]}")
-			return self.searchAux(node.pointers[ite], key)
+			return self.searchAux(node.pointers[ite], key, level + 1)
 	
 	def clear(self):
 		self.logger.info("Cleaning data, removing files")
+		self.indexFile.buffer.discard(self.indexFile.filename)
+		self.indexFile.cache.reset()
 		os.remove(self.indexFile.filename)
 
 	def printBuckets(self):
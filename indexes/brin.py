@@ -0,0 +1,180 @@
+import os, sys, struct
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import logger
+from engine.model import TableSchema, Column, IndexType, DataType
+from engine import utils
+from engine import stats
+from engine.buffer import BufferManager
+from engine.record import RecordFile
+from engine.scan import HeapScan
+
+BRIN_RANGE_SLOTS = 128
+
+
+class BRINFile:
+    """Block range summaries: the header holds (slots per range, ranges) and
+    every range of consecutive heap slots gets one (has_values, min, max)
+    entry. Floats are kept as doubles holding the values the heap scans
+    compare, VARCHARs as the encoded bytes."""
+    HEADER_FORMAT = "<ii"
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+    def __init__(self, schema : TableSchema, column : Column, range_slots : int = BRIN_RANGE_SLOTS):
+        self.column = column
+        self.filename = utils.get_index_file_path(schema.table_name, column.name, IndexType.BRIN)
+        self.logger = logger.CustomLogger(f"BRINFILE-{schema.table_name}-{column.name}".upper())
+        key_format = "d" if column.data_type == DataType.FLOAT else utils.calculate_column_format(column)
+        self.entry = struct.Struct(f"<?{key_format}{key_format}")
+        self.buffer = BufferManager()
+        if not os.path.exists(self.filename):
+            self.logger.fileNotFound(self.filename)
+            self.buffer.create(self.filename)
+        header = self.buffer.read(self.filename, 0, self.HEADER_SIZE)
+        stats.count_read()
+        if not header:
+            self.logger.fileIsEmpty(self.filename)
+            self.range_slots, self.ranges = range_slots, 0
+            self.write_header()
+        else:
+            self.range_slots, self.ranges = struct.unpack(self.HEADER_FORMAT, header)
+
+    def write_header(self) -> None:
+        self.buffer.write(self.filename, 0, struct.pack(self.HEADER_FORMAT, self.range_slots, self.ranges))
+        stats.count_write()
+
+    def read_all(self) -> list[tuple | None]:
+        """(min, max) of every range, None for a range without values"""
+        data = self.buffer.read(self.filename, self.HEADER_SIZE, self.ranges * self.entry.size)
+        stats.count_read()
+        summaries = []
+        for has_values, lo, hi in self.entry.iter_unpack(data):
+            if self.column.data_type == DataType.VARCHAR:
+                lo, hi = lo.rstrip(b"\x00"), hi.rstrip(b"\x00")
+            summaries.append((lo, hi) if has_values else None)
+        return summaries
+
+    def write(self, i : int, summary : tuple | None) -> None:
+        if summary is None:
+            data = self.entry.pack(False, *([b""] * 2 if self.column.data_type == DataType.VARCHAR else [0] * 2))
+        else:
+            data = self.entry.pack(True, *summary)
+        self.buffer.write(self.filename, self.HEADER_SIZE + i * self.entry.size, data)
+        stats.count_write()
+        if i >= self.ranges:
+            self.ranges = i + 1
+            self.write_header()
+
+    def write_all(self, summaries : list[tuple | None]) -> None:
+        self.ranges = 0
+        self.buffer.create(self.filename)
+        self.write_header()
+        for i, summary in enumerate(summaries):
+            self.write(i, summary)
+
+
+class BRINIndex:
+    """Block range index: min and max of the column for every run of
+    range_slots heap slots of table.dat. A search only scans the runs whose
+    summary can hold a match, which prunes almost everything when the
+    column follows the insertion order (ids, timestamps).
+
+    Summaries only widen: a delete leaves them as they are, they are still
+    a valid bound for the rows left."""
+    def __init__(self, schema : TableSchema, column : Column, range_slots : int = BRIN_RANGE_SLOTS):
+        if column.data_type == DataType.POINT:
+            raise Exception("BRIN index not supported for POINT data type")
+        self.schema = schema
+        self.column = column
+        self.indexFile = BRINFile(schema, column, range_slots)
+        self.scan = HeapScan(RecordFile(schema))
+        self.summaries = self.indexFile.read_all()
+        self.logger = logger.CustomLogger(f"BRININDEX-{schema.table_name}-{column.name}".upper())
+
+    def _encode(self, key):
+        """A searched key in the form the summaries hold"""
+        return key.encode() if self.column.data_type == DataType.VARCHAR else key
+
+    def _stored(self, key):
+        """An inserted key as the heap scans will read it back"""
+        if self.column.data_type == DataType.FLOAT:
+            return round(float(np.float32(key)), 6)
+        return self._encode(key)
+
+    def insert(self, pos : int, key) -> None:
+        """Widen the summary of the range that holds pos"""
+        i = pos // self.indexFile.range_slots
+        key = self._stored(key)
+        while len(self.summaries) <= i:
+            self.summaries.append(None)
+        summary = self.summaries[i]
+        if summary is not None and summary[0] <= key <= summary[1]:
+            return
+        summary = (key, key) if summary is None else (min(summary[0], key), max(summary[1], key))
+        self.summaries[i] = summary
+        self.indexFile.write(i, summary)
+
+    def build(self) -> None:
+        """Summarize every range from the live rows of the heap"""
+        rows = self.scan.rows()
+        values = self.scan.comparison_values(rows, self.column)
+        live = self.scan.live(rows)
+        slots = self.indexFile.range_slots
+        summaries = []
+        for start in range(0, len(rows), slots):
+            chunk = values[start:start + slots][live[start:start + slots]]
+            if len(chunk) == 0:
+                summaries.append(None)
+            elif chunk.dtype.kind == "S":
+                chunk = chunk.tolist()
+                summaries.append((min(chunk), max(chunk)))
+            else:
+                summaries.append((chunk.min().item(), chunk.max().item()))
+        self.summaries = summaries
+        self.indexFile.write_all(summaries)
+
+    def _spans(self, lo, hi):
+        """Slot spans [start, stop) of consecutive ranges whose summary
+        intersects [lo, hi], None is unbounded"""
+        slots = self.indexFile.range_slots
+        start = None
+        for i, summary in enumerate(self.summaries):
+            hit = summary is not None and (lo is None or summary[1] >= lo) and (hi is None or summary[0] <= hi)
+            if hit and start is None:
+                start = i * slots
+            elif not hit and start is not None:
+                yield start, i * slots
+                start = None
+        if start is not None:
+            yield start, len(self.summaries) * slots
+
+    def search(self, key) -> list[int]:
+        encoded = self._encode(key)
+        result = []
+        for start, stop in self._spans(encoded, encoded):
+            result.extend(self.scan.search(self.column, key, start, stop).tolist())
+        return result
+
+    def rangeSearch(self, ini, end) -> list[int]:
+        return list(self.iter_range(ini, end))
+
+    def iter_range(self, ini, end):
+        """Positions with ini <= key <= end in heap order, the candidate runs
+        are scanned as the positions are consumed"""
+        lo = None if ini is None else self._encode(ini)
+        hi = None if end is None else self._encode(end)
+        slots = self.indexFile.range_slots
+        for start, stop in self._spans(lo, hi):
+            # one range at a time, a span can cover the whole heap
+            for window in range(start, stop, slots):
+                yield from self.scan.range_search(self.column, ini, end, window, min(window + slots, stop)).tolist()
+
+    def delete(self, key) -> None:
+        pass
+
+    def clear(self) -> None:
+        self.logger.info("Cleaning data, removing files")
+        self.indexFile.buffer.discard(self.indexFile.filename)
+        os.remove(self.indexFile.filename)
@@ -0,0 +1,164 @@
+import os, sys, struct
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import logger
+from engine.model import TableSchema, Column, CompositeIndex, IndexType, DataType
+from indexes.bplustree import BPlusTree
+from indexes.EHtree import ExtendibleHashTree
+
+SIGN_BIT = 1 << 63
+ALL_BITS = (1 << 64) - 1
+
+
+class CompositeKey:
+    """Tuples of column values as fixed width strings that sort like the
+    tuples: every value becomes big endian bytes whose unsigned order is the
+    order of the values, written in hex. The tuples that start with the same
+    values then form a range of keys, which is what leftmost prefix lookups
+    read."""
+    def __init__(self, columns : list[Column]):
+        self.columns = columns
+        self.length = sum(self._width(column) for column in columns)
+
+    @staticmethod
+    def _width(column : Column) -> int:
+        """Hex digits of a value of column"""
+        match column.data_type:
+            case DataType.INT:
+                return 8
+            case DataType.FLOAT:
+                return 16
+            case DataType.BOOL:
+                return 2
+            case DataType.VARCHAR:
+                return 2 * column.varchar_length
+        raise Exception(f"composite index not supported for {column.data_type} data type")
+
+    @staticmethod
+    def _encode(column : Column, value) -> str:
+        match column.data_type:
+            case DataType.INT:
+                data = struct.pack(">I", (value + (1 << 31)) & 0xFFFFFFFF)
+            case DataType.FLOAT:
+                bits, = struct.unpack(">Q", struct.pack(">d", value))
+                # negatives reversed, positives above them
+                data = struct.pack(">Q", bits ^ ALL_BITS if bits & SIGN_BIT else bits | SIGN_BIT)
+            case DataType.BOOL:
+                data = b"\x01" if value else b"\x00"
+            case DataType.VARCHAR:
+                data = value.encode().ljust(column.varchar_length, b"\x00")
+        return data.hex()
+
+    @staticmethod
+    def _decode(column : Column, data : bytes):
+        match column.data_type:
+            case DataType.INT:
+                return struct.unpack(">I", data)[0] - (1 << 31)
+            case DataType.FLOAT:
+                bits, = struct.unpack(">Q", data)
+                return struct.unpack(">d", struct.pack(">Q", bits ^ SIGN_BIT if bits & SIGN_BIT else bits ^ ALL_BITS))[0]
+            case DataType.BOOL:
+                return data != b"\x00"
+            case DataType.VARCHAR:
+                return data.rstrip(b"\x00").decode()
+
+    def decode(self, key : str) -> list:
+        """Values of every column of a key"""
+        data = bytes.fromhex(key)
+        values, offset = [], 0
+        for column in self.columns:
+            width = self._width(column) // 2
+            values.append(self._decode(column, data[offset:offset + width]))
+            offset += width
+        return values
+
+    def encode(self, values) -> str:
+        """Key of the first len(values) columns"""
+        return "".join(self._encode(column, value) for column, value in zip(self.columns, values))
+
+    def stored(self, values) -> str:
+        """Key of an inserted row, floats as the heap scans read them back"""
+        values = [round(float(np.float32(value)), 6) if column.data_type == DataType.FLOAT else value for column, value in zip(self.columns, values)]
+        return self.encode(values)
+
+    def bounds(self, prefix : list, lo = None, hi = None) -> tuple[str, str]:
+        """Smallest and largest key of the tuples starting with prefix whose
+        next value is between lo and hi, None is unbounded"""
+        low = high = self.encode(prefix)
+        if lo is not None:
+            low += self._encode(self.columns[len(prefix)], lo)
+        if hi is not None:
+            high += self._encode(self.columns[len(prefix)], hi)
+        return low.ljust(self.length, "0"), high.ljust(self.length, "f")
+
+
+class CompositeKeyIndex:
+    """B+Tree or extendible hash over the CompositeKey of several columns.
+    The tree indexes a VARCHAR column named after the indexed columns, so
+    the B+Tree answers every leftmost prefix of them, the hash only full
+    tuples. Included columns go at the end of the key, where they don't
+    change which keys a prefix selects, and come back with iter_entries."""
+    def __init__(self, schema : TableSchema, index : CompositeIndex):
+        columns = [schema.get_column_by_name(name) for name in index.key_columns()]
+        self.index = index
+        self.key = CompositeKey(columns)
+        self.fields = [schema.columns.index(column) for column in columns]
+        self.column = Column("+".join(index.key_columns()), DataType.VARCHAR, index_type=index.index_type, varchar_length=self.key.length, index_name=index.name)
+        self.logger = logger.CustomLogger(f"COMPOSITE-{schema.table_name}-{self.column.name}".upper())
+        match index.index_type:
+            case IndexType.BTREE:
+                self.tree = BPlusTree(schema, self.column)
+            case IndexType.HASH:
+                self.tree = ExtendibleHashTree(schema, self.column)
+            case _:
+                raise Exception(f"{index.index_type} index not supported on more than one column")
+
+    def row_key(self, values : list) -> str:
+        """Key of a record given all its values"""
+        return self.key.stored([values[i] for i in self.fields])
+
+    def insert_many(self, rows) -> None:
+        """Index (record values, pos) pairs"""
+        batch = sorted((self.row_key(values), pos) for values, pos in rows)
+        if self.index.index_type == IndexType.BTREE and self.tree.isEmpty():
+            self.tree.bulk_load(batch)
+            return
+        for key, pos in batch:
+            self.tree.insert(pos, key)
+
+    def delete(self, values : list, pos : int) -> None:
+        if self.index.index_type == IndexType.BTREE:
+            self.tree.delete(self.row_key(values), pos)
+        else:
+            self.tree.delete(self.row_key(values))
+
+    def search(self, values : list) -> list[int]:
+        """Positions whose columns equal values"""
+        if len(values) < len(self.key.columns):
+            return self.prefix_search(values)
+        return self.tree.search(self.key.encode(values))
+
+    def contains(self, values : list) -> bool:
+        """Whether a record with all of values is indexed"""
+        return len(self.tree.search(self.row_key(values))) > 0
+
+    def prefix_search(self, prefix : list, lo = None, hi = None) -> list[int]:
+        """Positions whose first columns equal prefix and whose next column
+        is between lo and hi (None is unbounded)"""
+        if self.index.index_type != IndexType.BTREE:
+            raise Exception("prefix search not supported for HASH indexes")
+        return self.tree.rangeSearch(*self.key.bounds(prefix, lo, hi))
+
+    def iter_entries(self, prefix : list, lo = None, hi = None):
+        """(values of every key column, pos) of the prefix_search matches in
+        key order, read from the leaves without touching the table"""
+        for key, pos in self.tree.iter_entries(*self.key.bounds(prefix, lo, hi)):
+            yield self.key.decode(key), pos
+
+    def vacuum(self) -> None:
+        self.tree.vacuum()
+
+    def clear(self) -> None:
+        self.tree.clear()
@@ -4,13 +4,17 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from engine.model import TableSchema, Column
-from engine import utils
 from engine.record import RecordFile
+from engine.scan import HeapScan
+
+RANGE_BATCH_SLOTS = 1024  # heap slots scanned at a time by iter_range
 
 class NoIndex:
 	def __init__(self, schema:TableSchema, column:Column):
 		self.column = column
 		self.schema = schema
+		self.record_file = RecordFile(schema)
+		self.scan = HeapScan(self.record_file)
 		for pos, i in enumerate(schema.columns):
 			if i == column:
 				self.value_pos = pos
@@ -23,35 +27,20 @@ class NoIndex:
 		pass
 	
 	def search(self, key) -> list[int]:
-		record_file = RecordFile(self.schema)
-		pos = 0
-		max_pos = record_file.max_id()
-		res = []
-		
-		while pos < max_pos:
-			record = record_file.read(pos)
-			if record.values[self.value_pos] == key:
-				res.append(pos)
-			pos += 1
-		return res
+		return self.scan.search(self.column, key).tolist()
 
 	def rangeSearch(self, ini, end) -> list[int]:
-		if(ini == None):
-			ini = utils.get_min_value(self.column)
-		if(end == None):
-			end = utils.get_max_value(self.column)
-		
-		record_file = RecordFile(self.schema)
-		pos = 0
-		max_pos = record_file.max_id()
-		res = []
-		
-		while pos < max_pos:
-			record = record_file.read(pos)
-			if record.values[self.value_pos] >= ini and record.values[self.value_pos] <= end:
-				res.append(pos)
-			pos += 1
-		return res
+		return self.scan.range_search(self.column, ini, end).tolist()
+
+	def iter_range(self, ini, end):
+		"""rangeSearch a window of slots at a time, the rest of the heap
+		is only scanned if the positions found so far are consumed"""
+		count = self.record_file.max_id()
+		for start in range(0, count, RANGE_BATCH_SLOTS):
+			yield from self.scan.range_search(self.column, ini, end, start, min(start + RANGE_BATCH_SLOTS, count)).tolist()
+
+	def delete(self, key):
+		pass
 	
 	def clear(self):
 		pass
\ No newline at end of file
@@ -26,17 +26,20 @@ class SelectStmt(Stmt):
         self.column_list.append(column_name)
 
 class InsertStmt(Stmt):
-    def __init__(self, table_name : str = None, column_list : list[str] = None, value_list : list = None):
+    def __init__(self, table_name : str = None, column_list : list[str] = None, value_lists : list[list] = None):
         super().__init__()
         self.table_name = table_name
         self.column_list = column_list if column_list else []
-        self.value_list = value_list if value_list else []
+        self.value_lists = value_lists if value_lists else []
 
     def add_column(self, column_name : str) -> None:
         self.column_list.append(column_name)
 
+    def add_row(self) -> None:
+        self.value_lists.append([])
+
     def add_value(self, value) -> None:
-        self.value_list.append(value)
+        self.value_lists[-1].append(value)
 
 class DeleteStmt(Stmt):
     def __init__(self, table_name : str = None, condition : Condition = None):
@@ -70,22 +73,37 @@ class DropTableStmt(Stmt):
         self.user_id = user_id
 
 class CreateIndexStmt(Stmt):
-    def __init__(self, index_name : str = None, table_name : str = None, index_type : IndexType = None, column_list : list[str] = None):
+    def __init__(self, index_name : str = None, table_name : str = None, index_type : IndexType = None, column_list : list[str] = None, include_list : list[str] = None):
         super().__init__()
         self.index_name = index_name
         self.table_name = table_name
         self.index_type = index_type
         self.column_list = column_list if column_list else []
+        self.include_list = include_list if include_list else []
 
     def add_column(self, column_name : str) -> None:
         self.column_list.append(column_name)
 
+    def add_include(self, column_name : str) -> None:
+        self.include_list.append(column_name)
+
 class DropIndexStmt(Stmt):
     def __init__(self, index_name : str = None, table_name : str = None):
         super().__init__()
         self.index_name = index_name
         self.table_name = table_name
 
+class VacuumIndexStmt(Stmt):
+    def __init__(self, index_name : str = None, table_name : str = None):
+        super().__init__()
+        self.index_name = index_name
+        self.table_name = table_name
+
+class AnalyzeStmt(Stmt):
+    def __init__(self, table_name : str = None):
+        super().__init__()
+        self.table_name = table_name
+
 class SQL:
     def __init__(self, stmt_list : list[Stmt] = None):
         self.stmt_list = stmt_list if stmt_list else []
@@ -183,6 +201,12 @@ class Parser:
             return self.parse_insert_stmt()
         elif self.match(Token.Type.DELETE):
             return self.parse_delete_stmt()
+        elif self.match(Token.Type.VACUUM):
+            if not self.match(Token.Type.INDEX):
+                self.error("expected INDEX keyword after VACUUM keyword")
+            return self.parse_vacuum_index_stmt()
+        elif self.match(Token.Type.ANALYZE):
+            return self.parse_analyze_stmt()
         elif self.match(Token.Type.SELECT):
             return self.parse_select_stmt()
         else:
@@ -293,6 +317,8 @@ class Parser:
                     column_definition.index_type = IndexType.RTREE
                 case "BRIN":
                     column_definition.index_type = IndexType.BRIN
+                case "BITMAP":
+                    column_definition.index_type = IndexType.BITMAP
                 case _:
                     self.error("unknown index type")
         else:
@@ -333,8 +359,15 @@ class Parser:
                 self.error("expected ')' after column names")
         if not self.match(Token.Type.VALUES):
             self.error("expected VALUES clause in INSERT statement")
+        self.parse_insert_row(insert_stmt)
+        while self.match(Token.Type.COMMA):
+            self.parse_insert_row(insert_stmt)
+        return insert_stmt
+
+    def parse_insert_row(self, insert_stmt : InsertStmt) -> None:
         if not self.match(Token.Type.LPAR):
-            self.error("expected '(' after VALUES keyword")
+            self.error("expected '(' before row values")
+        insert_stmt.add_row()
         if self.match(Token.Type.LPAR):
             if not self.match(Token.Type.FLOATVAL):
                 self.error("expected a valid float value por x coordinate on POINT declaration")
@@ -370,7 +403,6 @@ class Parser:
                 insert_stmt.add_value(self.str_into_type(self.previous.lexema, self.previous))
         if not self.match(Token.Type.RPAR):
             self.error("expected ')' after values")
-        return insert_stmt
     def parse_delete_stmt(self) -> DeleteStmt:
         delete_stmt = DeleteStmt()
         if not self.match(Token.Type.FROM):
@@ -408,6 +440,8 @@ class Parser:
                     create_index_stmt.index_type = IndexType.RTREE
                 case "BRIN":
                     create_index_stmt.index_type = IndexType.BRIN
+                case "BITMAP":
+                    create_index_stmt.index_type = IndexType.BITMAP
                 case _:
                     self.error("unknown index type")
         if not self.match(Token.Type.LPAR):
@@ -421,6 +455,18 @@ class Parser:
             create_index_stmt.add_column(self.previous.lexema)
         if not self.match(Token.Type.RPAR):
             self.error("expected ')' after column names")
+        if self.match(Token.Type.INCLUDE):
+            if not self.match(Token.Type.LPAR):
+                self.error("expected '(' after INCLUDE keyword")
+            if not self.match(Token.Type.ID):
+                self.error("expected column name after '('")
+            create_index_stmt.add_include(self.previous.lexema)
+            while self.match(Token.Type.COMMA):
+                if not self.match(Token.Type.ID):
+                    self.error("expected column name after comma")
+                create_index_stmt.add_include(self.previous.lexema)
+            if not self.match(Token.Type.RPAR):
+                self.error("expected ')' after included column names")
         return create_index_stmt
 
     def parse_drop_index_stmt(self) -> DropIndexStmt:
@@ -435,6 +481,25 @@ class Parser:
         drop_index_stmt.table_name = self.previous.lexema
         return drop_index_stmt
 
+    def parse_vacuum_index_stmt(self) -> VacuumIndexStmt:
+        vacuum_index_stmt = VacuumIndexStmt()
+        if not self.match(Token.Type.ID):
+            self.error("expected index name after VACUUM INDEX keyword")
+        vacuum_index_stmt.index_name = self.previous.lexema
+        if not self.match(Token.Type.ON):
+            self.error("expected ON keyword after index name")
+        if not self.match(Token.Type.ID):
+            self.error("expected table name after ON keyword")
+        vacuum_index_stmt.table_name = self.previous.lexema
+        return vacuum_index_stmt
+
+    def parse_analyze_stmt(self) -> AnalyzeStmt:
+        analyze_stmt = AnalyzeStmt()
+        if not self.match(Token.Type.ID):
+            self.error("expected table name after ANALYZE keyword")
+        analyze_stmt.table_name = self.previous.lexema
+        return analyze_stmt
+
     def parse_or_condition(self) -> Condition:
         left = self.parse_and_condition()
         while self.match(Token.Type.OR):
@@ -632,6 +697,10 @@ class Printer:
             self.print_create_index_stmt(stmt)
         elif stmt_type == DropIndexStmt:
             self.print_drop_index_stmt(stmt)
+        elif stmt_type == VacuumIndexStmt:
+            self.print_vacuum_index_stmt(stmt)
+        elif stmt_type == AnalyzeStmt:
+            self.print_analyze_stmt(stmt)
         else:
             self.error("unknown statement type")
 
@@ -788,6 +857,8 @@ class Printer:
                 self.print_line(f"-> RTREE")
             case IndexType.BRIN:
                 self.print_line(f"-> BRIN")
+            case IndexType.BITMAP:
+                self.print_line(f"-> BITMAP")
             case IndexType.NONE:
                 self.print_line(f"-> NONE")
         self.indent -= 2
@@ -814,7 +885,8 @@ class Printer:
             self.indent -= 2
         self.print_line("-> Values:")
         self.indent += 2
-        self.print_line(f"-> {', '.join(str(value) for value in stmt.value_list)}")
+        for value_list in stmt.value_lists:
+            self.print_line(f"-> {', '.join(str(value) for value in value_list)}")
         self.indent -= 4
 
     def print_delete_stmt(self, stmt : DeleteStmt):
@@ -853,11 +925,19 @@ class Printer:
                 self.print_line(f"-> RTREE")
             case IndexType.BRIN:
                 self.print_line(f"-> BRIN")
+            case IndexType.BITMAP:
+                self.print_line(f"-> BITMAP")
         self.indent -= 2
         self.print_line("-> On columns:")
         self.indent += 2
         self.print_line(f"-> {', '.join(str(column) for column in stmt.column_list)}")
-        self.indent -= 4
+        self.indent -= 2
+        if stmt.include_list:
+            self.print_line("-> Including columns:")
+            self.indent += 2
+            self.print_line(f"-> {', '.join(str(column) for column in stmt.include_list)}")
+            self.indent -= 2
+        self.indent -= 2
 
     def print_drop_index_stmt(self, stmt : DropIndexStmt):
         self.print_line("DROP INDEX statement:")
@@ -873,6 +953,26 @@ class Printer:
             self.indent -= 2
         self.indent -= 2
 
+    def print_vacuum_index_stmt(self, stmt : VacuumIndexStmt):
+        self.print_line("VACUUM INDEX statement:")
+        self.indent += 2
+        self.print_line("-> Index name:")
+        self.indent += 2
+        self.print_line(f"-> {stmt.index_name}")
+        self.indent -= 2
+        self.print_line("-> On table:")
+        self.indent += 2
+        self.print_line(f"-> {stmt.table_name}")
+        self.indent -= 4
+
+    def print_analyze_stmt(self, stmt : AnalyzeStmt):
+        self.print_line("ANALYZE statement:")
+        self.indent += 2
+        self.print_line("-> Table name:")
+        self.indent += 2
+        self.print_line(f"-> {stmt.table_name}")
+        self.indent -= 4
+
 
 class RuntimeError(Exception):
     def __init__(self, error : str):
@@ -882,8 +982,9 @@ class RuntimeError(Exception):
 
 
 class Interpreter:
-    def __init__(self):
+    def __init__(self, stream : bool = False):
         self.dbmanager = DBManager()
+        self.stream = stream
 
     def error(self, error : str):
         raise RuntimeError(error)
@@ -923,11 +1024,19 @@ class Interpreter:
         elif stmt_type == DropIndexStmt:
             self.interpret_drop_index_stmt(stmt)
             return None, "Index dropped successfully"
+        elif stmt_type == VacuumIndexStmt:
+            self.interpret_vacuum_index_stmt(stmt)
+            return None, "Index vacuumed successfully"
+        elif stmt_type == AnalyzeStmt:
+            self.interpret_analyze_stmt(stmt)
+            return None, "Table analyzed successfully"
         else:
             self.error("unknown statement type")
 
     def interpret_select_stmt(self, stmt : SelectStmt):
         select_schema = SelectSchema(stmt.table_name, ConditionSchema(stmt.condition), stmt.all, stmt.column_list, stmt.order_by, stmt.asc, stmt.limit)
+        if self.stream:
+            return self.dbmanager.select_cursor(select_schema)
         return self.dbmanager.select(select_schema)
 
     def interpret_create_table_stmt(self, stmt : CreateTableStmt):
@@ -939,20 +1048,28 @@ class Interpreter:
         self.dbmanager.drop_table(stmt.table_name, stmt.if_exists)
 
     def interpret_insert_stmt(self, stmt : InsertStmt):
-        self.dbmanager.insert(stmt.table_name, stmt.value_list, stmt.column_list)
+        self.dbmanager.insert_many(stmt.table_name, stmt.value_lists, stmt.column_list)
 
     def interpret_delete_stmt(self, stmt : DeleteStmt):
         delete_schema = DeleteSchema(stmt.table_name, ConditionSchema(stmt.condition))
         self.dbmanager.delete(delete_schema)
 
     def interpret_create_index_stmt(self, stmt : CreateIndexStmt):
-        self.dbmanager.create_index(stmt.table_name, stmt.index_name, stmt.column_list, stmt.index_type)
+        self.dbmanager.create_index(stmt.table_name, stmt.index_name, stmt.column_list, stmt.index_type, stmt.include_list)
 
     def interpret_drop_index_stmt(self, stmt : DropIndexStmt):
         self.dbmanager.drop_index(stmt.table_name, stmt.index_name)
 
+    def interpret_vacuum_index_stmt(self, stmt : VacuumIndexStmt):
+        self.dbmanager.vacuum_index(stmt.table_name, stmt.index_name)
+
+    def interpret_analyze_stmt(self, stmt : AnalyzeStmt):
+        self.dbmanager.analyze(stmt.table_name)
+
 
-def execute_sql(sql:str):
+def execute_sql(sql:str, stream:bool = False):
+    """Run sql and return (result, message). With stream, the records of a
+    SELECT come as a generator that reads them as they are consumed"""
     scanner = Scanner(sql)
     try:
         parser = Parser(scanner)
@@ -961,7 +1078,7 @@ def execute_sql(sql:str):
         return None, str(e)
 
     try:
-        interpreter = Interpreter()
+        interpreter = Interpreter(stream)
         return interpreter.interpret(sql_parse)
     except RuntimeError as e:
         return None, str(e)
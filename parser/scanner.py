@@ -7,8 +7,9 @@ class Token:
             CREATE, TABLE, DROP, AND, OR, NOT, AS, ORDER, BY, LIMIT, ID, STAR, BETWEEN,
             EQ, NEQ, LT, GT, LE, GE, COMMA, DOT, SEMICOLON, NUMVAL, FLOATVAL, STRINGVAL,
             BOOLVAL, PRIMARY, KEY, DATATYPE, INDEX, ON, USING, INDEXTYPE, ERR, END, 
-            WITHIN, RECTANGLE, CIRCLE, KNN, ASC, DESC, IF, EXISTS
-        ) = range(54)
+            WITHIN, RECTANGLE, CIRCLE, KNN, ASC, DESC, IF, EXISTS, VACUUM,
+            ANALYZE, INCLUDE
+        ) = range(57)
 
     token_names = [
         "LPAR", "RPAR", "SELECT", "FROM", "WHERE", "INSERT", "INTO", "VALUES",
@@ -17,7 +18,7 @@ class Token:
         "GT", "LE", "GE", "COMMA", "DOT", "SEMICOLON", "NUMVAL", "FLOATVAL", "STRINGVAL",
         "BOOLVAL", "PRIMARY", "KEY", "DATATYPE", "INDEX", "ON", "USING", "INDEXTYPE",
         "ERR", "END", "WITHIN", "RECTANGLE", "CIRCLE", "KNN", "ASC", "DESC", "IF",
-        "EXISTS"
+        "EXISTS", "VACUUM", "ANALYZE", "INCLUDE"
     ]
 
     def __init__(self, token_type, lexema=""):
@@ -263,6 +264,7 @@ class Scanner:
                     "BTREE": Token.Type.INDEXTYPE,
                     "RTREE": Token.Type.INDEXTYPE,
                     "BRIN": Token.Type.INDEXTYPE,
+                    "BITMAP": Token.Type.INDEXTYPE,
                     "WITHIN": Token.Type.WITHIN,
                     "RECTANGLE": Token.Type.RECTANGLE,
                     "CIRCLE": Token.Type.CIRCLE,
@@ -270,7 +272,10 @@ class Scanner:
                     "ASC": Token.Type.ASC,
                     "DESC": Token.Type.DESC,
                     "IF": Token.Type.IF,
-                    "EXISTS": Token.Type.EXISTS
+                    "EXISTS": Token.Type.EXISTS,
+                    "VACUUM": Token.Type.VACUUM,
+                    "ANALYZE": Token.Type.ANALYZE,
+                    "INCLUDE": Token.Type.INCLUDE
                 }
                 if lexema in keywords:
                     return Token(keywords[lexema], lexema if keywords[lexema] in [Token.Type.BOOLVAL, Token.Type.INDEXTYPE, Token.Type.DATATYPE] else "")
@@ -0,0 +1,39 @@
+import os, sys, logging
+import pytest
+
+root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if root_path not in sys.path:
+    sys.path.append(root_path)
+
+from engine import utils
+from engine.dbmanager import DBManager
+from engine.buffer import BufferManager
+from indexes.bplustree import BPlusFile
+
+logging.disable(logging.CRITICAL)
+
+
+def reset(manager : DBManager) -> None:
+    for cache in (manager.indexes, manager.record_files, manager.heap_scans, manager.statistics):
+        cache.clear()
+    BPlusFile.caches.clear()
+
+
+@pytest.fixture
+def tables_dir(tmp_path, monkeypatch):
+    """Directory the tables of a test live in, removed afterwards"""
+    path = str(tmp_path / "tables")
+    os.makedirs(path)
+    monkeypatch.setattr(utils, "DATA_DIR", path)
+    yield path
+    BufferManager().discard(path)
+
+
+@pytest.fixture
+def db(tables_dir, monkeypatch):
+    """DBManager working on tables_dir with empty caches"""
+    manager = DBManager()
+    monkeypatch.setattr(manager, "tables_path", tables_dir)
+    reset(manager)
+    yield manager
+    reset(manager)
@@ -0,0 +1,65 @@
+import random
+
+from engine.model import TableSchema, Column, DataType, IndexType
+from indexes.bitmapindex import BitmapIndex
+from parser.parser import execute_sql
+
+
+def make_index() -> BitmapIndex:
+    column = Column("c", DataType.VARCHAR, index_type=IndexType.BITMAP, varchar_length=4)
+    return BitmapIndex(TableSchema("t", [Column("id", DataType.INT, is_primary=True), column]), column)
+
+
+def contents(index : BitmapIndex) -> dict:
+    return {key: sorted(index.search(key)) for key in index.keys}
+
+
+def test_changes_replay_from_the_log(tables_dir):
+    random.seed(2)
+    index = make_index()
+    rows = {pos: f"k{random.randint(0, 5)}" for pos in range(2000)}
+    index.insert_many((key, pos) for pos, key in rows.items())
+    for pos in random.sample(sorted(rows), 800):
+        index.delete(rows.pop(pos), pos)
+    for pos in range(2000, 2300):
+        rows[pos] = f"k{pos % 9}"
+        index.insert(pos, rows[pos])
+    expected = {}
+    for pos, key in rows.items():
+        expected.setdefault(key, []).append(pos)
+    assert contents(index) == {key: sorted(positions) for key, positions in expected.items()}
+    assert index.keys == sorted(expected)
+    assert contents(make_index()) == contents(index)
+
+
+def test_point_writes_log_only_their_position(tables_dir):
+    index = make_index()
+    index.insert_many(("a", pos) for pos in range(0, 100000, 3))
+    size = index.indexFile.size()
+    index.insert(100001, "a")
+    index.delete("a", 300)
+    assert index.indexFile.size() - size < 100
+    assert 100001 in index.bitmaps["a"] and 300 not in index.bitmaps["a"]
+
+
+def test_log_is_compacted(tables_dir):
+    index = make_index()
+    for pos in range(300):
+        index.insert(pos, "a")
+        index.delete("a", pos)
+    assert index.keys == []
+    assert index.indexFile.size() < 8192
+    index.insert(7, "b")
+    assert contents(make_index()) == {"b": [7]}
+
+
+def test_conditions_match_a_scan(db):
+    execute_sql("CREATE TABLE t (id INT PRIMARY KEY INDEX BTREE, c VARCHAR(4) INDEX BITMAP, lvl INT INDEX BITMAP, x INT);")
+    execute_sql("CREATE TABLE s (id INT PRIMARY KEY INDEX BTREE, c VARCHAR(4), lvl INT, x INT);")
+    values = ", ".join(f"({i}, 'k{i % 4}', {i % 6}, {i % 10})" for i in range(600))
+    for table in ("t", "s"):
+        execute_sql(f"INSERT INTO {table} VALUES {values};")
+        execute_sql(f"DELETE FROM {table} WHERE x = 3;")
+    for condition in ["c = 'k1'", "lvl BETWEEN 2 AND 4", "c != 'k2' AND lvl >= 3", "NOT lvl = 0 OR c < 'k1'", "c = 'k3' AND x < 5"]:
+        expected = execute_sql(f"SELECT * FROM s WHERE {condition};")[0]['records']
+        assert execute_sql(f"SELECT * FROM t WHERE {condition};")[0]['records'] == expected, condition
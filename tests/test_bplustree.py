@@ -0,0 +1,227 @@
+import random, struct
+import pytest
+
+from engine.model import TableSchema, Column, DataType, IndexType
+from engine import utils, stats
+from indexes.bplustree import BPlusTree, BPlusFile, NodeBPlus, block_factor_for_page
+
+# 6 INT keys a node, small enough for a few hundred keys to need several levels
+SMALL_PAGE = 64
+
+
+def make_tree(page_size : int = SMALL_PAGE) -> BPlusTree:
+    column = Column("k", DataType.INT, index_type=IndexType.BTREE)
+    return BPlusTree(TableSchema("t", [column]), column, page_size)
+
+
+def expected(pairs, lo = None, hi = None) -> list[int]:
+    return sorted(pos for key, pos in pairs if (lo is None or key >= lo) and (hi is None or key <= hi))
+
+
+def check(tree : BPlusTree, pairs) -> None:
+    """The tree holds exactly pairs, whichever way it is read"""
+    assert sorted(tree.entries()) == sorted(pairs)
+    assert [key for key, _ in tree.entries()] == sorted(key for key, _ in pairs)
+    for key in {key for key, _ in pairs}:
+        assert sorted(tree.search(key)) == expected(pairs, key, key)
+    assert sorted(tree.rangeSearch(10, 30)) == expected(pairs, 10, 30)
+
+
+def write_legacy_tree(column : Column, pairs : list[tuple[int, int]]) -> None:
+    """Index file as written before the header existed: the root position
+    followed by nodes of NodeBPlus.BLOCK_FACTOR keys, a duplicate key in
+    one entry per position"""
+    capacity = NodeBPlus.BLOCK_FACTOR - 1
+    chunks = [pairs[i:i + capacity] for i in range(0, len(pairs), capacity)]
+    nodes = [NodeBPlus(column, [key for key, _ in chunk], [pos for _, pos in chunk], True, len(chunk), i + 1 if i + 1 < len(chunks) else -1)
+             for i, chunk in enumerate(chunks)]
+    level = [(chunk[0][0], i) for i, chunk in enumerate(chunks)]
+    while len(level) > 1:
+        groups = [level[i:i + capacity + 1] for i in range(0, len(level), capacity + 1)]
+        if len(groups[-1]) == 1:
+            groups[-2:] = [groups[-2][:-1], groups[-2][-1:] + groups[-1]]
+        start = len(nodes)
+        nodes.extend(NodeBPlus(column, [key for key, _ in group[1:]], [pos for _, pos in group], False, len(group) - 1) for group in groups)
+        level = [(group[0][0], start + i) for i, group in enumerate(groups)]
+    path = utils.get_index_file_path("t", column.name, IndexType.BTREE)
+    with open(path, "wb") as file:
+        file.write(struct.pack("i", level[0][1]))
+        file.write(b"".join(node.pack() for node in nodes))
+
+
+def test_delete_rebalances(tables_dir):
+    random.seed(1)
+    tree = make_tree()
+    pairs = [(random.randint(0, 50), pos) for pos in range(400)]
+    for key, pos in pairs:
+        tree.insert(pos, key)
+    check(tree, pairs)
+    random.shuffle(pairs)
+    while pairs:
+        key, pos = pairs.pop()
+        assert tree.delete(key, pos)
+        if len(pairs) % 37 == 0:
+            check(tree, pairs)
+    assert tree.isEmpty()
+    assert tree.entries() == []
+
+
+def test_delete_missing(tables_dir):
+    tree = make_tree()
+    for pos in range(20):
+        tree.insert(pos, pos % 5)
+    assert not tree.delete(7)
+    assert not tree.delete(3, 4)
+    assert tree.delete(3, 3)
+    assert not tree.delete(3, 3)
+    assert len(tree.entries()) == 19
+
+
+def test_freed_nodes_are_reused(tables_dir):
+    tree = make_tree()
+    for pos in range(300):
+        tree.insert(pos, pos)
+    end = tree.indexFile.nextPosition()
+    for pos in range(290):
+        tree.delete(pos, pos)
+    assert tree.indexFile.getFreeHead() != -1
+    for pos in range(290):
+        tree.insert(pos, pos)
+    assert tree.indexFile.nextPosition() <= end
+    check(tree, [(pos, pos) for pos in range(300)])
+
+
+def test_vacuum_packs_file(tables_dir):
+    tree = make_tree()
+    pairs = [(pos % 40, pos) for pos in range(300)]
+    for key, pos in pairs:
+        tree.insert(pos, key)
+    for key, pos in pairs[:200]:
+        tree.delete(key, pos)
+    before = tree.indexFile.nextPosition()
+    tree.vacuum()
+    assert tree.indexFile.getFreeHead() == -1
+    assert tree.indexFile.nextPosition() < before
+    check(tree, pairs[200:])
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_legacy_file_with_duplicates(tables_dir, seed):
+    random.seed(seed)
+    column = Column("k", DataType.INT, index_type=IndexType.BTREE)
+    pairs = sorted((random.randint(0, 5), pos) for pos in range(40))
+    write_legacy_tree(column, pairs)
+    tree = BPlusTree(TableSchema("t", [column]), column)
+    assert tree.indexFile.page_size is not None
+    check(tree, pairs)
+    random.shuffle(pairs)
+    while len(pairs) > 10:
+        key, pos = pairs.pop()
+        assert tree.delete(key, pos)
+        check(tree, pairs)
+
+
+def leaves(tree : BPlusTree) -> list:
+    """Leaf nodes in chain order"""
+    node = tree.indexFile.readNode(tree.indexFile.getHeader(), 0)
+    while not node.isLeaf:
+        node = tree.indexFile.readBucket(node.pointers[0])
+    nodes = [node]
+    while node.nextNode != -1:
+        node = tree.indexFile.readBucket(node.nextNode)
+        nodes.append(node)
+    return nodes
+
+
+@pytest.mark.parametrize("fill_factor", [1.0, 0.7])
+def test_bulk_load_matches_inserts(tables_dir, fill_factor):
+    random.seed(7)
+    pairs = sorted((random.randint(0, 300), pos) for pos in range(1000))
+    tree = make_tree()
+    tree.bulk_load(pairs, fill_factor)
+    check(tree, pairs)
+    capacity = tree.BLOCK_FACTOR - 1
+    sizes = [leaf.size for leaf in leaves(tree)]
+    assert max(sizes) <= max(1, int(capacity * fill_factor))
+    # one entry per distinct key
+    assert sum(sizes) == len({key for key, _ in pairs})
+    for key, pos in [(-5, 2000), (150, 2001), (999, 2002)]:
+        tree.insert(pos, key)
+        pairs.append((key, pos))
+    for key, pos in pairs[:300]:
+        assert tree.delete(key, pos)
+    check(tree, pairs[300:])
+
+
+def test_bulk_load_needs_empty_tree(tables_dir):
+    tree = make_tree()
+    tree.bulk_load([])
+    assert tree.isEmpty()
+    tree.insert(1, 1)
+    with pytest.raises(Exception):
+        tree.bulk_load([(2, 2)])
+
+
+def test_nodes_fill_their_page(tables_dir):
+    column = Column("k", DataType.INT, index_type=IndexType.BTREE)
+    assert block_factor_for_page(column, 4096) == (4096 - 16) // 8
+    with pytest.raises(Exception):
+        block_factor_for_page(column, 32)
+    tree = make_tree(256)
+    assert tree.BLOCK_FACTOR == block_factor_for_page(column, 256)
+    assert tree.indexFile.NODE_SIZE == 256
+    pairs = [(pos * 3 % 1000, pos) for pos in range(1000)]
+    for key, pos in pairs:
+        tree.insert(pos, key)
+    assert (tree.indexFile.buffer.size(tree.indexFile.filename) - 256) % 256 == 0
+    # the page size is read back from the header, not the default
+    reopened = make_tree(None)
+    assert reopened.indexFile.page_size == 256 and reopened.BLOCK_FACTOR == tree.BLOCK_FACTOR
+    check(reopened, pairs)
+
+
+def test_upper_levels_are_cached(tables_dir):
+    tree = make_tree()
+    pairs = [(pos, pos) for pos in range(300)]
+    tree.bulk_load(pairs)
+    tree.indexFile.cache.reset()
+    stats.reset_counters()
+    assert tree.search(234) == [234]
+    cold = stats.get_counts()["reads"]
+    stats.reset_counters()
+    assert tree.search(231) == [231]
+    # only the leaf is read once the root and internal levels are cached
+    assert stats.get_counts()["reads"] == 1 < cold
+
+
+def test_cache_is_shared_by_open_trees(tables_dir):
+    first, second = make_tree(), make_tree()
+    assert first.indexFile.cache is second.indexFile.cache
+    for pos in range(500):
+        first.insert(pos, pos)
+        assert second.search(pos) == [pos]
+    for pos in range(0, 500, 2):
+        second.delete(pos, pos)
+    check(first, [(pos, pos) for pos in range(1, 500, 2)])
+
+
+def test_duplicates_share_one_entry(tables_dir):
+    random.seed(8)
+    tree = make_tree()
+    capacity = tree.indexFile.postingCapacity()
+    pairs = [(pos % 3, pos) for pos in range(10 * capacity)] + [(7, 10**6)]
+    random.shuffle(pairs)
+    for key, pos in pairs:
+        tree.insert(pos, key)
+    check(tree, pairs)
+    assert [leaf.size for leaf in leaves(tree)] == [4]
+    assert all(BPlusFile.isPosting(pointer) for pointer in leaves(tree)[0].pointers[:3])
+    end = tree.indexFile.nextPosition()
+    for key, pos in pairs[:len(pairs) // 2]:
+        assert tree.delete(key, pos)
+    for key, pos in pairs[:len(pairs) // 2]:
+        tree.insert(pos, key)
+    # emptied posting pages are reused
+    assert tree.indexFile.nextPosition() <= end + 3
+    check(tree, pairs)
+    assert sorted(tree.rangeSearch(1, 2)) == expected(pairs, 1, 2)
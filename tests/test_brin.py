@@ -0,0 +1,81 @@
+import pytest
+
+from parser.parser import execute_sql
+from indexes.brin import BRINIndex, BRINFile, BRIN_RANGE_SLOTS
+
+
+def select(sql : str) -> list:
+    result, message = execute_sql(sql)
+    assert result is not None, message
+    return sorted(map(tuple, result['records']))
+
+
+def summaries(db, table_name : str) -> list:
+    """(min, max) of the live ts of every block range, read from the heap"""
+    schema = db.get_table_schema(table_name)
+    ranges = {}
+    for pos, record in db.get_record_file(schema):
+        lo, hi = ranges.get(pos // BRIN_RANGE_SLOTS, (record.values[1], record.values[1]))
+        ranges[pos // BRIN_RANGE_SLOTS] = (min(lo, record.values[1]), max(hi, record.values[1]))
+    return [ranges.get(i) for i in range(max(ranges) + 1)]
+
+
+@pytest.fixture
+def events(db):
+    """ev with ts following the insertion order and BRIN indexed, plain with
+    the same rows, a few deleted before the index is built"""
+    for name in ("ev", "plain"):
+        execute_sql(f"CREATE TABLE {name} (id INT PRIMARY KEY INDEX BTREE, ts INT, c VARCHAR(8));")
+        execute_sql(f"INSERT INTO {name} VALUES " + ", ".join(f"({i}, {1000 + 3 * i}, 'c{i // 100:03d}')" for i in range(1000)) + ";")
+        execute_sql(f"DELETE FROM {name} WHERE id BETWEEN 0 AND 9 OR id BETWEEN 256 AND 383;")
+    execute_sql("CREATE INDEX bts ON ev USING BRIN (ts);")
+    return db.get_index(db.get_table_schema("ev"), "ts")
+
+
+def test_build_summarizes_live_rows(events, db):
+    assert isinstance(events, BRINIndex)
+    expected = summaries(db, "ev")
+    assert events.summaries == expected
+    # the range emptied by the delete has no summary
+    assert expected[2] is None and expected[0] == (1030, 1000 + 3 * 127)
+    assert BRINFile(db.get_table_schema("ev"), db.get_table_schema("ev").get_column_by_name("ts")).read_all() == expected
+
+
+@pytest.mark.parametrize("lo, hi, spans", [
+    (1000 + 3 * 130, 1000 + 3 * 140, [(128, 256)]),
+    (1000 + 3 * 250, 1000 + 3 * 400, [(128, 256), (384, 512)]),
+    (None, 1005, []),
+    (1000 + 3 * 900, None, [(896, 1024)]),
+    (None, None, [(0, 256), (384, 1024)]),
+    (5000, 6000, []),
+])
+def test_spans_prune_ranges(events, lo, hi, spans):
+    assert list(events._spans(lo, hi)) == spans
+
+
+def test_insert_widens_its_range(events, db):
+    before = list(events.summaries)
+    execute_sql("INSERT INTO ev VALUES (5000, 7, 'x');")
+    execute_sql("INSERT INTO plain VALUES (5000, 7, 'x');")
+    pos = next(pos for pos, record in db.get_record_file(db.get_table_schema("ev")) if record.values[0] == 5000)
+    i = pos // BRIN_RANGE_SLOTS
+    assert events.summaries[i][0] == 7 and events.summaries[i][1] >= (before[i] or (7, 7))[1]
+    assert all(events.summaries[j] == before[j] for j in range(len(before)) if j != i)
+    # the widened summary is on disk
+    assert BRINFile(db.get_table_schema("ev"), db.get_table_schema("ev").get_column_by_name("ts")).read_all() == events.summaries
+    assert select("SELECT * FROM ev WHERE ts = 7;") == [(5000, 7, "x")]
+    assert select("SELECT * FROM ev WHERE ts < 1100;") == select("SELECT * FROM plain WHERE ts < 1100;")
+
+
+def test_reused_slots_are_found(events, db):
+    execute_sql("DELETE FROM ev WHERE id BETWEEN 600 AND 620;")
+    execute_sql("DELETE FROM plain WHERE id BETWEEN 600 AND 620;")
+    # the new rows land in freed slots, far from the values of their ranges
+    rows = ", ".join(f"({2000 + i}, {9000 + i}, 'n')" for i in range(60))
+    execute_sql(f"INSERT INTO ev VALUES {rows};")
+    execute_sql(f"INSERT INTO plain VALUES {rows};")
+    positions = [pos for pos, record in db.get_record_file(db.get_table_schema("ev")) if record.values[0] >= 2000]
+    assert any(600 <= pos <= 620 for pos in positions)
+    for condition in ["ts = 9010", "ts BETWEEN 9000 AND 9100", "ts >= 2800", "ts BETWEEN 2790 AND 2870", "ts < 1050", "id >= 2000"]:
+        assert select(f"SELECT * FROM ev WHERE {condition};") == select(f"SELECT * FROM plain WHERE {condition};"), condition
+    assert sorted(events.rangeSearch(9000, 9059)) == sorted(pos for pos, record in db.get_record_file(db.get_table_schema("ev")) if 9000 <= record.values[1] <= 9059)
@@ -0,0 +1,84 @@
+import os, random
+import pytest
+
+from engine.buffer import BufferManager, PAGE_SIZE
+
+
+@pytest.fixture
+def buffer(tables_dir):
+    """BufferManager with room for a few pages only, so tests evict"""
+    manager = BufferManager()
+    budget = manager.get_memory_budget()
+    manager.set_memory_budget(4 * PAGE_SIZE)
+    yield manager
+    manager.set_memory_budget(budget)
+
+
+def on_disk(path : str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def test_reads_see_writes_across_evictions(buffer, tables_dir):
+    random.seed(4)
+    path = os.path.join(tables_dir, "data.bin")
+    buffer.create(path)
+    model = bytearray()
+    for _ in range(300):
+        offset = random.randint(0, len(model) + 100)
+        data = os.urandom(random.randint(1, 3 * PAGE_SIZE))
+        buffer.write(path, offset, data)
+        model.extend(b"\x00" * max(0, offset + len(data) - len(model)))
+        model[offset:offset + len(data)] = data
+        assert len(buffer.frames) <= 4
+        start = random.randint(0, len(model))
+        assert buffer.read(path, start, 2 * PAGE_SIZE) == bytes(model[start:start + 2 * PAGE_SIZE])
+    assert buffer.size(path) == len(model)
+    buffer.flush(path)
+    assert on_disk(path) == bytes(model)
+
+
+def test_append_returns_offsets(buffer, tables_dir):
+    path = os.path.join(tables_dir, "log.bin")
+    buffer.create(path)
+    offsets = [buffer.append(path, bytes([i]) * 1000) for i in range(10)]
+    assert offsets == [1000 * i for i in range(10)]
+    assert buffer.read(path, 4500, 1000) == bytes([4]) * 500 + bytes([5]) * 500
+
+
+def test_flush_one_file(buffer, tables_dir):
+    buffer.set_memory_budget(64 * PAGE_SIZE)
+    first, second = os.path.join(tables_dir, "a.bin"), os.path.join(tables_dir, "b.bin")
+    for path in (first, second):
+        buffer.create(path)
+        buffer.write(path, 0, b"x" * (3 * PAGE_SIZE))
+    buffer.flush(first)
+    assert on_disk(first) == b"x" * (3 * PAGE_SIZE)
+    assert on_disk(second) == b""
+    assert all(path == os.path.abspath(second) for path, _ in buffer.dirty)
+    buffer.flush()
+    assert on_disk(second) == b"x" * (3 * PAGE_SIZE)
+    assert not buffer.dirty
+
+
+def test_discard_drops_unwritten_pages(buffer, tables_dir):
+    path = os.path.join(tables_dir, "c.bin")
+    buffer.create(path)
+    buffer.write(path, 0, b"y" * 100)
+    buffer.discard(tables_dir)
+    assert not any(key.startswith(os.path.abspath(tables_dir)) for key, _ in buffer.frames)
+    assert not buffer.dirty
+    assert buffer.read(path, 0, 100) == b""
+
+
+def test_pinned_frames_stay(buffer, tables_dir):
+    path = os.path.join(tables_dir, "d.bin")
+    buffer.create(path)
+    buffer.write(path, 0, b"z" * (8 * PAGE_SIZE))
+    frame = buffer.pin(path, 0)
+    for page in range(1, 8):
+        buffer.read(path, page * PAGE_SIZE, 1)
+    assert (frame.path, 0) in buffer.frames
+    buffer.unpin(frame)
+    with pytest.raises(Exception):
+        buffer.unpin(frame)
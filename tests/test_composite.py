@@ -0,0 +1,139 @@
+import random
+import pytest
+
+from parser.parser import execute_sql
+from engine.record import RecordFile
+from engine.scan import HeapScan
+
+CONDITIONS = [
+    "tenant = 't2'",
+    "tenant = 't1' AND created = 40",
+    "tenant = 't3' AND created BETWEEN 100 AND 300",
+    "tenant = 't0' AND created < 50 AND amt > 0.5",
+    "created = 17 AND tenant = 't4'",
+    "tenant = 't1' OR created = 3",
+]
+
+
+def select(table : str, condition : str) -> list:
+    result, message = execute_sql(f"SELECT * FROM {table} WHERE {condition};")
+    assert result is not None, message
+    return sorted(map(tuple, result['records']))
+
+
+@pytest.fixture
+def tables(db):
+    """ev with composite indexes and plain, an unindexed copy"""
+    random.seed(3)
+    rows = [(i, f"t{random.randint(0, 5)}", random.randint(0, 500), round(random.random(), 3)) for i in range(2000)]
+    for table in ("ev", "plain"):
+        execute_sql(f"CREATE TABLE {table} (id INT PRIMARY KEY INDEX BTREE, tenant VARCHAR(6), created INT, amt FLOAT);")
+        execute_sql(f"INSERT INTO {table} VALUES " + ", ".join(f"({a}, '{b}', {c}, {d})" for a, b, c, d in rows[:1200]) + ";")
+    assert "successfully" in execute_sql("CREATE INDEX ev_tc ON ev USING BTREE (tenant, created);")[1].lower()
+    for table in ("ev", "plain"):
+        execute_sql(f"INSERT INTO {table} VALUES " + ", ".join(f"({a}, '{b}', {c}, {d})" for a, b, c, d in rows[1200:]) + ";")
+        execute_sql(f"DELETE FROM {table} WHERE tenant = 't5' AND created < 250;")
+    return db
+
+
+@pytest.mark.parametrize("condition", CONDITIONS)
+def test_btree_matches_scan(tables, condition):
+    assert select("ev", condition) == select("plain", condition)
+
+
+def test_vacuum_keeps_entries(tables):
+    execute_sql("VACUUM INDEX ev_tc ON ev;")
+    for condition in CONDITIONS:
+        assert select("ev", condition) == select("plain", condition)
+
+
+def test_hash_matches_scan(tables):
+    result, message = execute_sql("CREATE INDEX ev_id ON ev USING HASH (id, tenant);")
+    assert result is None and "successfully" in message.lower()
+    execute_sql("DELETE FROM ev WHERE id < 100;")
+    execute_sql("DELETE FROM plain WHERE id < 100;")
+    for condition in ["id = 150 AND tenant = 't0'", "id = 1500 AND tenant = 't4'", "id = 50 AND tenant = 't1'"]:
+        assert select("ev", condition) == select("plain", condition)
+
+
+def test_hash_rejects_repeated_tuples(tables):
+    with pytest.raises(RuntimeError, match="requires unique values"):
+        execute_sql("CREATE INDEX ev_ct ON ev USING HASH (created, tenant);")
+    assert not tables.get_table_schema("ev").get_composite_index("ev_ct")
+    execute_sql("CREATE INDEX ev_id ON ev USING HASH (id, tenant);")
+    with pytest.raises(RuntimeError, match="requires unique values"):
+        execute_sql("INSERT INTO ev VALUES (9000, 'a', 1, 1.0), (9000, 'a', 2, 2.0);")
+    tenant = select("ev", "id = 10")[0][1]
+    with pytest.raises(RuntimeError, match="requires unique values"):
+        execute_sql(f"INSERT INTO ev VALUES (10, '{tenant}', 1, 1.0);")
+    assert select("ev", "id = 9000") == []
+    assert len(select("ev", "id = 10")) == 1
+
+
+COVERED = [
+    ("created", "created BETWEEN 100 AND 200"),
+    ("created", "created = 17"),
+    ("id", "id <= 300"),
+    ("amt, created", "tenant = 't3' AND created BETWEEN 100 AND 400"),
+    ("ok, amt, tenant", "tenant = 't1'"),
+    ("amt", "tenant = 't1' AND created >= 450"),
+]
+
+
+@pytest.fixture
+def covering(db):
+    """cv with a composite B+Tree including amt and ok, and plain, an unindexed copy"""
+    random.seed(5)
+    rows = [(i, f"t{random.randint(0, 9)}", random.randint(-20, 500), round(random.random(), 2), random.random() < 0.5) for i in range(3000)]
+    for table, created in (("cv", "INT INDEX BTREE"), ("plain", "INT")):
+        execute_sql(f"CREATE TABLE {table} (id INT PRIMARY KEY INDEX BTREE, tenant VARCHAR(6), created {created}, amt FLOAT, ok BOOL);")
+    execute_sql("CREATE INDEX cv_tc ON cv (tenant, created) INCLUDE (amt, ok);")
+    for table in ("cv", "plain"):
+        execute_sql(f"INSERT INTO {table} VALUES " + ", ".join(f"({a}, '{b}', {c}, {d}, {str(e).upper()})" for a, b, c, d, e in rows) + ";")
+        execute_sql(f"DELETE FROM {table} WHERE created < 0;")
+    return db
+
+
+def no_heap_reads(monkeypatch) -> None:
+    for cls, name in ((RecordFile, "read"), (RecordFile, "__iter__"), (HeapScan, "rows")):
+        monkeypatch.setattr(cls, name, lambda *args, **kwargs: pytest.fail("heap read"))
+
+
+def project(table : str, columns : str, condition : str) -> list:
+    result, message = execute_sql(f"SELECT {columns} FROM {table} WHERE {condition};")
+    assert result is not None, message
+    return sorted(map(tuple, result['records']))
+
+
+@pytest.mark.parametrize("columns, condition", COVERED)
+def test_covered_projection_skips_the_heap(covering, monkeypatch, columns, condition):
+    expected = project("plain", columns, condition)
+    with monkeypatch.context() as patched:
+        no_heap_reads(patched)
+        assert project("cv", columns, condition) == expected
+        limited = execute_sql(f"SELECT {columns} FROM cv WHERE {condition} LIMIT 5;")[0]['records']
+    assert len(limited) == min(5, len(expected)) and all(tuple(row) in expected for row in limited)
+    # the heap path of the same query, through a column the index doesn't hold
+    assert project("cv", f"id, {columns}", condition) == project("plain", f"id, {columns}", condition)
+
+
+def test_covered_projection_after_deletes(covering, monkeypatch):
+    for table in ("cv", "plain"):
+        execute_sql(f"DELETE FROM {table} WHERE tenant = 't1' AND created BETWEEN 100 AND 300;")
+        execute_sql(f"DELETE FROM {table} WHERE id < 500;")
+    for columns, condition in COVERED:
+        expected = project("plain", columns, condition)
+        with monkeypatch.context() as patched:
+            no_heap_reads(patched)
+            assert project("cv", columns, condition) == expected, condition
+
+
+def test_uncovered_queries_read_the_heap(covering, monkeypatch):
+    # a strict range is fetched inclusive and rechecked, and amt isn't in the key of created
+    for columns, condition in [("amt", "tenant = 't1' AND created > 450"), ("amt", "created = 17")]:
+        expected = project("plain", columns, condition)
+        with monkeypatch.context() as patched:
+            no_heap_reads(patched)
+            with pytest.raises(pytest.fail.Exception):
+                project("cv", columns, condition)
+        assert project("cv", columns, condition) == expected
@@ -0,0 +1,81 @@
+import time
+
+from backend.utils.cursors import Cursor, CursorStore
+from parser.parser import execute_sql
+from engine import dbmanager
+
+
+def test_fetch_in_batches():
+    cursor = Cursor(1, ["a"], iter(range(10)))
+    assert cursor.skip(3) == 3
+    assert cursor.fetch(4) == [3, 4, 5, 6]
+    assert not cursor.done
+    assert cursor.fetch(3) == [7, 8, 9]
+    assert cursor.done
+    assert cursor.fetched == 10
+
+
+def test_count_reads_the_rest():
+    cursor = Cursor(1, ["a"], iter(range(25)))
+    cursor.skip(5)
+    assert cursor.fetch(10) == list(range(5, 15))
+    assert cursor.count() == 25
+    assert cursor.done
+
+
+def test_store_checks_owner():
+    store = CursorStore()
+    cursor_id = store.open(Cursor(1, [], iter(range(3))))
+    assert store.get(cursor_id, 2) is None
+    assert store.get(cursor_id, 1) is not None
+    store.close(cursor_id)
+    assert store.get(cursor_id, 1) is None
+
+
+def test_store_expires_idle_cursors():
+    store = CursorStore(idle_timeout=0.01)
+    cursor = Cursor(1, [], iter(range(3)))
+    cursor_id = store.open(cursor)
+    time.sleep(0.02)
+    assert store.get(cursor_id, 1) is None
+    assert cursor.done
+
+
+def test_store_closes_least_recently_used():
+    store = CursorStore(max_open=3)
+    cursors = [Cursor(1, [], iter(range(3))) for _ in range(3)]
+    ids = [store.open(cursor) for cursor in cursors]
+    cursors[0].fetch(1)
+    newest = store.open(Cursor(1, [], iter(range(3))))
+    assert len(store.cursors) == 3
+    assert store.get(ids[1], 1) is None and cursors[1].done
+    assert store.get(ids[0], 1) is cursors[0]
+    assert store.get(newest, 1) is not None
+
+
+def test_paging_a_streamed_select(db):
+    execute_sql("CREATE TABLE t (id INT PRIMARY KEY INDEX BTREE, v INT);")
+    execute_sql("INSERT INTO t VALUES " + ", ".join(f"({i}, {i % 7})" for i in range(200)) + ";")
+    expected = execute_sql("SELECT * FROM t WHERE v = 3;")[0]['records']
+    result, _ = execute_sql("SELECT * FROM t WHERE v = 3;", stream=True)
+    cursor = Cursor(1, result['columns'], result['records'])
+    pages = []
+    while not cursor.done:
+        pages += cursor.fetch(8)
+    assert pages == expected
+
+
+def test_reused_slots_are_rechecked(db, monkeypatch):
+    monkeypatch.setattr(dbmanager, "SCAN_BATCH_SIZE", 4)
+    execute_sql("CREATE TABLE t (id INT PRIMARY KEY INDEX BTREE, v INT INDEX BTREE);")
+    execute_sql("INSERT INTO t VALUES " + ", ".join(f"({i}, {i % 7})" for i in range(200)) + ";")
+    result, _ = execute_sql("SELECT * FROM t WHERE v = 3;", stream=True)
+    cursor = Cursor(1, result['columns'], result['records'])
+    first = cursor.fetch(2)
+    # the slot of row 101 is freed and reused by a row that doesn't match
+    execute_sql("DELETE FROM t WHERE id = 101;")
+    execute_sql("INSERT INTO t VALUES (500, 4);")
+    rest = []
+    while not cursor.done:
+        rest += cursor.fetch(5)
+    assert first + rest == [[i, 3] for i in range(3, 200, 7) if i != 101]
@@ -0,0 +1,32 @@
+import os
+
+from engine.filepool import FilePool
+
+
+def test_descriptor_is_shared(tables_dir):
+    pool = FilePool()
+    path = os.path.join(tables_dir, "a.bin")
+    fd = pool.get(path)
+    assert pool.get(os.path.join(tables_dir, ".", "a.bin")) == fd
+    pool.pwrite(path, b"hello world", 0)
+    pool.pwrite(path, b"W", 6)
+    assert pool.pread(path, 5, 6) == b"World"
+    assert pool.size(path) == 11
+    pool.truncate(path, 5)
+    assert pool.pread(path, 100, 0) == b"hello"
+
+
+def test_close_directory(tables_dir):
+    pool = FilePool()
+    os.makedirs(os.path.join(tables_dir, "t"))
+    paths = [os.path.join(tables_dir, "t", name) for name in ("a.dat", "b.dat")]
+    other = os.path.join(tables_dir, "t2.dat")
+    for path in paths + [other]:
+        pool.pwrite(path, b"x", 0)
+    pool.close(os.path.join(tables_dir, "t"))
+    assert all(os.path.abspath(path) not in pool.fds for path in paths)
+    assert os.path.abspath(other) in pool.fds
+    # a closed file is opened again on next use
+    assert pool.pread(paths[0], 1, 0) == b"x"
+    pool.close(tables_dir)
+    assert not any(key.startswith(os.path.abspath(tables_dir)) for key in pool.fds)
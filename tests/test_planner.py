@@ -0,0 +1,97 @@
+import random
+import pytest
+
+from parser.scanner import Scanner
+from parser.parser import Parser, execute_sql
+from engine import planner
+
+
+def condition(sql : str):
+    stmt, = Parser(Scanner(f"SELECT * FROM t WHERE {sql};")).parse().stmt_list
+    return stmt.condition
+
+
+def select(sql : str) -> list:
+    result, message = execute_sql(sql)
+    assert result is not None, message
+    return sorted(map(tuple, result['records']))
+
+
+@pytest.fixture
+def tables(db):
+    """t with a (1000 values) and b (20 values) indexed and c not, plain with
+    the same rows and no index but the key"""
+    random.seed(3)
+    execute_sql("CREATE TABLE t (id INT PRIMARY KEY INDEX BTREE, a INT INDEX BTREE, b INT INDEX BTREE, c INT);")
+    execute_sql("CREATE TABLE plain (id INT PRIMARY KEY INDEX BTREE, a INT, b INT, c INT);")
+    rows = ", ".join(f"({i}, {i * 7 % 1000}, {i % 20}, {random.randint(0, 99)})" for i in range(4000))
+    for name in ("t", "plain"):
+        execute_sql(f"INSERT INTO {name} VALUES {rows};")
+        execute_sql(f"DELETE FROM {name} WHERE c = 42;")
+    execute_sql("ANALYZE t;")
+    return db.get_table_schema("t"), db.get_statistics(db.get_table_schema("t"))
+
+
+def test_selectivity_follows_statistics(tables):
+    schema, statistics = tables
+    assert planner.selectivity(schema, condition("a = 17"), statistics) == pytest.approx(1 / 1000, rel=0.1)
+    assert planner.selectivity(schema, condition("b = 3"), statistics) == pytest.approx(1 / 20, rel=0.1)
+    assert planner.selectivity(schema, condition("a <= 499"), statistics) == pytest.approx(0.5, abs=0.05)
+    assert planner.selectivity(schema, condition("a BETWEEN 100 AND 199"), statistics) == pytest.approx(0.1, abs=0.03)
+    assert planner.selectivity(schema, condition("id = 5"), statistics) == pytest.approx(1 / statistics.live)
+    # without statistics the defaults apply
+    assert planner.selectivity(schema, condition("a = 17"), None) == planner.EQ_SELECTIVITY
+
+
+@pytest.mark.parametrize("sql, probe", [
+    ("b = 3 AND a = 17 AND c < 50", 1),
+    ("a BETWEEN 0 AND 900 AND b = 4", 1),
+    ("c > 10 AND a >= 990 AND b < 19", 1),
+    ("a < 500 AND b = 2 AND id > 3990", 2),
+])
+def test_most_selective_index_is_probed(tables, sql, probe):
+    schema, statistics = tables
+    predicates = planner.conjuncts(condition(sql))
+    probes, filters = planner.plan_conjunction(schema, predicates, statistics)
+    driver = predicates[probe]
+    assert probes == [driver]
+    # the rest is checked over the rows the probe fetched
+    assert filters == [c for c in predicates if c is not driver]
+
+
+def test_conjunction_with_no_index_is_a_scan(tables):
+    schema, statistics = tables
+    predicates = planner.conjuncts(condition("c < 10 AND c > 2"))
+    assert planner.plan_conjunction(schema, predicates, statistics) == ([], predicates)
+
+
+@pytest.mark.parametrize("sql, column", [
+    ("b = 3 AND a = 17 AND c < 50", "a"),
+    ("a BETWEEN 0 AND 900 AND b = 4", "b"),
+    ("c > 10 AND a >= 990 AND b < 19", "a"),
+])
+def test_only_the_driver_is_probed(tables, db, monkeypatch, sql, column):
+    probed = []
+    probe_condition = db.probe_condition
+    def recorded(table_schema, condition):
+        probed.append(condition.left.column_name)
+        return probe_condition(table_schema, condition)
+    monkeypatch.setattr(db, "probe_condition", recorded)
+    assert select(f"SELECT * FROM t WHERE {sql};") == select(f"SELECT * FROM plain WHERE {sql};")
+    assert probed == [column]
+
+
+@pytest.mark.parametrize("sql", [
+    "a = 17 AND b = 17",
+    "a = 17 AND b = 18",
+    "b = 0 AND c BETWEEN 10 AND 20",
+    "a < 100 AND b > 15 AND c = 7",
+    "a >= 300 AND a <= 310 AND NOT b = 1",
+    "b = 5 AND (c < 5 OR c > 95)",
+    "id > 3500 AND a < 500 AND b = 2 AND c > 50",
+    "c = 42 AND a > 0",
+])
+def test_conjunctions_match_unindexed_table(tables, sql):
+    expected = select(f"SELECT * FROM plain WHERE {sql};")
+    assert select(f"SELECT * FROM t WHERE {sql};") == expected
+    assert select(f"SELECT a, c FROM t WHERE {sql};") == sorted((a, c) for _, a, _, c in expected)
@@ -0,0 +1,87 @@
+import random, struct, pickle
+import pytest
+
+from engine.model import TableSchema, Column, DataType
+from engine.record import Record, RecordFile
+import logger
+
+
+def make_schema() -> TableSchema:
+    return TableSchema("t", [
+        Column("id", DataType.INT, is_primary=True),
+        Column("name", DataType.VARCHAR, varchar_length=6),
+        Column("price", DataType.FLOAT),
+        Column("ok", DataType.BOOL),
+        Column("at", DataType.POINT),
+    ])
+
+
+def row(i : int) -> list:
+    return [i, f"r{i % 1000}", i / 4, i % 3 == 0, (float(i), -0.5)]
+
+
+def test_mapped_reads_follow_writes(tables_dir):
+    random.seed(6)
+    schema = make_schema()
+    mapped = RecordFile(schema, use_mmap=True)
+    live = {}
+    for i in range(400):
+        if live and random.random() < 0.3:
+            pos = random.choice(sorted(live))
+            assert mapped.delete(pos).values == live.pop(pos)
+        else:
+            pos = mapped.append(Record(schema, row(i)))
+            assert pos not in live
+            live[pos] = row(i)
+            # the map is grown as the file is
+            assert mapped.read(pos).values == row(i)
+    free = {pos for pos in range(mapped.max_id()) if pos not in live}
+    positions = mapped.append_many([Record(schema, row(i)) for i in range(400, 1000)])
+    live.update(zip(positions, map(row, range(400, 1000))))
+    # deleted slots are reused before the file grows
+    assert free <= set(positions) and len(set(positions)) == 600
+    assert {pos: record.values for pos, record in mapped} == live
+    plain = RecordFile(schema)
+    assert {pos: record.values for pos, record in plain} == live
+    assert all(mapped.read(pos) is None for pos in range(mapped.max_id()) if pos not in live)
+
+
+def test_invalid_position(tables_dir):
+    schema = make_schema()
+    mapped = RecordFile(schema, use_mmap=True)
+    mapped.append(Record(schema, row(1)))
+    with pytest.raises(Exception):
+        mapped.read(5)
+
+
+def test_codec_round_trip():
+    schema = make_schema()
+    codec = schema.get_codec()
+    assert schema.get_codec() is codec
+    assert codec.format == "i6sf?ff" and codec.size == struct.calcsize("i6sf?ff")
+    for values in [row(7), [-3, "", -1.125, False, (0.0, 0.0)], [2**31 - 1, "abcdef", 1e-3, True, (-2.5, 3.25)]]:
+        data = Record(schema, values).pack()
+        assert data == struct.pack("i6sf?ff", values[0], values[1].encode(), values[2], values[3], *values[4])
+        assert Record.unpack(schema, data).values == values[:2] + [round(float(struct.unpack("f", struct.pack("f", values[2]))[0]), 6)] + values[3:]
+
+
+def test_codec_is_not_pickled():
+    schema = make_schema()
+    schema.get_codec()
+    restored = pickle.loads(pickle.dumps(schema))
+    assert "_codec" not in restored.__dict__
+    assert restored.get_codec().format == schema.get_codec().format
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_reads_build_no_loggers(tables_dir, monkeypatch, use_mmap):
+    schema = make_schema()
+    record_file = RecordFile(schema, use_mmap=use_mmap)
+    record_file.append_many([Record(schema, row(i)) for i in range(200)])
+    Record(schema, row(0)).debug()
+    built = []
+    monkeypatch.setattr(logger, "CustomLogger", lambda name: built.append(name))
+    assert [record_file.read(pos).values for pos in range(200)] == [row(i) for i in range(200)]
+    assert len({pos for pos, _ in record_file}) == 200
+    Record(schema, row(1)).debug()
+    assert built == []
@@ -0,0 +1,73 @@
+import itertools, random
+import numpy as np
+import pytest
+
+from engine.roaring import RoaringBitmap, ArrayContainer, BitmapContainer, RunContainer, CHUNK_SIZE
+
+SIZE = 3 * CHUNK_SIZE + 1000
+
+
+def position_sets() -> dict[str, set[int]]:
+    """Sets that land in every kind of container, and across chunks"""
+    random.seed(4)
+    return {
+        "empty": set(),
+        "sparse": set(random.sample(range(SIZE), 300)),
+        "dense": set(random.sample(range(CHUNK_SIZE, 2 * CHUNK_SIZE), 30000)),
+        "runs": set(range(100, 20000)) | set(range(CHUNK_SIZE - 50, 2 * CHUNK_SIZE + 70)) | set(range(SIZE - 900, SIZE)),
+        "mixed": set(random.sample(range(CHUNK_SIZE), 6000)) | set(range(2 * CHUNK_SIZE, 3 * CHUNK_SIZE)) | {SIZE - 1},
+    }
+
+
+SETS = position_sets()
+
+
+def bitmap(positions : set[int]) -> RoaringBitmap:
+    return RoaringBitmap.from_positions(sorted(positions), SIZE)
+
+
+def check(result : RoaringBitmap, expected : set[int]) -> None:
+    assert result.to_positions().tolist() == sorted(expected)
+    assert result.cardinality() == len(expected)
+    assert result.size == SIZE
+
+
+def test_picks_the_cheapest_container():
+    kinds = lambda name: {type(container) for container in bitmap(SETS[name]).containers.values()}
+    assert kinds("empty") == set()
+    assert kinds("sparse") == {ArrayContainer}
+    assert kinds("dense") == {BitmapContainer}
+    assert kinds("runs") == {RunContainer}
+    assert kinds("mixed") == {BitmapContainer, RunContainer, ArrayContainer}
+
+
+@pytest.mark.parametrize("name", SETS)
+def test_positions_round_trip(name):
+    positions, built = SETS[name], bitmap(SETS[name])
+    check(built, positions)
+    check(RoaringBitmap.from_bytes(built.to_bytes()), positions)
+    probes = random.sample(range(SIZE), 2000) + sorted(positions)[:50]
+    assert [pos in built for pos in probes] == [pos in positions for pos in probes]
+
+
+@pytest.mark.parametrize("a, b", list(itertools.product(SETS, repeat=2)))
+def test_operators_match_sets(a, b):
+    left, right = bitmap(SETS[a]), bitmap(SETS[b])
+    check(left & right, SETS[a] & SETS[b])
+    check(left | right, SETS[a] | SETS[b])
+    check(left - right, SETS[a] - SETS[b])
+
+
+@pytest.mark.parametrize("name", SETS)
+def test_invert_within_size(name):
+    inverted = ~bitmap(SETS[name])
+    check(inverted, set(range(SIZE)) - SETS[name])
+    check(~inverted, SETS[name])
+
+
+@pytest.mark.parametrize("size", [0, 1, CHUNK_SIZE, CHUNK_SIZE + 1, SIZE])
+def test_full(size):
+    full = RoaringBitmap.full(size)
+    assert full.size == size and full.cardinality() == size
+    assert np.array_equal(full.to_positions(), np.arange(size))
+    assert full.nbytes() <= 8 * (size // CHUNK_SIZE + 1)
@@ -0,0 +1,158 @@
+import random, mmap
+import numpy as np
+import pytest
+
+from engine.model import TableSchema, Column, DataType
+from engine.record import Record, RecordFile
+from engine.scan import HeapScan
+from engine import planner
+from parser.scanner import Scanner
+from parser.parser import Parser
+
+
+@pytest.fixture
+def heap(tables_dir):
+    """HeapScan over a table with every data type and a few deleted slots,
+    with the live records by position"""
+    random.seed(5)
+    schema = TableSchema("t", [
+        Column("id", DataType.INT, is_primary=True),
+        Column("name", DataType.VARCHAR, varchar_length=8),
+        Column("price", DataType.FLOAT),
+        Column("ok", DataType.BOOL),
+        Column("at", DataType.POINT),
+    ])
+    record_file = RecordFile(schema, use_mmap=True)
+    rows = [[i, f"n{random.randint(0, 30)}", round(random.uniform(-50, 50), 2), random.random() < 0.5, (float(i % 7), 1.5)] for i in range(700)]
+    positions = record_file.append_many([Record(schema, values) for values in rows])
+    # floats come back as the float32 the heap stores
+    live = {pos: values[:2] + [round(float(np.float32(values[2])), 6)] + values[3:] for pos, values in zip(positions, rows)}
+    for pos in random.sample(positions, 150):
+        record_file.delete(pos)
+        del live[pos]
+    return HeapScan(record_file), live
+
+
+def test_records_match_record_file(heap):
+    scan, live = heap
+    positions = sorted(live)
+    assert scan.live_positions().tolist() == positions
+    assert [record.values for record in scan.records(positions)] == [scan.record_file.read(pos).values for pos in positions]
+    assert [record.values for record in scan.records(positions)] == [live[pos] for pos in positions]
+    assert scan.live_at([positions[0], 10**6] + [pos for pos in range(700) if pos not in live][:5]).tolist() == [positions[0]]
+
+
+@pytest.mark.parametrize("field, key", [(0, 42), (1, "n7"), (2, None), (3, True), (4, (3.0, 1.5))])
+def test_search_matches_records(heap, field, key):
+    scan, live = heap
+    column = scan.schema.columns[field]
+    if key is None:
+        key = next(iter(live.values()))[field]
+    assert scan.search(column, key).tolist() == sorted(pos for pos, values in live.items() if values[field] == key)
+
+
+@pytest.mark.parametrize("field, lo, hi", [(0, 100, 300), (1, "n1", "n3"), (2, -10.5, 20.25), (2, None, 0.0), (0, 650, None)])
+def test_range_search_matches_records(heap, field, lo, hi):
+    scan, live = heap
+    column = scan.schema.columns[field]
+    expected = sorted(pos for pos, values in live.items() if (lo is None or values[field] >= lo) and (hi is None or values[field] <= hi))
+    assert scan.range_search(column, lo, hi).tolist() == expected
+    assert scan.range_search(column, lo, hi, 200, 400).tolist() == [pos for pos in expected if 200 <= pos < 400]
+
+
+def test_filter_in_batches(heap):
+    scan, live = heap
+    price = scan.comparison(scan.schema.columns[2], np.greater, 10.0)
+    found = [(pos, record.values) for positions, records in scan.filter(price, 64) for pos, record in zip(positions.tolist(), records)]
+    assert found == [(pos, live[pos]) for pos in sorted(live) if live[pos][2] > 10.0]
+
+
+def compiled(scan : HeapScan, sql : str):
+    stmt, = Parser(Scanner(f"SELECT * FROM t WHERE {sql};")).parse().stmt_list
+    assert planner.is_filterable(scan.schema, stmt.condition)
+    return planner.compile_condition(scan, scan.schema, stmt.condition)
+
+
+@pytest.mark.parametrize("sql, keep", [
+    ("id = 42", lambda id, name, price, ok: id == 42),
+    ("id != 42", lambda id, name, price, ok: id != 42),
+    ("id < 100", lambda id, name, price, ok: id < 100),
+    ("id >= 650", lambda id, name, price, ok: id >= 650),
+    ("name = 'n7'", lambda id, name, price, ok: name == "n7"),
+    ("name > 'n25'", lambda id, name, price, ok: name > "n25"),
+    ("name <= 'n1'", lambda id, name, price, ok: name <= "n1"),
+    ("name BETWEEN 'n1' AND 'n2'", lambda id, name, price, ok: "n1" <= name <= "n2"),
+    ("name = 'n7xxxxxx'", lambda id, name, price, ok: False),
+    ("price > 10.0", lambda id, name, price, ok: price > 10.0),
+    ("price <= -20.5", lambda id, name, price, ok: price <= -20.5),
+    ("price BETWEEN -1.25 AND 3.75", lambda id, name, price, ok: -1.25 <= price <= 3.75),
+    ("ok = TRUE", lambda id, name, price, ok: ok),
+    ("ok != TRUE AND id < 300", lambda id, name, price, ok: not ok and id < 300),
+    ("NOT price < 0.0 OR name = 'n3'", lambda id, name, price, ok: price >= 0 or name == "n3"),
+    ("(id < 200 OR id > 500) AND NOT ok = FALSE", lambda id, name, price, ok: (id < 200 or id > 500) and ok),
+])
+def test_compiled_condition_matches_rows(heap, sql, keep):
+    scan, live = heap
+    rows = scan.rows()
+    mask = scan.live(rows) & compiled(scan, sql)(rows)
+    assert np.flatnonzero(mask).tolist() == sorted(pos for pos, values in live.items() if keep(*values[:4]))
+
+
+def test_compiled_float_equality_matches_stored_value(heap):
+    scan, live = heap
+    # the literal is compared with the float32 the heap holds, rounded like reads are
+    for price in [values[2] for values in list(live.values())[:20]]:
+        rows = scan.rows()
+        mask = scan.live(rows) & compiled(scan, f"price = {price}")(rows)
+        assert np.flatnonzero(mask).tolist() == sorted(pos for pos, values in live.items() if values[2] == price)
+        assert mask.any()
+
+
+def test_fetch_sorts_and_drops_positions(heap):
+    scan, live = heap
+    random.seed(12)
+    positions = random.sample(range(700), 400) * 2 + [-1, -700, 700, 10**6]
+    random.shuffle(positions)
+    batches = list(scan.fetch(positions, 50))
+    found = [pos for batch, _ in batches for pos in batch.tolist()]
+    # each position once, in position order, only live slots inside the file
+    assert found == sorted(pos for pos in set(positions) if pos in live)
+    assert all(len(batch) <= 50 for batch, _ in batches)
+    assert [record.values for _, records in batches for record in records] == [live[pos] for pos in found]
+
+
+def test_fetch_applies_predicate(heap):
+    scan, live = heap
+    price = scan.comparison(scan.schema.columns[2], np.less, 0.0)
+    found = [(pos, record.values) for batch, records in scan.fetch(range(0, 700, 3), 32, price) for pos, record in zip(batch.tolist(), records)]
+    assert found == [(pos, live[pos]) for pos in range(0, 700, 3) if pos in live and live[pos][2] < 0.0]
+    assert list(scan.fetch([], 32)) == []
+
+
+def test_runs_merge_nearby_positions(heap):
+    scan, _ = heap
+    gap = max(1, mmap.PAGESIZE // scan.record_file.node_size)
+    assert scan.runs(np.array([], dtype=np.int64)) == []
+    assert scan.runs(np.array([5])) == [(5, 6)]
+    # positions up to a page apart share a run, farther ones start another
+    assert scan.runs(np.array([0, gap, 2 * gap, 3 * gap + 1, 3 * gap + 2])) == [(0, 2 * gap + 1), (3 * gap + 1, 3 * gap + 3)]
+    assert scan.runs(np.array([10, 10 + 5 * gap, 10 + 10 * gap])) == [(10, 11), (10 + 5 * gap, 11 + 5 * gap), (10 + 10 * gap, 11 + 10 * gap)]
+
+
+def test_prefetch_asks_for_every_run(heap, monkeypatch):
+    scan, _ = heap
+    if not hasattr(mmap, "MADV_WILLNEED"):
+        pytest.skip("no madvise on this platform")
+    requests = []
+    class Mapping:
+        def madvise(self, advice, start, length):
+            requests.append((advice, start, length))
+    monkeypatch.setattr(scan.record_file, "mapping", lambda: Mapping())
+    positions = np.array([3, 4, 200, 650])
+    scan.prefetch(positions)
+    runs = scan.runs(positions)
+    assert len(requests) == len(runs)
+    header, node_size = scan.record_file.HEADER_SIZE, scan.record_file.node_size
+    for (advice, start, length), (first, stop) in zip(requests, runs):
+        assert advice == mmap.MADV_WILLNEED and start % mmap.PAGESIZE == 0
+        assert start <= header + first * node_size and start + length == header + stop * node_size
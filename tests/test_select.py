@@ -0,0 +1,183 @@
+import random
+import pytest
+
+from parser.parser import execute_sql
+from engine import dbmanager, stats, planner
+from engine.roaring import RoaringBitmap
+from engine.model_condition import BinaryOp
+from indexes import noindex
+from indexes.noindex import NoIndex
+from indexes.brin import BRINIndex
+from indexes.bitmapindex import BitmapIndex
+
+
+def rows(sql : str) -> list:
+    result, message = execute_sql(sql)
+    assert result is not None, message
+    return result['records']
+
+
+@pytest.fixture
+def table(db):
+    """t, indexed on v, with deleted rows and plenty of repeated values"""
+    random.seed(9)
+    execute_sql("CREATE TABLE t (id INT PRIMARY KEY INDEX BTREE, v INT INDEX BTREE, w INT);")
+    values = [(i, random.randint(0, 400), random.randint(0, 50)) for i in range(3000)]
+    execute_sql("INSERT INTO t VALUES " + ", ".join(f"({i}, {v}, {w})" for i, v, w in values) + ";")
+    execute_sql("DELETE FROM t WHERE w = 7;")
+    return {i: [i, v, w] for i, v, w in values if w != 7}
+
+
+@pytest.mark.parametrize("asc", [True, False])
+@pytest.mark.parametrize("limit", [1, 10, 500])
+@pytest.mark.parametrize("condition, keep", [
+    ("", lambda id, v, w: True),
+    (" WHERE w < 25", lambda id, v, w: w < 25),
+    (" WHERE v BETWEEN 100 AND 200", lambda id, v, w: 100 <= v <= 200),
+    (" WHERE w = 3", lambda id, v, w: w == 3),
+])
+def test_order_by_limit_matches_sort(table, asc, limit, condition, keep):
+    found = rows(f"SELECT * FROM t{condition} ORDER BY v {'ASC' if asc else 'DESC'} LIMIT {limit};")
+    expected = sorted((v for id, v, w in table.values() if keep(id, v, w)), reverse=not asc)[:limit]
+    # rows tied on v may come in any order
+    assert [row[1] for row in found] == expected
+    assert all(table[row[0]] == row and keep(*row) for row in found)
+    assert len({row[0] for row in found}) == len(found)
+
+
+@pytest.mark.parametrize("condition, keep", [
+    ("v < 100 AND w > 10", lambda id, v, w: v < 100 and w > 10),
+    ("v = 12 OR w = 40", lambda id, v, w: v == 12 or w == 40),
+    ("NOT v BETWEEN 50 AND 350", lambda id, v, w: not 50 <= v <= 350),
+    ("NOT w = 3 AND id < 500", lambda id, v, w: w != 3 and id < 500),
+    ("(v > 390 OR w < 2) AND NOT id BETWEEN 1000 AND 2000", lambda id, v, w: (v > 390 or w < 2) and not 1000 <= id <= 2000),
+    ("w = 7", lambda id, v, w: False),
+    ("NOT w = 7", lambda id, v, w: True),
+    ("v > 1000 OR id < 0", lambda id, v, w: False),
+])
+def test_combined_conditions_match_filter(table, condition, keep):
+    found = rows(f"SELECT * FROM t WHERE {condition};")
+    assert sorted(found) == sorted(row for row in table.values() if keep(*row))
+
+
+def test_iter_ordered_both_ways(table, db):
+    index = db.get_index(db.get_table_schema("t"), "v")
+    record_file = db.get_record_file(db.get_table_schema("t"))
+    forward = [record_file.read(pos).values[1] for pos in index.iter_ordered()]
+    backward = [record_file.read(pos).values[1] for pos in index.iter_ordered(reverse=True)]
+    assert forward == sorted(row[1] for row in table.values())
+    assert backward == forward[::-1]
+
+
+def key(n : int) -> str:
+    return f"k{n:05d}"
+
+
+@pytest.fixture(params=["BTREE", "AVL", "HASH", "ISAM", "NONE", "BRIN", "BITMAP"])
+def ranged(db, request):
+    """r, with v indexed by each index type, and the same rows in plain"""
+    random.seed(11)
+    for name in ("r", "plain"):
+        execute_sql(f"CREATE TABLE {name} (id INT PRIMARY KEY INDEX BTREE, v VARCHAR(6));")
+    # distinct values, some index types keep a single position per key, and
+    # keys ISAM can spread over its pages
+    values = [key(n) for n in random.sample(range(5000), 1500)]
+    for name in ("r", "plain"):
+        execute_sql(f"INSERT INTO {name} VALUES " + ", ".join(f"({i}, '{v}')" for i, v in enumerate(values)) + ";")
+    if request.param != "NONE":
+        # built over the loaded rows, ISAM can't start out empty
+        execute_sql(f"CREATE INDEX iv ON r USING {request.param} (v);")
+    return db.get_index(db.get_table_schema("r"), "v"), dict(enumerate(values))
+
+
+@pytest.mark.parametrize("lo, hi", [(1000, 1400), (None, 300), (4700, None), (None, None), (2500, 2500), (6000, 7000)])
+def test_iter_range_matches_scan(ranged, lo, hi):
+    index, values = ranged
+    lo, hi = (None if n is None else key(n) for n in (lo, hi))
+    # positions are the insert order, so ids
+    expected = sorted(i for i, v in values.items() if (lo is None or v >= lo) and (hi is None or v <= hi))
+    assert sorted(index.iter_range(lo, hi)) == expected
+    condition = " AND ".join([f"v >= '{lo}'"] * (lo is not None) + [f"v <= '{hi}'"] * (hi is not None)) or "id >= 0"
+    assert sorted(map(tuple, rows(f"SELECT * FROM r WHERE {condition};"))) == sorted(map(tuple, rows(f"SELECT * FROM plain WHERE {condition};")))
+
+
+def walk_work(index, monkeypatch):
+    """Function returning the work done by index since the last call: pages
+    read for the tree and hash indexes, heap slots scanned for NONE and
+    BRIN, bitmaps read for BITMAP"""
+    work = [0]
+    if isinstance(index, (NoIndex, BRINIndex)):
+        range_search = index.scan.range_search
+        def counted(column, ini = None, end = None, start = 0, stop = None):
+            work[0] += (index.scan.record_file.max_id() if stop is None else stop) - start
+            return range_search(column, ini, end, start, stop)
+        monkeypatch.setattr(index.scan, "range_search", counted)
+    elif isinstance(index, BitmapIndex):
+        class Counted(dict):
+            def get(self, key, default = None):
+                work[0] += 1
+                return super().get(key, default)
+            def __getitem__(self, key):
+                work[0] += 1
+                return super().__getitem__(key)
+        monkeypatch.setattr(index, "bitmaps", Counted(index.bitmaps))
+    def since():
+        done = work[0] + stats.get_counts()["reads"]
+        work[0] = 0
+        stats.reset_counters()
+        return done
+    since()
+    return since
+
+
+def test_range_limit_stops_the_index_walk(ranged, monkeypatch):
+    index, values = ranged
+    monkeypatch.setattr(noindex, "RANGE_BATCH_SLOTS", 64)
+    work = walk_work(index, monkeypatch)
+    lo, hi = key(500), key(4500)
+    assert len(list(index.iter_range(lo, hi))) == len([v for v in values.values() if lo <= v <= hi])
+    full = work()
+    found = rows(f"SELECT * FROM r WHERE v BETWEEN '{lo}' AND '{hi}' LIMIT 5;")
+    assert len(found) == 5 and all(lo <= v <= hi and values[id] == v for id, v in found)
+    assert 0 < work() < full / 4
+
+
+def test_ordered_fetch_keeps_the_given_order(table, db, monkeypatch):
+    monkeypatch.setattr(dbmanager, "SCAN_BATCH_SIZE", 100)
+    schema = db.get_table_schema("t")
+    record_file = db.get_record_file(schema)
+    live = {pos for pos, _ in record_file}
+    random.seed(13)
+    order = random.sample(range(record_file.max_id()), 2000)
+    consumed = []
+    def positions():
+        for pos in order:
+            consumed.append(pos)
+            yield pos
+    found = [record.values for record in db.iter_ordered_data(schema, None, positions())]
+    # deleted slots are skipped, the rest keep the order of the positions
+    assert found == [record_file.read(pos).values for pos in order if pos in live]
+    # the positions are taken in chunks doubling up to the batch size
+    consumed.clear()
+    found = list(db.iter_ordered_data(schema, None, positions(), limit=5))
+    assert len(found) == 5 and len(consumed) == dbmanager.FETCH_FIRST_CHUNK
+    for limit in (40, 150, 600):
+        consumed.clear()
+        assert len(list(db.iter_ordered_data(schema, None, positions(), limit=limit))) == limit
+        taken, size = 0, dbmanager.FETCH_FIRST_CHUNK
+        while len([pos for pos in order[:taken] if pos in live]) < limit:
+            taken, size = taken + size, min(2 * size, dbmanager.SCAN_BATCH_SIZE)
+        assert len(consumed) == taken
+
+
+def test_ordered_fetch_filters(table, db):
+    schema = db.get_table_schema("t")
+    record_file = db.get_record_file(schema)
+    order = list(range(record_file.max_id() - 1, -1, -1))
+    bitmap = RoaringBitmap.from_positions(order[::3], record_file.max_id())
+    w = schema.get_column_by_name("w")
+    below = planner.COMPARISONS[BinaryOp.LT]
+    predicate = db.get_heap_scan(schema).comparison(w, below, 20)
+    found = [record.values for record in db.iter_ordered_data(schema, bitmap, order, 40, predicate)]
+    expected = [record_file.read(pos).values for pos in order[::3] if record_file.read(pos) is not None]
+    assert found == [values for values in expected if values[2] < 20][:40]
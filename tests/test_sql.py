@@ -0,0 +1,115 @@
+import pytest
+
+from parser.scanner import Scanner
+from parser.parser import Parser, ParseError, InsertStmt, VacuumIndexStmt, AnalyzeStmt, CreateIndexStmt, execute_sql
+
+
+def parse(sql : str) -> list:
+    return Parser(Scanner(sql)).parse().stmt_list
+
+
+def select(sql : str) -> list:
+    result, message = execute_sql(sql)
+    assert result is not None, message
+    return sorted(map(tuple, result['records']))
+
+
+def assert_index_matches_table(db, table_name : str, column_name : str) -> None:
+    """The B+Tree on column holds exactly the (value, pos) pairs of the live records"""
+    schema = db.get_table_schema(table_name)
+    field = [column.name for column in schema.columns].index(column_name)
+    expected = sorted((record.values[field], pos) for pos, record in db.get_record_file(schema))
+    assert sorted(db.get_index(schema, column_name).entries()) == expected
+
+
+def test_parse_multi_row_insert():
+    stmt, = parse("INSERT INTO t (b, a) VALUES (1, 'x'), (2, 'y'), (3, 'z');")
+    assert isinstance(stmt, InsertStmt)
+    assert stmt.column_list == ["b", "a"]
+    assert stmt.value_lists == [[1, "x"], [2, "y"], [3, "z"]]
+    with pytest.raises(ParseError):
+        parse("INSERT INTO t VALUES (1, 'x'),;")
+
+
+def test_multi_row_insert_maintains_indexes(db):
+    execute_sql("CREATE TABLE t (id INT PRIMARY KEY INDEX BTREE, a INT INDEX AVL, b INT INDEX HASH, c VARCHAR(4) INDEX BTREE);")
+    execute_sql("CREATE TABLE plain (id INT PRIMARY KEY INDEX BTREE, a INT, b INT, c VARCHAR(4));")
+    for table in ("t", "plain"):
+        execute_sql(f"INSERT INTO {table} VALUES " + ", ".join(f"({i}, {i % 13}, {1000 - i}, 'c{i % 5}')" for i in range(300)) + ";")
+        execute_sql(f"INSERT INTO {table} (c, b, a, id) VALUES ('c9', 5000, 99, 300), ('c8', 5001, 98, 301);")
+    for condition in ["id BETWEEN 40 AND 60", "a = 99", "b = 900", "b = 5001", "c = 'c3'", "c = 'c9'"]:
+        assert select(f"SELECT * FROM t WHERE {condition};") == select(f"SELECT * FROM plain WHERE {condition};"), condition
+    assert len(select("SELECT * FROM t;")) == 302
+
+
+def test_multi_row_insert_is_all_or_nothing(db):
+    execute_sql("CREATE TABLE t (id INT PRIMARY KEY INDEX BTREE, c VARCHAR(2));")
+    with pytest.raises(RuntimeError):
+        execute_sql("INSERT INTO t VALUES (1, 'a'), (2, 'too long');")
+    with pytest.raises(RuntimeError):
+        execute_sql("INSERT INTO t VALUES (1, 'a'), (2);")
+    assert select("SELECT * FROM t;") == []
+
+
+def test_parse_vacuum_index():
+    stmt, = parse("VACUUM INDEX iv ON t;")
+    assert isinstance(stmt, VacuumIndexStmt)
+    assert (stmt.index_name, stmt.table_name) == ("iv", "t")
+    with pytest.raises(ParseError):
+        parse("VACUUM iv ON t;")
+
+
+def test_delete_and_vacuum_btree_index(db):
+    execute_sql("CREATE TABLE t (id INT PRIMARY KEY INDEX BTREE, v INT);")
+    execute_sql("CREATE TABLE plain (id INT PRIMARY KEY INDEX BTREE, v INT);")
+    for table in ("t", "plain"):
+        execute_sql(f"INSERT INTO {table} VALUES " + ", ".join(f"({i}, {i % 17})" for i in range(1500)) + ";")
+    execute_sql("CREATE INDEX iv ON t USING BTREE (v);")
+    conditions = ["v = 4", "v BETWEEN 3 AND 9", "v > 14", "id < 100"]
+    for delete in ["v = 4", "v BETWEEN 6 AND 8", "id >= 1000", "v > 15"]:
+        for table in ("t", "plain"):
+            execute_sql(f"DELETE FROM {table} WHERE {delete};")
+        for condition in conditions:
+            assert select(f"SELECT * FROM t WHERE {condition};") == select(f"SELECT * FROM plain WHERE {condition};")
+        assert_index_matches_table(db, "t", "v")
+    execute_sql("VACUUM INDEX iv ON t;")
+    assert_index_matches_table(db, "t", "v")
+    for condition in conditions:
+        assert select(f"SELECT * FROM t WHERE {condition};") == select(f"SELECT * FROM plain WHERE {condition};")
+    with pytest.raises(RuntimeError):
+        execute_sql("VACUUM INDEX nope ON t;")
+
+
+def test_parse_analyze():
+    stmt, = parse("ANALYZE t;")
+    assert isinstance(stmt, AnalyzeStmt)
+    assert stmt.table_name == "t"
+    with pytest.raises(ParseError):
+        parse("ANALYZE;")
+
+
+def test_analyze_rebuilds_statistics(db):
+    execute_sql("CREATE TABLE t (id INT PRIMARY KEY INDEX BTREE, v INT);")
+    execute_sql("INSERT INTO t VALUES " + ", ".join(f"({i}, {i % 10})" for i in range(500)) + ";")
+    statistics = db.get_statistics(db.get_table_schema("t"))
+    # the table was empty when its statistics were first computed
+    assert not statistics.column("v").histogram
+    result, message = execute_sql("ANALYZE t;")
+    assert result is None and message == "Table analyzed successfully"
+    statistics = db.get_statistics(db.get_table_schema("t"))
+    assert statistics.analyzed and statistics.live == 500
+    assert statistics.column("v").histogram[0] == 0 and statistics.column("v").histogram[-1] == 9
+    assert statistics.column("v").ndv() == 10
+    with pytest.raises(RuntimeError):
+        execute_sql("ANALYZE missing;")
+
+
+def test_parse_create_index_include():
+    stmt, = parse("CREATE INDEX cv_tc ON cv USING BTREE (tenant, created) INCLUDE (amt, ok);")
+    assert isinstance(stmt, CreateIndexStmt)
+    assert (stmt.column_list, stmt.include_list) == (["tenant", "created"], ["amt", "ok"])
+    stmt, = parse("CREATE INDEX cv_t ON cv (tenant);")
+    assert stmt.include_list == []
+    for sql in ["CREATE INDEX i ON cv (a) INCLUDE b;", "CREATE INDEX i ON cv (a) INCLUDE ();", "CREATE INDEX i ON cv (a) INCLUDE (b,);"]:
+        with pytest.raises(ParseError):
+            parse(sql)
@@ -0,0 +1,107 @@
+import random
+import numpy as np
+import pytest
+
+from parser.parser import execute_sql
+from engine.statistics import HyperLogLog, TableStatistics, hash_values, HISTOGRAM_BUCKETS
+from indexes import ISAMtree
+
+
+@pytest.mark.parametrize("n", [10, 1000, 20000, 300000])
+def test_hll_count_within_bounds(n):
+    values = np.random.default_rng(n).choice(2**31 - 1, n, replace=False).astype(np.int32)
+    sketch = HyperLogLog()
+    sketch.add_hashes(hash_values(values))
+    # standard error is 1.04 / sqrt(2^12), about 1.6%
+    assert abs(sketch.count() - n) <= max(1, 0.05 * n)
+    # repeated values aren't counted again
+    sketch.add_hashes(hash_values(values[: n // 2]))
+    assert abs(sketch.count() - n) <= max(1, 0.05 * n)
+
+
+def test_hll_counts_strings():
+    values = np.array([f"s{i}".encode() for i in range(5000)] * 3, dtype="S8")
+    sketch = HyperLogLog()
+    sketch.add_hashes(hash_values(values))
+    assert abs(sketch.count() - 5000) <= 250
+
+
+@pytest.fixture
+def skewed(db):
+    """t with a skewed v, an id key and a VARCHAR, analyzed, and the values of v"""
+    random.seed(2)
+    values = [int(random.expovariate(1 / 50)) for _ in range(5000)]
+    execute_sql("CREATE TABLE t (id INT PRIMARY KEY INDEX BTREE, v INT, f FLOAT, s VARCHAR(6));")
+    execute_sql("INSERT INTO t VALUES " + ", ".join(f"({i}, {v}, {v / 4}, 's{v % 300}')" for i, v in enumerate(values)) + ";")
+    execute_sql("ANALYZE t;")
+    return db.get_statistics(db.get_table_schema("t")), values
+
+
+def test_histogram_follows_distribution(skewed):
+    statistics, values = skewed
+    column = statistics.column("v")
+    assert len(column.histogram) == HISTOGRAM_BUCKETS + 1
+    assert (column.min, column.max) == (min(values), max(values))
+    for x in [0, 5, 20, 50, 120, 300, max(values)]:
+        actual = sum(v <= x for v in values) / len(values)
+        assert column.fraction_le(x) == pytest.approx(actual, abs=1.5 / HISTOGRAM_BUCKETS), x
+    assert column.fraction_le(-1) == 0.0 and column.fraction_le(10**6) == 1.0
+    floats = statistics.column("f")
+    assert floats.fraction_le(12.5) == pytest.approx(sum(v / 4 <= 12.5 for v in values) / len(values), abs=1.5 / HISTOGRAM_BUCKETS)
+    strings = statistics.column("s")
+    assert 0.0 < strings.fraction_le("s150") < 1.0
+
+
+def test_ndv_of_columns(skewed):
+    statistics, values = skewed
+    assert statistics.column("id").ndv() == pytest.approx(len(values), rel=0.05)
+    assert statistics.column("v").ndv() == pytest.approx(len(set(values)), rel=0.05)
+    assert statistics.column("s").ndv() == pytest.approx(len({v % 300 for v in values}), rel=0.05)
+
+
+def test_counts_follow_inserts_and_deletes(skewed, db):
+    statistics, values = skewed
+    assert (statistics.slots, statistics.live, statistics.deleted) == (5000, 5000, 0)
+    histogram = list(statistics.column("v").histogram)
+    execute_sql("DELETE FROM t WHERE id < 300;")
+    assert (statistics.slots, statistics.live, statistics.deleted) == (5000, 4700, 300)
+    # the deleted slots are reused first
+    execute_sql("INSERT INTO t VALUES " + ", ".join(f"({i}, {10**6 + i}, 0.5, 'new')" for i in range(5000, 5500)) + ";")
+    assert (statistics.slots, statistics.live, statistics.deleted) == (5200, 5200, 0)
+    assert statistics.column("v").max == 10**6 + 5499
+    assert statistics.column("v").ndv() == pytest.approx(len(set(values)) + 500, rel=0.05)
+    # the histogram waits for the next ANALYZE
+    assert statistics.column("v").histogram == histogram
+    saved = TableStatistics.load("t")
+    assert (saved.slots, saved.live, saved.deleted) == (5200, 5200, 0)
+    execute_sql("ANALYZE t;")
+    analyzed = db.get_statistics(db.get_table_schema("t"))
+    assert (analyzed.slots, analyzed.live, analyzed.deleted) == (5200, 5200, 0)
+    assert analyzed.column("v").histogram[-1] == 10**6 + 5499
+
+
+def test_isam_sizes_itself_from_statistics(db, monkeypatch):
+    execute_sql("CREATE TABLE t (id INT PRIMARY KEY INDEX BTREE, v VARCHAR(6));")
+    execute_sql("INSERT INTO t VALUES " + ", ".join(f"({i}, 'k{i * 7 % 3000:05d}')" for i in range(3000)) + ";")
+    execute_sql("DELETE FROM t WHERE id >= 2000;")
+    assert db.get_statistics(db.get_table_schema("t")).live == 2000
+    execute_sql("CREATE INDEX iv ON t USING ISAM (v);")
+    index = db.get_index(db.get_table_schema("t"), "v")
+    assert sorted(index.search("k00014")) == [2]
+    factors = (index.file.leaf_factor, index.file.index_factor)
+    # the live count comes from the statistics, not from a scan of the heap
+    counted = ISAMtree.count_records_in_rf
+    monkeypatch.setattr(ISAMtree, "count_records_in_rf", lambda rf: pytest.fail("heap scanned"))
+    index._calculate_factors(fill_factor=0.5)
+    assert (index.file.leaf_factor, index.file.index_factor) == factors
+    # and gives the same factors as counting the live records
+    monkeypatch.setattr(ISAMtree, "count_records_in_rf", counted)
+    monkeypatch.setattr(ISAMtree.TableStatistics, "load", staticmethod(lambda name: None))
+    index._calculate_factors(fill_factor=0.5)
+    assert (index.file.leaf_factor, index.file.index_factor) == factors
+    # a table four times larger needs other factors
+    bigger = TableStatistics(db.get_table_schema("t"))
+    bigger.live = 8000
+    monkeypatch.setattr(ISAMtree.TableStatistics, "load", staticmethod(lambda name: bigger))
+    index._calculate_factors(fill_factor=0.5)
+    assert (index.file.leaf_factor, index.file.index_factor) != factors
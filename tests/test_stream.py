@@ -0,0 +1,69 @@
+import asyncio, json
+import pytest
+
+from parser.parser import execute_sql
+
+
+QUERIES = [
+    "SELECT * FROM t;",
+    "SELECT id FROM t WHERE v = 3;",
+    "SELECT * FROM t WHERE id BETWEEN 100 AND 900 AND v < 4;",
+    "SELECT * FROM t WHERE v >= 5 LIMIT 30;",
+    "SELECT v, id FROM t ORDER BY v DESC LIMIT 50;",
+    "SELECT * FROM t WHERE id > 1190;",
+]
+
+
+@pytest.fixture
+def table(db):
+    execute_sql("CREATE TABLE t (id INT PRIMARY KEY INDEX BTREE, v INT INDEX BTREE);")
+    execute_sql("INSERT INTO t VALUES " + ", ".join(f"({i}, {i * 5 % 7})" for i in range(1200)) + ";")
+    execute_sql("DELETE FROM t WHERE id BETWEEN 300 AND 340;")
+
+
+@pytest.mark.parametrize("sql", QUERIES)
+def test_streamed_rows_match_select(table, sql):
+    result, _ = execute_sql(sql)
+    streamed, _ = execute_sql(sql, stream=True)
+    assert streamed['columns'] == result['columns']
+    rows = list(streamed['records'])
+    assert sorted(rows) == sorted(result['records']) or "ORDER BY" in sql
+    if "ORDER BY" in sql:
+        # rows tied on v may come in any order
+        table = {(v, id) for id, v in execute_sql("SELECT * FROM t;")[0]['records']}
+        assert [row[0] for row in rows] == [row[0] for row in result['records']]
+        assert all(tuple(row) in table for row in rows)
+
+
+def read_lines(response) -> list:
+    async def body():
+        return [chunk if isinstance(chunk, str) else chunk.decode() async for chunk in response.body_iterator]
+    return [json.loads(line) for line in "".join(asyncio.run(body())).splitlines()]
+
+
+@pytest.mark.parametrize("sql", QUERIES)
+def test_ndjson_endpoint(table, sql, monkeypatch):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("sqlalchemy")
+    from backend.routers import queries
+    from backend.schemas import StreamQueryRequest
+    monkeypatch.setattr(queries, "STREAM_BATCH_SIZE", 7)
+    response = queries.stream_query(StreamQueryRequest(query=sql), current_user=None, db=None)
+    assert response.media_type == "application/x-ndjson"
+    lines = read_lines(response)
+    result, _ = execute_sql(sql)
+    assert lines[0] == {'columns': result['columns']}
+    assert lines[-1]['total'] == len(lines) - 2 == len(result['records'])
+    if "ORDER BY" not in sql:
+        assert sorted(lines[1:-1]) == sorted(result['records'])
+
+
+def test_ndjson_endpoint_reports_errors(table):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("sqlalchemy")
+    from backend.routers import queries
+    from backend.schemas import StreamQueryRequest
+    response = queries.stream_query(StreamQueryRequest(query="SELECT * FROM missing;"), current_user=None, db=None)
+    lines = read_lines(response)
+    assert lines[0] == {'columns': []}
+    assert lines[1]['total'] == 0 and lines[1]['message']